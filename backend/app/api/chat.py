@@ -3,15 +3,24 @@ AI Agent Floating Ball - Chat API
 聊天功能API路由
 """
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Optional, Dict, Any, AsyncIterator
+import asyncio
 import json
 import time
+import uuid
 from pathlib import Path
 
 from ..core.config import get_config
 from ..core.ai_clients import get_ai_client
+from ..core.response_cache import get_response_cache
+from ..core.token_budget import fit_messages, get_model_spec
+from ..core.agent_bus import DEFAULT_HOST, DEFAULT_PORT, MAX_LINE_BYTES
+
+# 等待智能体最终回复的超时（秒），略长于智能体自身的120秒超时
+AGENT_REPLY_TIMEOUT = 130.0
 
 
 router = APIRouter()
@@ -35,43 +44,131 @@ class ChatResponse(BaseModel):
     message: ChatMessage
     usage: Optional[Dict[str, Any]] = None
     model: str
+    cached: bool = False
+
+
+class AgentChatRequest(BaseModel):
+    content: str
+    session_id: Optional[str] = None
+    screenshot_filename: Optional[str] = None
+
+
+class AgentChatResponse(BaseModel):
+    request_id: str
+    session_id: str
+    content: str
+
+
+def build_chat_params(request: ChatRequest) -> Dict[str, Any]:
+    """将ChatRequest转换为AI客户端调用参数（历史消息按上下文窗口裁剪）"""
+    config = get_config()
+    max_tokens = request.max_tokens or config.ai.moonshot.max_tokens
+
+    # 转换消息格式
+    messages = []
+    for msg in request.messages:
+        messages.append({
+            "role": msg.role,
+            "content": msg.content
+        })
+
+    # 按路由中上下文窗口最小的模型裁剪，保证故障转移到其他提供商时同样放得下
+    fit_model = min(
+        (config.ai.moonshot.model, config.ai.dashscope.chat_model),
+        key=lambda model: get_model_spec(model).context_window
+    )
+    messages, dropped = fit_messages(messages, fit_model, max_tokens=max_tokens)
+    if dropped:
+        print(f"聊天上下文超出{fit_model}窗口，已裁剪{dropped}条较早的消息")
+
+    return {
+        "messages": messages,
+        "model": request.model or config.ai.moonshot.model,
+        # 温度为0是合法值（确定性请求），不能用 or 回退
+        "temperature": request.temperature if request.temperature is not None else config.ai.moonshot.temperature,
+        "max_tokens": max_tokens
+    }
+
+
+async def stream_chat_events(request: ChatRequest) -> AsyncIterator[Dict[str, Any]]:
+    """
+    流式聊天事件
+
+    依次产出 delta 事件和最终的 done 事件（包含usage），结束后保存聊天记录；
+    出错时产出 error 事件。
+    """
+    ai_client = get_ai_client()
+    params = build_chat_params(request)
+
+    try:
+        async for event in ai_client.chat_completion_stream(**params, route="/api/chat/stream"):
+            if event["type"] == "done":
+                chat_response = ChatResponse(
+                    message=ChatMessage(
+                        role="assistant",
+                        content=event.get("content", ""),
+                        timestamp=time.time()
+                    ),
+                    usage=event.get("usage"),
+                    model=event.get("model", params["model"])
+                )
+                yield {
+                    "type": "done",
+                    "model": chat_response.model,
+                    "usage": chat_response.usage
+                }
+                await save_chat_history(request.messages, chat_response)
+            else:
+                yield event
+
+    except Exception as e:
+        yield {"type": "error", "detail": f"聊天请求失败: {str(e)}"}
+
+
+async def sse_chat_stream(request: ChatRequest) -> AsyncIterator[str]:
+    """将流式聊天事件编码为Server-Sent Events"""
+    async for event in stream_chat_events(request):
+        yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+
+def create_sse_response(request: ChatRequest) -> StreamingResponse:
+    """创建SSE流式响应"""
+    return StreamingResponse(
+        sse_chat_stream(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @router.post("/send", response_model=ChatResponse)
-async def send_chat_message(request: ChatRequest, background_tasks: BackgroundTasks):
+async def send_chat_message(
+    request: ChatRequest,
+    background_tasks: BackgroundTasks,
+    x_cache_bypass: Optional[str] = Header(None)
+):
     """
     发送聊天消息
 
     - **messages**: 消息列表
     - **model**: 使用的模型 (可选，默认使用Moonshot)
-    - **temperature**: 温度参数 (可选)
+    - **temperature**: 温度参数 (可选，为0时默认使用响应缓存)
     - **max_tokens**: 最大token数 (可选)
-    - **stream**: 是否流式输出 (可选)
+    - **stream**: 是否流式输出 (可选，为true时以SSE返回，同 /stream)
+    - **X-Cache-Bypass** 请求头: 设置为 1/true 时绕过响应缓存
     """
+    if request.stream:
+        return create_sse_response(request)
+
     try:
-        config = get_config()
         ai_client = get_ai_client()
-
-        # 转换消息格式
-        messages = []
-        for msg in request.messages:
-            messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-
-        # 设置参数
-        model = request.model or config.ai.moonshot.model
-        temperature = request.temperature or config.ai.moonshot.temperature
-        max_tokens = request.max_tokens or config.ai.moonshot.max_tokens
+        params = build_chat_params(request)
 
         # 调用AI客户端
+        bypass_cache = (x_cache_bypass or "").lower() in ("1", "true", "yes")
         response = await ai_client.chat_completion(
-            messages=messages,
-            model=model,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            stream=request.stream
+            **params,
+            cache=False if bypass_cache else None,
+            route="/api/chat/send"
         )
 
         # 构造响应
@@ -82,7 +179,8 @@ async def send_chat_message(request: ChatRequest, background_tasks: BackgroundTa
                 timestamp=time.time()
             ),
             usage=response.get("usage"),
-            model=response.get("model", model)
+            model=response.get("model", params["model"]),
+            cached=response.get("cached", False)
         )
 
         # 后台保存聊天记录
@@ -94,6 +192,157 @@ async def send_chat_message(request: ChatRequest, background_tasks: BackgroundTa
         raise HTTPException(status_code=500, detail=f"聊天请求失败: {str(e)}")
 
 
+@router.post("/stream")
+async def stream_chat_message(request: ChatRequest):
+    """
+    流式发送聊天消息（Server-Sent Events）
+
+    事件类型：
+    - **delta**: 增量内容 {"type": "delta", "content": "..."}
+    - **done**: 结束 {"type": "done", "model": "...", "usage": {...}}
+    - **error**: 错误 {"type": "error", "detail": "..."}
+    """
+    return create_sse_response(request)
+
+
+@router.websocket("/stream/ws")
+async def stream_chat_websocket(websocket: WebSocket):
+    """
+    流式聊天（WebSocket）
+
+    客户端每次发送一个ChatRequest JSON，服务端逐条返回与 /stream 相同格式的事件，
+    以 done 或 error 事件结束本轮；连接可复用于多轮对话。
+    """
+    await websocket.accept()
+
+    try:
+        while True:
+            data = await websocket.receive_json()
+            try:
+                request = ChatRequest(**data)
+            except ValidationError as e:
+                await websocket.send_json({"type": "error", "detail": f"请求格式错误: {str(e)}"})
+                continue
+
+            async for event in stream_chat_events(request):
+                await websocket.send_json(event)
+
+    except WebSocketDisconnect:
+        pass
+
+
+async def open_agent_connection():
+    """连接智能体进程的消息通道"""
+    try:
+        return await asyncio.open_connection(DEFAULT_HOST, DEFAULT_PORT, limit=MAX_LINE_BYTES)
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=f"智能体未运行: {str(e)}")
+
+
+async def close_agent_connection(writer: asyncio.StreamWriter):
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+
+
+async def send_agent_message(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+    writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    await writer.drain()
+
+
+@router.post("/agent", response_model=AgentChatResponse)
+async def send_agent_message_http(request: AgentChatRequest):
+    """
+    向智能体提交一条请求并等待最终回复
+
+    同一session_id的请求共享对话记忆并按顺序处理，不同会话并发处理；省略时每次请求使用新的会话
+    """
+    session_id = request.session_id or f"http-{uuid.uuid4().hex[:8]}"
+    request_id = uuid.uuid4().hex
+    reader, writer = await open_agent_connection()
+    try:
+        await send_agent_message(writer, {
+            "type": "request",
+            "request_id": request_id,
+            "session_id": session_id,
+            "content": request.content,
+            "screenshot_filename": request.screenshot_filename
+        })
+
+        async def wait_final() -> str:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise HTTPException(status_code=502, detail="智能体连接已断开")
+                message = json.loads(line)
+                if message.get("type") == "final" and message.get("request_id") == request_id:
+                    return message.get("content", "")
+
+        try:
+            content = await asyncio.wait_for(wait_final(), timeout=AGENT_REPLY_TIMEOUT)
+        except asyncio.TimeoutError:
+            await send_agent_message(writer, {"type": "cancel", "request_id": request_id})
+            raise HTTPException(status_code=504, detail="智能体响应超时")
+    finally:
+        await close_agent_connection(writer)
+
+    return AgentChatResponse(request_id=request_id, session_id=session_id, content=content)
+
+
+@router.websocket("/agent/ws")
+async def agent_websocket(websocket: WebSocket):
+    """
+    智能体对话（WebSocket）
+
+    转发到智能体进程的消息通道，消息格式与悬浮球相同：
+    - 客户端发送 {"type": "request", "content": "...", "session_id": "..."} 或 {"type": "cancel", "request_id": "..."}
+    - 服务端返回本连接请求的 ack / partial / final 消息，以及 input_state 消息
+    session_id省略时整个连接使用同一个会话
+    """
+    await websocket.accept()
+    try:
+        reader, writer = await open_agent_connection()
+    except HTTPException as e:
+        await websocket.send_json({"type": "error", "detail": e.detail})
+        await websocket.close()
+        return
+
+    session_id = f"ws-{uuid.uuid4().hex[:8]}"
+    # 本连接使用过的全部会话，断开时一并取消
+    session_ids = {session_id}
+
+    async def forward_replies():
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            await websocket.send_text(line.decode("utf-8").strip())
+
+    forward_task = asyncio.create_task(forward_replies())
+    try:
+        while True:
+            data = await websocket.receive_json()
+            if not isinstance(data, dict):
+                continue
+            if data.get("type", "request") == "request":
+                data.setdefault("request_id", uuid.uuid4().hex)
+                data["session_id"] = str(data.get("session_id") or session_id)
+                session_ids.add(data["session_id"])
+            await send_agent_message(writer, data)
+    except WebSocketDisconnect:
+        # 客户端离开后不再需要本连接各会话的回复
+        try:
+            for sid in session_ids:
+                await send_agent_message(writer, {"type": "cancel", "session_id": sid})
+        except OSError:
+            pass
+    finally:
+        forward_task.cancel()
+        await close_agent_connection(writer)
+
+
 @router.get("/models")
 async def get_available_models():
     """获取可用的AI模型列表"""
@@ -115,6 +364,19 @@ async def get_available_models():
     return {"models": models}
 
 
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """获取LLM响应缓存的命中统计"""
+    return get_response_cache().stats()
+
+
+@router.delete("/cache")
+async def clear_cache():
+    """清空LLM响应缓存"""
+    get_response_cache().clear()
+    return {"message": "响应缓存已清空"}
+
+
 @router.get("/history")
 async def get_chat_history(limit: int = 50, offset: int = 0):
     """获取聊天历史记录"""
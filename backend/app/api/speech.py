@@ -11,6 +11,8 @@ import io
 import os
 
 from ..core.config import get_config
+from ..core.rate_limit import get_rate_limiter, estimate_tokens
+from ..core.usage_ledger import track_usage
 
 
 router = APIRouter()
@@ -94,13 +96,16 @@ async def text_to_speech(request: TTSRequest):
 
         # 调用DashScope TTS API
         print(f"调用DashScope TTS API: text='{request.text}', voice='{voice}'")
-        response = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
-            model="qwen-tts",
-            api_key=api_key,
-            text=request.text,
-            voice=voice,
-            stream=False  # 非流式，返回完整音频
-        )
+        async with get_rate_limiter("dashscope").aslot(estimate_tokens(request.text)):
+            with track_usage("tts", "dashscope", "qwen-tts") as usage:
+                response = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                    model="qwen-tts",
+                    api_key=api_key,
+                    text=request.text,
+                    voice=voice,
+                    stream=False  # 非流式，返回完整音频
+                )
+                usage.add_usage(getattr(response, "usage", None))
 
         # 调试：打印完整的API响应
         print(f"DashScope API响应类型: {type(response)}")
@@ -176,6 +181,17 @@ async def text_to_speech(request: TTSRequest):
         )
 
 
+def wav_duration(audio_data: bytes) -> Optional[float]:
+    """读取WAV音频时长（秒），非WAV格式返回None"""
+    import wave
+
+    try:
+        with wave.open(io.BytesIO(audio_data), "rb") as wav_file:
+            return wav_file.getnframes() / float(wav_file.getframerate())
+    except (wave.Error, EOFError):
+        return None
+
+
 @router.post("/asr", response_model=ASRResponse)
 async def speech_to_text(request: ASRRequest):
     """
@@ -213,7 +229,8 @@ async def speech_to_text(request: ASRRequest):
 
             # 在线程池中运行ASR
             loop = asyncio.get_event_loop()
-            with ThreadPoolExecutor() as executor:
+            with track_usage("asr", "local", "whisper-large-v3") as usage, ThreadPoolExecutor() as executor:
+                usage.add_audio(wav_duration(audio_data))
                 result = await loop.run_in_executor(executor, asr_sync)
 
             if result:
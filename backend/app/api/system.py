@@ -180,6 +180,30 @@ async def get_system_performance():
         raise HTTPException(status_code=500, detail=f"获取性能指标失败: {str(e)}")
 
 
+@router.get("/ai-metrics")
+async def get_ai_metrics():
+    """获取AI客户端的运行指标（响应缓存、请求合并、限流排队）"""
+    from ..core.ai_clients import get_ai_client
+
+    return get_ai_client().metrics()
+
+
+@router.get("/usage")
+async def get_usage(hours: int = 24):
+    """
+    获取上游调用用量汇总
+
+    - **hours**: 统计最近多少小时（默认24）
+
+    返回总计、按模型（含p50/p95/p99延迟和首字节延迟）、按小时、按调用方路由的调用次数、token和估算花费
+    """
+    import asyncio
+    from ..core.usage_ledger import get_usage_ledger
+
+    # 汇总需要读取账本文件，放到线程中执行
+    return await asyncio.to_thread(get_usage_ledger().summary, hours)
+
+
 @router.get("/processes", response_model=List[ProcessInfo])
 async def get_process_list(limit: int = 20):
     """获取进程列表"""
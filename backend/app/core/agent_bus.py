@@ -0,0 +1,436 @@
+"""
+AI Agent Floating Ball - Agent Bus
+悬浮球与Agent之间的消息通道：本地socket上逐行传输JSON，请求带request_id，回复按序号有序送达并支持分段（流式）回复；
+基于 data/input_message.json / data/output_message.json 的文件协议保留为兼容层
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+
+消息格式（每行一个JSON对象）：
+    悬浮球 -> Agent  {"type": "request", "request_id": "...", "content": "...", "screenshot_filename": "...",
+                      "session_id": "..."}
+                     {"type": "cancel", "request_id": "..."} 或 {"type": "cancel", "session_id": "..."}
+    Agent -> 悬浮球  {"type": "ack", "request_id": "...", "seq": 1}
+                     {"type": "partial", "request_id": "...", "seq": 2, "content": "目前为止的回复"}
+                     {"type": "final", "request_id": "...", "seq": 3, "content": "完整回复"}
+                     {"type": "input_state", "disabled": true}
+
+session_id省略时每个连接使用各自的会话；请求的回复只发给发出该请求的连接（文件兼容层和同进程的请求广播给所有连接）
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Set
+
+# Agent消息通道默认监听地址（MCP服务占用9000端口）
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 9001
+# 单条消息的最大长度（含截图文件名等）
+MAX_LINE_BYTES = 1024 * 1024
+# 每个连接待发送消息的上限，慢消费者超过后断开，避免拖住Agent
+MAX_PENDING_MESSAGES = 1000
+
+# 兼容层使用的文件
+INPUT_FILE = "data/input_message.json"
+OUTPUT_FILE = "data/output_message.json"
+INPUT_DISABLE_FLAG = "data/input_disabled.flag"
+
+
+@dataclass
+class AgentRequest:
+    """一条用户请求"""
+    request_id: str
+    content: str
+    screenshot_filename: Optional[str] = None
+    source: str = "socket"  # socket / file / local
+    session_id: str = "default"  # 同一会话共享对话记忆，会话内的请求按顺序处理
+    timestamp: float = field(default_factory=time.time)
+
+
+class _Connection:
+    """一个悬浮球连接：单独的发送队列和写协程保证消息按序送达"""
+
+    _counter = 0
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=MAX_PENDING_MESSAGES)
+        _Connection._counter += 1
+        # 请求未指定session_id时使用的会话
+        self.session_id = f"conn-{_Connection._counter}"
+
+    async def pump(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                self.writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+
+
+class AgentBus:
+    """
+    Agent侧的消息总线
+
+    - 请求来自socket连接、文件兼容层或同进程线程（submit_threadsafe），统一进入一个asyncio队列
+    - 回复发给发出请求的连接（没有对应连接时广播）和所有订阅者；每个请求的消息带递增序号，便于客户端按序拼接
+    - 取消消息交给on_cancel注册的回调处理
+    - partial/reply/set_input_disabled可以在事件循环线程或其他线程中调用
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.input_disabled = False
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._requests: Optional[asyncio.Queue] = None
+        self._connections: Set[_Connection] = set()
+        self._subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self._cancel_handlers: List[Callable[[Optional[str], Optional[str]], None]] = []
+        # request_id -> 发出请求的连接
+        self._owners: Dict[str, _Connection] = {}
+        self._sequences: Dict[str, int] = {}
+        self._finished: Deque[str] = deque(maxlen=256)
+
+    async def start(self):
+        """启动本地socket服务（端口被占用时只保留进程内通道和文件兼容层）"""
+        self._loop = asyncio.get_running_loop()
+        self._requests = asyncio.Queue()
+        try:
+            self._server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port, limit=MAX_LINE_BYTES
+            )
+            print(f"Agent消息通道已启动: {self.host}:{self.port}")
+        except OSError as e:
+            print(f"Agent消息通道启动失败，仅使用文件兼容层: {e}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for connection in list(self._connections):
+            connection.writer.close()
+        self._connections.clear()
+
+    # ---- 请求 ----
+
+    def submit(self, request: AgentRequest, connection: Optional[_Connection] = None):
+        """提交请求（在事件循环线程中调用）"""
+        if connection is not None:
+            self._owners[request.request_id] = connection
+        self._requests.put_nowait(request)
+        self._publish({"type": "ack", "request_id": request.request_id})
+
+    def submit_threadsafe(self, content: str, screenshot_filename: Optional[str] = None,
+                          session_id: str = "default") -> str:
+        """从其他线程（如同进程的悬浮球界面线程）提交请求，返回request_id"""
+        request = AgentRequest(str(time.time()), content, screenshot_filename, source="local", session_id=session_id)
+        self._loop.call_soon_threadsafe(self.submit, request)
+        return request.request_id
+
+    async def next_request(self) -> AgentRequest:
+        """等待下一条请求"""
+        return await self._requests.get()
+
+    def get_request_nowait(self) -> Optional[AgentRequest]:
+        """取出一条已到达的请求，没有时返回None"""
+        try:
+            return self._requests.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    def on_cancel(self, callback: Callable[[Optional[str], Optional[str]], None]):
+        """注册取消回调 callback(request_id, session_id)，在事件循环线程中执行"""
+        self._cancel_handlers.append(callback)
+
+    def _cancel(self, request_id: Optional[str], session_id: Optional[str]):
+        for callback in self._cancel_handlers:
+            try:
+                callback(request_id, session_id)
+            except Exception as e:
+                print(f"取消请求失败: {e}")
+
+    # ---- 回复 ----
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]):
+        """订阅发出的所有消息（回调在事件循环线程中执行，不应阻塞）"""
+        self._subscribers.append(callback)
+
+    def partial(self, request_id: str, content: str):
+        """发送分段回复，content为目前为止的回复内容"""
+        self._publish({"type": "partial", "request_id": request_id, "content": content})
+
+    def reply(self, request_id: str, content: str):
+        """发送最终回复"""
+        self._publish({"type": "final", "request_id": request_id, "content": content})
+
+    def set_input_disabled(self, disabled: bool):
+        """通知悬浮球禁用/启用输入框（语音对话期间禁用）"""
+        self.input_disabled = disabled
+        self._publish({"type": "input_state", "disabled": disabled})
+
+    def _publish(self, message: Dict[str, Any]):
+        if self._loop is None:
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not self._loop:
+            self._loop.call_soon_threadsafe(self._publish, message)
+            return
+
+        request_id = message.get("request_id")
+        owner = None
+        if request_id is not None:
+            if request_id in self._finished:
+                return  # 最终回复之后的消息丢弃，保证final是该请求的最后一条
+            seq = self._sequences.get(request_id, 0) + 1
+            self._sequences[request_id] = seq
+            message["seq"] = seq
+            owner = self._owners.get(request_id)
+            if message["type"] == "final":
+                self._sequences.pop(request_id, None)
+                self._owners.pop(request_id, None)
+                self._finished.append(request_id)
+
+        # 来自某个连接的请求只回复该连接（连接已断开时丢弃），其他消息广播
+        targets = [owner] if owner is not None else list(self._connections)
+        for connection in targets:
+            if connection not in self._connections:
+                continue
+            try:
+                connection.outbox.put_nowait(message)
+            except asyncio.QueueFull:
+                print("悬浮球连接消费过慢，已断开")
+                connection.writer.close()
+                self._connections.discard(connection)
+        for callback in self._subscribers:
+            try:
+                callback(message)
+            except Exception as e:
+                print(f"消息订阅者处理失败: {e}")
+
+    # ---- 连接 ----
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = _Connection(writer)
+        self._connections.add(connection)
+        pump = asyncio.create_task(connection.pump())
+        # 新连接先同步输入框状态
+        connection.outbox.put_nowait({"type": "input_state", "disabled": self.input_disabled})
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    data = None
+                if not isinstance(data, dict):
+                    print(f"Agent消息通道收到无法解析的消息: {line[:200]!r}")
+                    continue
+                message_type = data.get("type", "request")
+                if message_type == "cancel":
+                    request_id, session_id = data.get("request_id"), data.get("session_id")
+                    if request_id or session_id:
+                        self._cancel(str(request_id) if request_id else None, str(session_id) if session_id else None)
+                    continue
+                if message_type != "request" or not str(data.get("content", "")).strip():
+                    continue
+                self.submit(AgentRequest(
+                    request_id=str(data.get("request_id") or time.time()),
+                    content=data["content"],
+                    screenshot_filename=data.get("screenshot_filename"),
+                    session_id=str(data.get("session_id") or connection.session_id)
+                ), connection)
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as e:
+            print(f"悬浮球连接异常断开: {e}")
+        finally:
+            self._connections.discard(connection)
+            for request_id in [rid for rid, owner in self._owners.items() if owner is connection]:
+                del self._owners[request_id]
+            pump.cancel()
+            writer.close()
+
+
+class FileShim:
+    """
+    文件协议兼容层：未接入socket的旧版悬浮球仍通过文件收发消息
+
+    - 监视输入文件的修改时间，按request_id去重；写入未完成（JSON不完整）时下次再读
+    - 最终回复原子写入输出文件（先写临时文件再替换），读取方不会读到半个文件
+    - 输入框禁用状态同步到标志文件
+    """
+
+    def __init__(self, bus: AgentBus, input_file: str = INPUT_FILE, output_file: str = OUTPUT_FILE,
+                 disable_flag: str = INPUT_DISABLE_FLAG, poll_interval: float = 0.05, max_retries: int = 10):
+        self.bus = bus
+        self.input_file = input_file
+        self.output_file = output_file
+        self.disable_flag = disable_flag
+        self.poll_interval = poll_interval
+        self.max_retries = max_retries
+        self._seen: Deque[str] = deque(maxlen=256)
+        bus.subscribe(self._on_message)
+
+    def _read_input(self) -> Optional[Dict[str, Any]]:
+        with open(self.input_file, "r", encoding="utf-8") as f:
+            content = f.read().strip()
+        data = json.loads(content) if content else None
+        # 只接受JSON对象，其他内容按无消息处理
+        return data if isinstance(data, dict) else None
+
+    async def run(self):
+        last_mtime = os.path.getmtime(self.input_file) if os.path.exists(self.input_file) else 0.0
+        # 启动前已存在的消息视为已处理，不重放
+        try:
+            stale = self._read_input() if last_mtime else None
+            if stale and stale.get("request_id"):
+                self._seen.append(str(stale["request_id"]))
+        except (OSError, json.JSONDecodeError):
+            pass
+
+        retries = 0
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                mtime = os.path.getmtime(self.input_file)
+            except OSError:
+                continue
+            if mtime == last_mtime and not retries:
+                continue
+
+            try:
+                data = self._read_input()
+            except (OSError, json.JSONDecodeError) as e:
+                # 写入方可能还没写完，稍后重试
+                retries += 1
+                if retries < self.max_retries:
+                    continue
+                print(f"读取{self.input_file}失败: {e}")
+                self.bus.reply(str(time.time()), "当前出错了，请重新输入。")
+                data = None
+            retries = 0
+            last_mtime = mtime
+
+            if not data or not str(data.get("content", "")).strip():
+                continue
+            request_id = str(data.get("request_id") or mtime)
+            if request_id in self._seen:
+                continue
+            self._seen.append(request_id)
+            self.bus.submit(AgentRequest(
+                request_id=request_id,
+                content=data["content"],
+                screenshot_filename=data.get("screenshot_filename"),
+                source="file"
+            ))
+
+    def _on_message(self, message: Dict[str, Any]):
+        try:
+            if message["type"] == "final":
+                self._write_output({
+                    "request_id": message["request_id"],
+                    "content": message["content"],
+                    "timestamp": time.time()
+                })
+            elif message["type"] == "input_state":
+                self._write_disable_flag(message["disabled"])
+        except OSError as e:
+            print(f"写入兼容文件失败: {e}")
+
+    def _write_output(self, data: Dict[str, Any]):
+        directory = os.path.dirname(self.output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_file = f"{self.output_file}.tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_file, self.output_file)
+
+    def _write_disable_flag(self, disabled: bool):
+        if disabled:
+            directory = os.path.dirname(self.disable_flag)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.disable_flag, "w") as f:
+                f.write("1")
+        elif os.path.exists(self.disable_flag):
+            os.remove(self.disable_flag)
+
+
+class AgentBusClient:
+    """
+    悬浮球侧的同步客户端（供界面线程使用）
+
+        client = AgentBusClient(on_message=handle)
+        client.connect()
+        request_id = client.send("打开记事本")
+
+    on_message在后台读线程中回调，界面框架需要自行切换到界面线程更新控件
+    """
+
+    def __init__(self, on_message: Callable[[Dict[str, Any]], None],
+                 host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.on_message = on_message
+        self.host = host
+        self.port = port
+        self._sock: Optional[socket.socket] = None
+        self._send_lock = threading.Lock()
+
+    def connect(self, timeout: float = 2.0):
+        """连接Agent，失败时抛出OSError（调用方可回退到文件协议）"""
+        self._sock = socket.create_connection((self.host, self.port), timeout=timeout)
+        self._sock.settimeout(None)
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def send(self, content: str, screenshot_filename: Optional[str] = None, session_id: Optional[str] = None) -> str:
+        request_id = str(time.time())
+        message = {
+            "type": "request",
+            "request_id": request_id,
+            "content": content,
+            "screenshot_filename": screenshot_filename
+        }
+        if session_id:
+            message["session_id"] = session_id
+        self._send(message)
+        return request_id
+
+    def cancel(self, request_id: Optional[str] = None, session_id: Optional[str] = None):
+        """取消指定请求，或指定会话中的全部请求"""
+        self._send({"type": "cancel", "request_id": request_id, "session_id": session_id})
+
+    def _send(self, message: Dict[str, Any]):
+        line = json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._send_lock:
+            self._sock.sendall(line)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _read_loop(self):
+        try:
+            with self._sock.makefile("r", encoding="utf-8") as stream:
+                for line in stream:
+                    try:
+                        message = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(message, dict):
+                        self.on_message(message)
+        except (OSError, ValueError) as e:
+            print(f"与Agent的连接已断开: {e}")
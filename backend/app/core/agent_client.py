@@ -3,119 +3,467 @@
 
 import json
 import asyncio
+import inspect
 import os
-import time
-from typing import List, Dict
-from datetime import datetime
+import re
+import sys
 import threading
-import base64
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import List, Dict, Optional, Tuple
 
-from openai import OpenAI
-from fastmcp import Client
-from tts import realtime_tts_speak
-from tts2 import realtime_tts_speak2
-from asr2 import speech_to_text
-import re
-from prompt_tone import DingPlayer
+from openai import OpenAI, APITimeoutError, BadRequestError
+# 录音、语音播报、唤醒词和活跃窗口相关的模块只在Windows桌面环境可用，在使用处导入，
+# 这样回放基准（benchmarks/agent_replay.py）可以在没有这些依赖的机器上导入MCPClient
 
-import pyaudio
-from vosk import Model, KaldiRecognizer
-import json
-import re
-from dotenv import load_dotenv
-import random
-from get_active_window import get_activate_path2, get_activate_path
+try:
+    from .config import load_env
+    from .token_budget import fit_messages, supports
+    from .agent_bus import AgentBus, FileShim
+    from .mcp_session import MCPSession
+    from .context_provider import ContextProvider
+    from .settings_store import get_settings_store, read_setting
+    from .vision_prepass import VisionPrepass, DEFAULT_MAX_IMAGE_SIZE, DEFAULT_QUALITY
+    from .intent_router import IntentRouter
+    from .plan_cache import PlanCache, PlanStep
+    from .session_memory import SessionMemory, Turn
+    from .speculation import SpeculativePlanner
+except ImportError:
+    # 作为独立脚本运行时
+    from config import load_env
+    from token_budget import fit_messages, supports
+    from agent_bus import AgentBus, FileShim
+    from mcp_session import MCPSession
+    from context_provider import ContextProvider
+    from settings_store import get_settings_store, read_setting
+    from vision_prepass import VisionPrepass, DEFAULT_MAX_IMAGE_SIZE, DEFAULT_QUALITY
+    from intent_router import IntentRouter
+    from plan_cache import PlanCache, PlanStep
+    from session_memory import SessionMemory, Turn
+    from speculation import SpeculativePlanner
 
-import time
-import json
-import os
-import threading
-import queue
-import os
 
-# 用于控制悬浮球输入框禁用状态的标志文件路径
-INPUT_DISABLE_FLAG = "data/input_disabled.flag"
-with open("sound_on.txt", "r") as file:
-    SOUND_ON = file.read().strip()
+def sound_on() -> bool:
+    """语音模式开关（sound_on.txt，修改后无需重启即可生效）"""
+    return read_setting("sound_on.txt").strip() == "True"
 
-# REQUEST_ID = "0"
-LAST_TIME = 0
 
-# 新增函数：将图片编码为base64
-def encode_image(image_path):
-    """将图片编码为base64格式"""
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode('utf-8')
-    except Exception as e:
-        print(f"图片编码出错: {str(e)}")
-        return None
+# 图片预处理使用的视觉模型及提示词（只描述图片，不带用户问题，描述结果可以按图片内容缓存）
+VISION_MODEL = "qwen3-vl-flash"
+VISION_PROMPT = "你现在只需要详细描述图片内容，以标准化格式化的方式描述图片内容，比如有表格就用Markdown表格格式描述，以便文本模型进行后续可能的工具调用。"
 
-# 新增导入
-from server import mcp
-from float_ball_line import main_float
+# 每次模型调用为回复预留的token数
+AGENT_MAX_TOKENS = 1024
+# 单个工具调用的超时（秒）
+TOOL_CALL_TIMEOUT = 60.0
+# 本地意图路由直接调用工具的超时（秒）
+FAST_PATH_TIMEOUT = 10.0
+# 命中计划缓存时核对参数、整理回答使用的廉价模型
+PLAN_CHECK_MODEL = "qwen-flash"
+# 压缩较早对话使用的模型及超时（秒），在后台执行
+SUMMARY_MODEL = "qwen-flash"
+SUMMARY_TIMEOUT = 30.0
+# 智能体单次回答的预算：最多模型调用步数、累计token数、墙钟时间（秒）
+AGENT_MAX_STEPS = 6
+AGENT_MAX_TOTAL_TOKENS = 60000
+AGENT_DEADLINE = 110.0
+# 预算耗尽原因的说明
+BUDGET_LABELS = {"steps": "步数", "tokens": "token", "deadline": "时间"}
+# 同时处理的请求数、保留的会话数（与config.json中agent配置的默认值一致）
+DEFAULT_MAX_CONCURRENT_REQUESTS = 4
+DEFAULT_MAX_SESSIONS = 32
+# 未指定会话的请求（及工具调用统计）使用的会话
+DEFAULT_SESSION = "default"
+# 语音对话使用的会话
+VOICE_SESSION = "voice"
+# 语音模式的截图
+VOICE_IMAGE = "imgs/test2.png"
+# 语音退出指令
+EXIT_PATTERN = re.compile(r'[贾艾简]维斯[,，]?\s*(退出|推出|你可以退出了)|退出程序')
+
+
+@dataclass
+class AgentStep:
+    """智能体的一步：一次模型调用及其触发的工具调用"""
+    index: int
+    model: str
+    llm_seconds: float = 0.0
+    tool_seconds: float = 0.0
+    tools: List[str] = field(default_factory=list)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class AgentResult:
+    """智能体一次回答的结果；stopped_reason为None表示正常完成，否则为耗尽的预算（steps/tokens/deadline）"""
+    content: str
+    steps: List[AgentStep]
+    stopped_reason: Optional[str] = None
+    elapsed: float = 0.0
+    # 成功执行的工具调用，每组对应一步（用于计划缓存）
+    plan: List[List[PlanStep]] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(step.prompt_tokens + step.completion_tokens for step in self.steps)
+
+
+@dataclass
+class AgentSession:
+    """一个会话：独立的对话记忆和工具调用计数；同一会话的请求按顺序处理，不同会话之间并发"""
+    session_id: str
+    memory: SessionMemory
+    tool_call_count: Dict[str, int] = field(default_factory=dict)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    # request_id -> 处理中（或排队中）的任务
+    tasks: Dict[str, asyncio.Task] = field(default_factory=dict)
+    last_active: float = field(default_factory=time.time)
+
+
+# 当前任务所属的会话，并发的请求各自读取自己的会话
+_current_session: ContextVar[Optional[AgentSession]] = ContextVar("current_session", default=None)
+# 当前任务是否为预先规划（只进行第一次模型调用，不执行工具）
+_speculating: ContextVar[bool] = ContextVar("speculating", default=False)
 
 # global keybord_content
 #
 # keybord_content = None
 
-load_dotenv()  # 默认会加载根目录下的.env文件
+def load_vision_settings():
+    """读取config.json中的vision配置 (max_image_size, screenshot_quality)，读取失败时使用默认值"""
+    try:
+        try:
+            from .config import get_config
+        except ImportError:
+            from config import get_config
+        vision = get_config().vision
+        return vision.max_image_size, vision.screenshot_quality
+    except Exception as e:
+        print(f"读取视觉配置失败，使用默认值: {e}")
+        return DEFAULT_MAX_IMAGE_SIZE, DEFAULT_QUALITY
+
+def load_agent_settings():
+    """读取config.json中的agent配置 (max_concurrent_requests, max_sessions)，读取失败时使用默认值"""
+    try:
+        try:
+            from .config import get_config
+        except ImportError:
+            from config import get_config
+        agent = get_config().agent
+        return agent.max_concurrent_requests, agent.max_sessions
+    except Exception as e:
+        print(f"读取智能体配置失败，使用默认值: {e}")
+        return DEFAULT_MAX_CONCURRENT_REQUESTS, DEFAULT_MAX_SESSIONS
+
+def build_intent_router() -> IntentRouter:
+    """按app/services/automation/action_tables.py中的预定义应用和动作表建立本地意图路由"""
+    try:
+        from ..services.automation import action_tables
+    except ImportError:
+        # 作为独立脚本运行时，从backend根目录按包导入
+        backend_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if backend_root not in sys.path:
+            sys.path.insert(0, backend_root)
+        from app.services.automation import action_tables
+    return IntentRouter(action_tables.APP_COMMANDS, {
+        "control_music_player": action_tables.MUSIC_ACTIONS,
+        "control_browser": action_tables.BROWSER_ACTIONS,
+        "execute_keyboard_shortcuts": action_tables.SHORTCUTS,
+    })
+
+
+class WakeWordListener(threading.Thread):
+    """
+    唤醒词监听线程：持续读取麦克风并用vosk识别，把每段识别结果作为("wake", 文本)事件投递到asyncio队列
+
+    暂停期间继续读取并丢弃音频，避免缓冲区溢出，恢复后不会识别到积压的旧音频
+    """
+
+    def __init__(self, loop, events, model_path='vosk-model-small-en-us-0.15', rate=16000, frames=4000):
+        super().__init__(daemon=True)
+        self.loop = loop
+        self.events = events
+        self.model_path = model_path
+        self.rate = rate
+        self.frames = frames
+        self.paused = threading.Event()
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """停止监听（语音模式被关闭时），线程读完当前音频块后退出"""
+        self._stopped.set()
+
+    def _emit(self, event):
+        self.loop.call_soon_threadsafe(self.events.put_nowait, event)
+
+    def run(self):
+        import pyaudio
+        from vosk import Model, KaldiRecognizer
+
+        # 初始化英文唤醒模型
+        model = Model(self.model_path)
+        audio_interface = pyaudio.PyAudio()
+        audio_stream = audio_interface.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.rate,
+            input=True,
+            frames_per_buffer=self.frames,
+        )
+        recognizer = KaldiRecognizer(model, self.rate)
+        print("开始识别")
+
+        was_paused = False
+        try:
+            while not self._stopped.is_set():
+                audio_data = audio_stream.read(self.frames, exception_on_overflow=False)
+                if len(audio_data) == 0:
+                    break
+                if self.paused.is_set():
+                    was_paused = True
+                    continue
+                if was_paused:
+                    recognizer.Reset()
+                    was_paused = False
+                if recognizer.AcceptWaveform(audio_data):
+                    result = json.loads(recognizer.Result())
+                    self._emit(("wake", result["text"]))
+        finally:
+            audio_stream.stop_stream()
+            audio_stream.close()
+            audio_interface.terminate()
+            if not self._stopped.is_set():
+                self._emit(("audio_closed", None))
+
 
 class MCPClient:
-    def __init__(self, script: str, model="qwen-plus", max_tool_calls=1):
+    def __init__(self, script: str, model="qwen-plus", max_tool_calls=1, max_steps=AGENT_MAX_STEPS,
+                 max_total_tokens=AGENT_MAX_TOTAL_TOKENS, deadline=AGENT_DEADLINE,
+                 llm_client: Optional[OpenAI] = None, context: Optional[ContextProvider] = None):
         self.script = script
         self.model = model
         self.max_tool_calls = max_tool_calls  # 每个工具的最大调用次数
+        # 单次回答的预算
+        self.max_steps = max_steps
+        self.max_total_tokens = max_total_tokens
+        self.deadline = deadline
 
-        self.client = OpenAI(
+        # 读取API Key前加载根目录下的.env文件
+        load_env()
+        self.client = llm_client or OpenAI(
             # 若没有配置环境变量，请用阿里云百炼API Key将下行替换为：api_key="sk-xxx",
             api_key=os.getenv("ALIBABA_CLOUD_ACCESS_KEY_ID"),
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
         )
 
-        self.session = Client(script)
+        # 长连接MCP会话（自动重连，工具目录按需刷新）
+        self.session = MCPSession(script)
         self.tools = []
-        self.tool_call_count = {}  # 记录每个工具的调用次数
+        # 与悬浮球之间的消息通道
+        self.bus = AgentBus()
+        # 截图预处理（缩放、JPEG编码）与图片描述缓存
+        self.vision = VisionPrepass(*load_vision_settings())
+        # 提问上下文（活跃窗口、文件路径）在后台刷新，提问时直接读取缓存
+        if context is None:
+            from get_active_window import get_activate_path2, get_activate_path
+            context = ContextProvider(get_activate_path2, get_activate_path)
+        self.context = context
+        # 简单命令（打开应用、切歌、关闭标签页等）在本地识别后直接调用工具，不经过模型
+        self.router = build_intent_router()
+        # 重复指令按上次成功的工具调用计划执行，不再重新规划
+        self.plans = PlanCache()
+        # 多个会话并发处理：每个会话有独立的对话记忆（最近几轮原样保留，更早的压缩为摘要）和工具调用计数，
+        # 同时进行的模型/工具调用数受request_slots限制，会话数超过上限时淘汰最久未使用的空闲会话
+        max_concurrent, self.max_sessions = load_agent_settings()
+        self.request_slots = asyncio.Semaphore(max_concurrent)
+        self.sessions: "OrderedDict[str, AgentSession]" = OrderedDict()
+        # 语音模式下根据稳定的部分识别结果预先发起第一次模型调用
+        self.speculation = SpeculativePlanner()
+        # 录音、提示音和语音播报都在这个单线程中执行
+        self.voice_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="voice")
 
-    def read_ai_setting_file(file_path="ai_setting.txt"):
-        """
-        读取txt文件内容
-        """
+    @property
+    def current_session(self) -> AgentSession:
+        """当前任务所属的会话，不在请求任务中时为默认会话"""
+        return _current_session.get() or self.get_session(DEFAULT_SESSION)
+
+    @property
+    def memory(self) -> SessionMemory:
+        return self.current_session.memory
+
+    @property
+    def tool_call_count(self) -> Dict[str, int]:
+        """记录当前会话中每个工具的调用次数"""
+        return self.current_session.tool_call_count
+
+    @tool_call_count.setter
+    def tool_call_count(self, value: Dict[str, int]):
+        self.current_session.tool_call_count = value
+
+    def get_session(self, session_id: str) -> AgentSession:
+        """取得（必要时创建）会话"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            # 先淘汰再加入，新建的会话不会被淘汰
+            self._evict_sessions(self.max_sessions - 1)
+            session = AgentSession(session_id, SessionMemory(self._summarize_history))
+            self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+        session.last_active = time.time()
+        return session
+
+    def _evict_sessions(self, limit: int):
+        """会话数超过limit时淘汰最久未使用的空闲会话（有请求处理中的会话保留）"""
+        for session_id in list(self.sessions):
+            if len(self.sessions) <= limit:
+                break
+            session = self.sessions[session_id]
+            if not session.tasks and not session.lock.locked():
+                print(f"会话数超过上限，已清除最久未使用的会话: {session_id}")
+                del self.sessions[session_id]
+
+    def dispatch(self, request) -> asyncio.Task:
+        """在后台处理一条请求，立即返回，不阻塞其他会话的请求"""
+        session = self.get_session(getattr(request, "session_id", None) or DEFAULT_SESSION)
+        task = asyncio.create_task(self._run_request(session, request))
+        session.tasks[request.request_id] = task
+        task.add_done_callback(lambda _: session.tasks.pop(request.request_id, None))
+        return task
+
+    async def _run_request(self, session: AgentSession, request):
+        _current_session.set(session)
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                # 读取文件内容
-                content = file.read()
-                return content
-        except FileNotFoundError:
-            return "文件未找到"
+            # 同一会话内按提交顺序处理（后一条可能追问前一条），再占用一个全局并发名额
+            async with session.lock:
+                async with self.request_slots:
+                    await self.handle_request(request)
+        except asyncio.CancelledError:
+            print(f"请求已取消: {request.request_id}")
+            self.bus.reply(request.request_id, "user: " + request.content + "\n\n" + "AI:\n\n" + "已取消。")
         except Exception as e:
-            return f"读取文件时出错: {str(e)}"
+            print(f"处理请求失败: {e}")
+            self.bus.reply(request.request_id, f"处理请求时发生错误: {e}")
+        finally:
+            session.last_active = time.time()
+
+    def cancel(self, request_id: Optional[str] = None, session_id: Optional[str] = None):
+        """取消指定请求，或指定会话中所有处理中和排队中的请求"""
+        for session in list(self.sessions.values()):
+            if session_id is not None and session.session_id != session_id:
+                continue
+            for rid, task in list(session.tasks.items()):
+                if request_id is None or rid == request_id:
+                    task.cancel()
 
     async def prepare_tools(self):
-        tools = await self.session.list_tools()
-        self.tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "input_schema": tool.inputSchema
+        # 工具目录已缓存，只有服务端通知变化或重连后才会重新拉取
+        self.tools = await self.session.list_tools()
+
+    async def _create_completion(self, remaining: float, **params):
+        """在线程中调用模型（不阻塞事件循环），超时不超过剩余预算；有参数完全相同的预先规划回复时直接使用"""
+        response = self.speculation.take(params)
+        if response is not None:
+            print("复用预先规划的模型回复")
+            return response
+        response = await asyncio.wait_for(
+            asyncio.to_thread(self.client.chat.completions.create, timeout=remaining, **params),
+            timeout=remaining
+        )
+        if _speculating.get():
+            self.speculation.remember(params, response)
+        return response
+
+    def _multimodal_model(self, model: Optional[str] = None) -> Optional[str]:
+        """
+        规划模型（model或self.model）能在一次请求中同时处理图片和工具调用时返回该模型，否则返回None
+
+        不改用其他模型规划：规划模型不支持图片时走 视觉模型描述 -> 规划模型 的两阶段处理
+        """
+        model = model or self.model
+        return model if supports(model, "vision", "tools") else None
+
+    @staticmethod
+    def _with_image(messages: List[Dict], data_url: str) -> List[Dict]:
+        """把图片附加到最后一条用户消息，即本轮问题（不修改调用方传入的消息）"""
+        messages = list(messages)
+        for i, msg in reversed(list(enumerate(messages))):
+            if msg.get("role") == "user":
+                messages[i] = {
+                    **msg,
+                    "content": [
+                        {"type": "text", "text": str(msg.get("content", ""))},
+                        {"type": "image_url", "image_url": {"url": data_url}}
+                    ]
                 }
-            }
-            for tool in tools
-        ]
+                break
+        return messages
 
-    async def chat(self, messages: List[Dict], tool_call_path=None, image_path=None):
-        if tool_call_path is None:
-            tool_call_path = []  # 记录调用路径，防止重复调用
+    @staticmethod
+    def _with_image_analysis(messages: List[Dict], image_analysis: Optional[str]) -> List[Dict]:
+        """把图片描述附加到最后一条用户消息，即本轮问题（不修改调用方传入的消息）"""
+        if not image_analysis:
+            return messages
+        print(f"多模态模型图片分析结果: {image_analysis}")
+        messages = list(messages)
+        for i, msg in reversed(list(enumerate(messages))):
+            if msg.get("role") == "user":
+                content_text = str(msg.get("content", ""))
+                messages[i] = {
+                    **msg,
+                    "content": "[图片分析结果]:( " + image_analysis + ")\n"+ "根据图片信息满足用户要求\n" + content_text + "\n不要调用识别图像工具"
+                }
+                print(f"文本模型接收的消息内容: {messages[i]['content']}")
+                break
+        return messages
 
-        if not self.tools:
-            await self.prepare_tools()
+    async def _analyze_image(self, data_url: str, deadline_at: float, steps: List[AgentStep]) -> str:
+        """调用视觉模型描述图片（与用户问题无关，结果可按图片内容缓存），记为第0步"""
+        step = AgentStep(0, VISION_MODEL)
+        started = time.monotonic()
+        response = await self._create_completion(
+            deadline_at - started,
+            model=VISION_MODEL,
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": VISION_PROMPT},
+                    {"type": "image_url", "image_url": {"url": data_url}}
+                ]
+            }],
+            max_tokens=AGENT_MAX_TOKENS,
+        )
+        step.llm_seconds = time.monotonic() - started
+        self._record_usage(step, response)
+        steps.append(step)
+        self._log_step(step)
+        return response.choices[0].message.content
+
+    async def chat(self, messages: List[Dict], image_path=None, on_progress=None,
+                   tools: Optional[List[Dict]] = None, model: Optional[str] = None,
+                   history: Optional[List[Dict]] = None) -> AgentResult:
+        """
+        迭代执行 模型规划 -> 并发调用工具 -> 模型继续，直到模型给出回答或预算耗尽
 
-        content2 = None
-        with open("ai_setting.txt", 'r', encoding='utf-8') as file:
-            # 读取文件内容
-            content2 = file.read()
+        预算：最多self.max_steps次模型调用、累计self.max_total_tokens个token、self.deadline秒；
+        预算耗尽时返回目前为止的工具结果作为部分回答。
+        on_progress(text)：调用工具等耗时步骤开始时回调，用于向悬浮球发送分段回复
+        tools、model：只提供部分工具/使用其他模型（默认为全部工具和self.model）
+        history：放在系统消息之后、本轮问题之前的历史消息（会话记忆）
+        """
+        started_at = time.monotonic()
+        deadline_at = started_at + self.deadline
+        steps: List[AgentStep] = []
+
+        await self.prepare_tools()
+        tools = self.tools if tools is None else tools
+        plan: List[List[PlanStep]] = []
+
+        # 用户自定义设定（来自设置缓存，不再每次读取文件）
+        content2 = read_setting("ai_setting.txt")
 
         # 添加系统消息
         system_message = {
@@ -124,474 +472,670 @@ class MCPClient:
         }
         #print(system_message)
 
-        # 确保系统消息在消息列表的开头
+        # 确保系统消息在消息列表的开头，会话记忆紧随其后
         if messages and messages[0].get("role") != "system":
-            messages = [system_message] + messages
+            messages = [system_message] + list(history or []) + messages
         elif not messages:
-            messages = [system_message]
+            messages = [system_message] + list(history or [])
+
+        # 使用文本模型处理，包括工具调用
+        model_to_use = model or self.model
+        text_messages = messages
+        single_pass = False
 
         # 处理多模态和工具调用的混合方案
         if image_path and os.path.exists(image_path):
-            # 第一步：使用多模态模型分析图片
-            vision_model = "qwen3-vl-flash"
-            
-            # 编码图片
-            base64_image = encode_image(image_path)
-            if base64_image:
-                # 保存原始消息内容
-                original_messages = messages.copy()
-                
-                # 修改用户消息以包含图片
-                for msg in messages:
-                    if msg.get("role") == "user":
-                        # 创建包含文本和图片的内容
-                        msg["content"] = [
-                            {
-                                "type": "text",
-                                "text": msg.get("content", "") + "\n你现在只需要详细描述图片内容，以标准化格式化的方式描述图片内容，比如有表格就用Markdown表格格式描述，以便文本模型进行后续可能的工具调用。"
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                }
-                            }
-                        ]
-                        break
-                
-                # 使用视觉模型分析图片
-                vision_response = self.client.chat.completions.create(
-                    model=vision_model,
+            digest, cached_analysis, data_url = await self.vision.prepare(image_path)
+            multimodal_model = self._multimodal_model(model)
+            if cached_analysis is not None:
+                # 图片未变化：直接使用缓存的图片描述，不再调用视觉模型
+                messages = self._with_image_analysis(messages, cached_analysis)
+            elif data_url and multimodal_model:
+                # 模型同时支持图片和工具：图片与工具定义在同一个请求中发送
+                print(f"{multimodal_model}同时支持图片和工具调用，单次请求处理")
+                messages = self._with_image(messages, data_url)
+                model_to_use = multimodal_model
+                single_pass = True
+            elif data_url:
+                # 两阶段：先用视觉模型描述图片，再交给文本模型
+                image_analysis = await self._analyze_image(data_url, deadline_at, steps)
+                self.vision.remember(digest, image_analysis)
+                messages = self._with_image_analysis(messages, image_analysis)
+
+        tool_call_path = []  # 记录调用路径，防止重复调用
+        tool_results: List[str] = []  # 预算耗尽时作为部分回答返回
+        stopped_reason = None
+
+        for index in range(1, self.max_steps + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                stopped_reason = "deadline"
+                break
+
+            # 裁剪历史消息以适配模型上下文窗口（计入工具定义），为回复预留空间
+            messages, dropped = fit_messages(messages, model_to_use, max_tokens=AGENT_MAX_TOKENS, tools=tools)
+            if dropped:
+                print(f"上下文超出{model_to_use}窗口，已裁剪{dropped}条较早的消息")
+
+            step = AgentStep(index, model_to_use)
+            steps.append(step)
+
+            # 创建响应（使用文本模型，支持工具调用）
+            step_started = time.monotonic()
+            try:
+                response = await self._create_completion(
+                    remaining,
+                    model=model_to_use,
                     messages=messages,
-                    max_tokens=1024,
+                    tools=tools,
+                    max_tokens=AGENT_MAX_TOKENS,
                 )
-                
-                # 如果需要工具调用，切换到文本模型
-                # 我们需要将视觉模型的分析结果传递给文本模型
-                image_analysis = vision_response.choices[0].message.content
-                print(f"多模态模型图片分析结果: {image_analysis}")
-                
-                # 准备文本模型的消息，包含图片分析结果
-                text_messages = original_messages.copy()
-                # 更新用户消息，添加图片分析结果
-                for msg in text_messages:
-                    if msg.get("role") == "user":
-                        # 确保content是字符串格式
-                        original_content = msg.get("content", "")
-                        if isinstance(original_content, list):
-                            # 如果content是列表（多模态格式），提取文本部分
-                            text_parts = [item.get("text", "") for item in original_content if isinstance(item, dict) and item.get("type") == "text"]
-                            content_text = " ".join(text_parts)
-                        else:
-                            content_text = str(original_content)
-                        
-                        # 如果content_text中存在“请详细描述图片内容，以便后续可能的工具调用。”这句话，就删除
-                        text_need_delete = "\n你现在只需要详细描述图片内容，以标准化格式化的方式描述图片内容，比如有表格就用Markdown表格格式描述，以便文本模型进行后续可能的工具调用。"
-                        if text_need_delete in content_text:
-                            content_text = content_text.replace(text_need_delete, "")
-
-                        msg["content"] = "[图片分析结果]:( " + image_analysis + ")\n"+ "根据图片信息满足用户要求\n" + content_text + "\n不要调用识别图像工具" 
-                        print(f"文本模型接收的消息内容: {msg['content']}")
-                        break
-                
-                # 使用文本模型处理，包括工具调用
-                model_to_use = self.model
-                messages = text_messages
-            else:
-                # 图片编码失败，使用默认模型
-                model_to_use = self.model
-        else:
-            # 没有图片，直接使用默认模型
-            model_to_use = self.model
-
-        # 创建响应（使用文本模型，支持工具调用）
-        response = self.client.chat.completions.create(
-            model=model_to_use,
-            messages=messages,
-            tools=self.tools,
-            max_tokens=1024,
-        )
+            except (asyncio.TimeoutError, APITimeoutError):
+                step.llm_seconds = time.monotonic() - step_started
+                stopped_reason = "deadline"
+                break
+            except BadRequestError as e:
+                if not single_pass:
+                    raise
+                # 单次请求被拒绝（如模型实际不支持图片与工具同时输入），退回两阶段处理
+                print(f"{model_to_use}单次请求失败，改用两阶段处理: {e}")
+                step.llm_seconds = time.monotonic() - step_started
+                single_pass = False
+                model_to_use = model or self.model
+                image_analysis = await self._analyze_image(data_url, deadline_at, steps)
+                self.vision.remember(digest, image_analysis)
+                messages = self._with_image_analysis(text_messages, image_analysis)
+                continue
+            step.llm_seconds = time.monotonic() - step_started
+            self._record_usage(step, response)
 
-        if response.choices[0].finish_reason != 'tool_calls':
-            return response.choices[0].message
+            if _speculating.get():
+                # 预先规划到此为止，工具等用户说完、确认指令后再执行
+                return self._finish(None, steps, None, started_at, plan)
 
-        # 调用工具
-        for tool_call in response.choices[0].message.tool_calls:
-            tool_name = tool_call.function.name
+            if response.choices[0].finish_reason != 'tool_calls':
+                self._log_step(step)
+                return self._finish(response.choices[0].message.content, steps, None, started_at, plan)
 
-            # 检查该工具是否已超过最大调用次数
-            if tool_name in self.tool_call_count and self.tool_call_count[tool_name] >= self.max_tool_calls:
-                # 如果超过限制，返回错误信息给模型
-                error_message = f"工具 {tool_name} 已达到最大调用次数限制 ({self.max_tool_calls}次)，无法继续调用。"
+            # 同一条assistant消息中的工具调用并发执行，全部完成后进入下一步
+            assistant_message = response.choices[0].message
+            tool_calls = assistant_message.tool_calls
+            messages.append({
+                'role': 'assistant',
+                'content': assistant_message.content or "",
+                'tool_calls': [tool_call.model_dump() for tool_call in tool_calls]
+            })
+
+            step.tools = [tool_call.function.name for tool_call in tool_calls]
+            if on_progress:
+                on_progress(f"正在调用工具 {'、'.join(step.tools)}……")
+            tool_timeout = max(0.0, min(TOOL_CALL_TIMEOUT, deadline_at - time.monotonic()))
+            tools_started = time.monotonic()
+            executed: List[PlanStep] = []
+            results = await asyncio.gather(*(
+                self.run_tool_call(tool_call, tool_call_path, tool_timeout, executed) for tool_call in tool_calls
+            ))
+            plan.append(executed)
+            step.tool_seconds = time.monotonic() - tools_started
+            self._log_step(step)
+
+            # 每个结果以tool消息返回，并带上对应的tool_call_id
+            for tool_call, result in zip(tool_calls, results):
                 messages.append({
-                    'role': 'assistant',
-                    'content': error_message
+                    'role': 'tool',
+                    'tool_call_id': tool_call.id,
+                    'content': result
                 })
-                # 让模型基于错误信息生成回复
-                return await self.chat(messages, tool_call_path)
+            tool_results = list(results)
+
+            if sum(s.prompt_tokens + s.completion_tokens for s in steps) >= self.max_total_tokens:
+                stopped_reason = "tokens"
+                break
+        else:
+            stopped_reason = "steps"
+
+        # 预算耗尽，返回目前为止的结果
+        label = BUDGET_LABELS[stopped_reason]
+        if tool_results:
+            content = f"（已达到{label}预算上限，以下为目前的结果）\n\n" + "\n\n".join(tool_results)
+        else:
+            content = f"（已达到{label}预算上限，未能完成回答，请稍后重试或简化问题）"
+        return self._finish(content, steps, stopped_reason, started_at, plan)
+
+    @staticmethod
+    def _record_usage(step: AgentStep, response):
+        usage = getattr(response, "usage", None)
+        if usage:
+            step.prompt_tokens = usage.prompt_tokens or 0
+            step.completion_tokens = usage.completion_tokens or 0
+
+    @staticmethod
+    def _log_step(step: AgentStep):
+        tools = f"，工具 {'、'.join(step.tools)} {step.tool_seconds:.2f}秒" if step.tools else ""
+        print(f"第{step.index}步: 模型 {step.llm_seconds:.2f}秒{tools}，"
+              f"token {step.prompt_tokens}+{step.completion_tokens}")
+
+    @staticmethod
+    def _finish(content, steps: List[AgentStep], stopped_reason: Optional[str], started_at: float,
+                plan: Optional[List[List[PlanStep]]] = None) -> AgentResult:
+        result = AgentResult(content, steps, stopped_reason, time.monotonic() - started_at, plan or [])
+        status = f"预算耗尽（{BUDGET_LABELS[stopped_reason]}）" if stopped_reason else "完成"
+        print(f"智能体{status}: {len(steps)}步，耗时{result.elapsed:.2f}秒，token {result.total_tokens}")
+        return result
+
+    async def _invoke_tool(self, tool_name: str, arguments: Dict, timeout: float) -> Tuple[str, bool]:
+        """通过MCP会话调用工具，返回 (结果文本, 是否成功)"""
+        try:
+            result = await asyncio.wait_for(
+                self.session.call_tool(tool_name, arguments, timeout=timeout),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            return f"工具 {tool_name} 调用超时（{timeout:.0f}秒）", False
+        except Exception as e:
+            return f"工具 {tool_name} 调用出错: {str(e)}", False
+        text = result.content[0].text if result.content else "工具调用完成"
+        return text, not getattr(result, "is_error", False) and "失败" not in text
+
+    async def run_tool_call(self, tool_call, tool_call_path, timeout: float = TOOL_CALL_TIMEOUT,
+                            executed: Optional[List[PlanStep]] = None) -> str:
+        """执行单个工具调用，返回交给模型的结果文本（出错、超限或超时时返回说明）；成功的调用记入executed"""
+        tool_name = tool_call.function.name
+
+        # 检查该工具是否已超过最大调用次数
+        if tool_name in self.tool_call_count and self.tool_call_count[tool_name] >= self.max_tool_calls:
+            return f"工具 {tool_name} 已达到最大调用次数限制 ({self.max_tool_calls}次)，无法继续调用。"
 
-            # 增加工具调用计数
-            if tool_name in self.tool_call_count:
-                self.tool_call_count[tool_name] += 1
+        # 增加工具调用计数
+        if tool_name in self.tool_call_count:
+            self.tool_call_count[tool_name] += 1
+        else:
+            self.tool_call_count[tool_name] = 1
+
+        # 检查是否在调用路径中已经存在，防止循环调用
+        call_key = f"{tool_name}_{tool_call.function.arguments}"
+        if call_key in tool_call_path:
+            return f"检测到循环调用 {tool_name}，已阻止重复调用。"
+
+        # 添加到调用路径
+        tool_call_path.append(call_key)
+
+        # 调用工具
+        try:
+            arguments = json.loads(tool_call.function.arguments or "{}")
+        except json.JSONDecodeError as e:
+            return f"工具 {tool_name} 调用出错: {str(e)}"
+        text, ok = await self._invoke_tool(tool_name, arguments, timeout)
+        if ok and executed is not None:
+            executed.append(PlanStep(tool_name, arguments, text))
+        return text
+
+    async def fast_path(self, text: str) -> Optional[AgentResult]:
+        """本地意图路由：高置信度的简单命令直接调用工具并返回结果，否则返回None交给模型"""
+        started = time.monotonic()
+        try:
+            await self.prepare_tools()
+        except Exception as e:
+            print(f"获取工具列表失败，跳过本地意图路由: {e}")
+            return None
+        intent = self.router.route(text, [tool["function"]["name"] for tool in self.tools])
+        if intent is None:
+            return None
+
+        print(f"本地意图命中: {intent.tool}({intent.arguments})，置信度{intent.confidence:.2f}")
+        output, ok = await self._invoke_tool(intent.tool, intent.arguments, FAST_PATH_TIMEOUT)
+        content = f"好的，已{intent.label}。" if ok else output
+        result = AgentResult(content, [], None, time.monotonic() - started)
+        print(f"本地意图路由完成，耗时{result.elapsed * 1000:.0f}毫秒")
+        self.memory.add(text, content)
+        return result
+
+    async def answer(self, instruction: str, window: str, messages: List[Dict], image_path=None,
+                     on_progress=None, context: Optional[Dict[str, str]] = None) -> AgentResult:
+        """
+        回答一条用户指令：命中计划缓存时按上次成功的工具调用计划执行，否则交给模型规划，成功后记录计划
+
+        instruction为用户原始指令（缓存键），messages为带上下文的完整消息，
+        context为提问时注入的上下文（用于判断计划参数是否取自当前文件、窗口）
+        """
+        context = context or {"window": window}
+        await self.prepare_tools()
+        key = self.plans.key(instruction, window, self.session.catalog_hash)
+        with_image = bool(image_path and os.path.exists(image_path))
+        plan = self.plans.get(key)
+        history = self.memory.messages()
+        result = await self._answer(key, plan, instruction, messages, history, image_path, with_image, on_progress,
+                                    context)
+        # 记入会话记忆（较早的对话在后台压缩为摘要）
+        if result.content:
+            self.memory.add(instruction, result.content)
+        return result
+
+    async def _answer(self, key, plan, instruction: str, messages: List[Dict], history: List[Dict], image_path,
+                      with_image: bool, on_progress, context: Dict[str, str]) -> AgentResult:
+
+        if plan is not None and not plan.content_dependent:
+            print(f"命中计划缓存（参数固定），直接执行: {' -> '.join(plan.tools)}")
+            result, ok = await self._replay_plan(plan, instruction, on_progress)
+            if ok:
+                self.plans.put(key, instruction, result.plan, result.content, with_image, context)
             else:
-                self.tool_call_count[tool_name] = 1
+                # 工具可能有副作用，失败时不再让模型重做，只作废计划
+                self.plans.invalidate(key)
+            return result
 
-            # 检查是否在调用路径中已经存在，防止循环调用
-            tool_call_id = f"{tool_name}_{tool_call.function.arguments}"
-            if tool_call_id in tool_call_path:
-                error_message = f"检测到循环调用 {tool_name}，已阻止重复调用。"
-                messages.append({
-                    'role': 'assistant',
-                    'content': error_message
-                })
-                return await self.chat(messages, tool_call_path)
+        if plan is not None:
+            # 参数依赖内容：只提供计划中的工具，由廉价模型按当前内容确定参数
+            print(f"命中计划缓存（参数依赖内容），由{PLAN_CHECK_MODEL}核对参数: {' -> '.join(plan.tools)}")
+            plan_tools = set(plan.tools)
+            tools = [tool for tool in self.tools if tool["function"]["name"] in plan_tools]
+            hint = f"\n（同样的指令之前依次调用了工具：{' -> '.join(plan.tools)}，请按相同步骤完成，参数根据当前内容确定）"
+            hinted = [dict(msg) for msg in messages]
+            for msg in reversed(hinted):
+                if msg.get("role") == "user":
+                    msg["content"] = str(msg.get("content", "")) + hint
+                    break
+            result = await self.chat(hinted, image_path=image_path, on_progress=on_progress,
+                                     tools=tools, model=PLAN_CHECK_MODEL, history=history)
+            if result.stopped_reason is None and any(result.plan):
+                self.plans.put(key, instruction, result.plan, result.content, with_image, context)
+                return result
+            self.plans.invalidate(key)
+            if any(result.plan):
+                return result
+            print("按计划核对未能完成，改由模型重新规划")
 
-            # 添加到调用路径
-            tool_call_path.append(tool_call_id)
+        result = await self.chat(messages, image_path=image_path, on_progress=on_progress, history=history)
+        if result.stopped_reason is None:
+            self.plans.put(key, instruction, result.plan, result.content, with_image, context)
+        return result
 
-            # 调用工具
-            try:
-                result = await self.session.call_tool(tool_name, json.loads(tool_call.function.arguments))
-                messages.append({
-                    'role': 'assistant',
-                    'content': result.content[0].text if result.content else "工具调用完成"
-                })
-            except Exception as e:
-                error_message = f"工具 {tool_name} 调用出错: {str(e)}"
-                messages.append({
-                    'role': 'assistant',
-                    'content': error_message
-                })
+    async def _summarize_history(self, summary: str, turns: List[Turn]) -> str:
+        """把较早的对话并入摘要（由会话记忆在回复之后于后台调用）"""
+        dialogue = "\n".join(f"用户：{turn.user}\n助手：{turn.assistant}" for turn in turns)
+        response = await self._create_completion(
+            SUMMARY_TIMEOUT,
+            model=SUMMARY_MODEL,
+            messages=[
+                {"role": "system", "content": "你负责压缩对话记录。把已有摘要和新的对话合并为一段不超过300字的摘要，"
+                                              "保留用户的偏好、提到的文件/应用/人名等实体、得出的结论和未完成的事项，只输出摘要。"},
+                {"role": "user", "content": f"已有摘要：\n{summary or '无'}\n\n新的对话：\n{dialogue}"}
+            ],
+            max_tokens=512,
+        )
+        return response.choices[0].message.content or summary
 
-            return await self.chat(messages, tool_call_path)
+    async def _replay_plan(self, plan, instruction: str, on_progress=None) -> Tuple[AgentResult, bool]:
+        """按计划依次执行各组工具调用（组内并发），返回 (结果, 是否全部成功)"""
+        started_at = time.monotonic()
+        steps: List[AgentStep] = []
+        groups: List[List[PlanStep]] = []
+        for group in plan.groups:
+            if on_progress:
+                on_progress(f"正在调用工具 {'、'.join(step.tool for step in group)}……")
+            outcomes = await asyncio.gather(*(
+                self._invoke_tool(step.tool, step.arguments, TOOL_CALL_TIMEOUT) for step in group
+            ))
+            groups.append([PlanStep(step.tool, step.arguments, text) for step, (text, _) in zip(group, outcomes)])
+            failed = [text for text, ok in outcomes if not ok]
+            if failed:
+                print("按计划执行失败，已作废该计划")
+                return self._finish("\n\n".join(failed), steps, None, started_at, groups), False
 
-        return response
+        # 工具结果与上次相同时复用上次的回答，否则由廉价模型根据新结果整理回答
+        previous = [[step.result for step in group] for group in plan.groups]
+        if previous == [[step.result for step in group] for group in groups]:
+            content = plan.answer
+        else:
+            content = await self._summarize_results(instruction, groups, started_at + self.deadline, steps)
+        return self._finish(content, steps, None, started_at, groups), True
 
-    async def loop(self):
-        global LAST_TIME
-        num_i = 1
-        player = DingPlayer(frequency=600, duration_ms=100)
+    async def _summarize_results(self, instruction: str, groups: List[List[PlanStep]], deadline_at: float,
+                                 steps: List[AgentStep]) -> str:
+        """用廉价模型根据工具结果整理回答；失败时直接返回工具结果"""
+        results = "\n\n".join(f"{step.tool}: {step.result}" for group in groups for step in group)
+        step = AgentStep(1, PLAN_CHECK_MODEL)
+        started = time.monotonic()
+        try:
+            response = await self._create_completion(
+                deadline_at - started,
+                model=PLAN_CHECK_MODEL,
+                messages=[
+                    {"role": "system", "content": "你是语音助手，根据工具结果简短地回答用户，不超过200字。"},
+                    {"role": "user", "content": f"用户问题：{instruction}\n\n工具结果：\n{results}"}
+                ],
+                max_tokens=AGENT_MAX_TOKENS,
+            )
+        except Exception as e:
+            print(f"整理回答失败，直接返回工具结果: {e}")
+            return results
+        step.llm_seconds = time.monotonic() - started
+        step.tools = [s.tool for group in groups for s in group]
+        self._record_usage(step, response)
+        steps.append(step)
+        self._log_step(step)
+        return response.choices[0].message.content or results
+
+    @staticmethod
+    def build_question(message: str, context: Dict[str, str], with_file_path: bool = True) -> str:
+        """把上下文（时间、活跃软件、当前文件路径）拼接到用户问题前"""
+        current_activate_window = "当前活跃的软件为："+context["window"]+"\n"
+        if not with_file_path or context["file_path"] == "":
+            current_file_path = ""
+        else:
+            current_file_path = "当前文件路径为："+context["file_path"]+""
+        current_time = "当前时间为："+context["time"]+"\n"
+        return current_time+current_activate_window+current_file_path+ "用户问题：" + message
+
+    async def handle_request(self, request):
+        """处理一条来自悬浮球的文字请求，通过消息通道返回回复"""
+        message_content = request.content
+        screenshot_filename = request.screenshot_filename
+        print("message: ", message_content)
+        print("screenshot_filename: ", screenshot_filename)
+
+        # 重置工具调用计数器（每次用户提问时重置）
+        self.tool_call_count = {}
+
+        reply_prefix = "user: " + message_content + "\n\n" + "AI:\n\n"
+
+        # 简单命令直接在本地完成
+        response = await self.fast_path(message_content)
+        if response is not None:
+            self.bus.reply(request.request_id, reply_prefix + response.content)
+            print(f"已返回响应: {reply_prefix + response.content}")
+            return
+
+        self.bus.partial(request.request_id, reply_prefix + "正在思考……")
+
+        try:
+            # 上下文来自后台刷新的缓存，文件路径只在短预算内就绪时附加
+            context = await self.context.collect()
+            question = self.build_question(message_content, context)
 
-        if SOUND_ON == "True":
-            # 初始化英文唤醒模型
-            model = Model('vosk-model-small-en-us-0.15')
-            audio_interface = pyaudio.PyAudio()
-            audio_stream = audio_interface.open(
-                format=pyaudio.paInt16,
-                channels=1,
-                rate=16000,
-                input=True,
-                frames_per_buffer=4000,
+            # 确定图片路径
+            image_path = None
+            if screenshot_filename and os.path.exists(screenshot_filename):
+                image_path = screenshot_filename
+                print(f"使用指定图片: {image_path}")
+            elif screenshot_filename:
+                # 如果指定的路径不存在，尝试在imgs目录下查找
+                test_image_path = "imgs/test.png"
+                if os.path.exists(test_image_path):
+                    image_path = test_image_path
+                    print(f"使用默认测试图片: {image_path}")
+
+            # 调用chat方法，传入图片路径（如果有）
+            response = await asyncio.wait_for(
+                self.answer(message_content, context["window"], [
+                    {
+                        "role": "user",
+                        "content": question,
+                    }
+                ], image_path=image_path,
+                    on_progress=lambda text: self.bus.partial(request.request_id, reply_prefix + text),
+                    context=context),
+                timeout=120.0  # 120秒超时
             )
-            recognizer = KaldiRecognizer(model, 16000)
-            print("开始识别")
+        except asyncio.TimeoutError:
+            print("请求超时，重新进入循环")
+            response = type('obj', (object,), {'content': '请求超时。'})  # 创建一个具有content属性的对象
+        except Exception as e:
+            print(f"发生错误: {str(e)}")
+            response = type('obj', (object,), {'content': f'处理请求时发生错误: {str(e)}'})  # 创建一个具有content属性的对象
 
-        # 用于进程间通信的文件路径
-        INPUT_FILE = "data/input_message.json"
-        OUTPUT_FILE = "data/output_message.json"
+        # 检查response是否有内容
+        if not hasattr(response, 'content') or response.content is None:
+            response.content = "无响应内容。"
 
-        # 确保数据目录存在
-        def ensure_data_directory():
-            if not os.path.exists("data"):
-                os.makedirs("data")
-        last_input_time = 0
+        self.bus.reply(request.request_id, reply_prefix + response.content)
+        print(f"已返回响应: {reply_prefix + response.content}")
 
-        while True:
-            if SOUND_ON == "True":
-                audio_data = audio_stream.read(4000)
-                if len(audio_data) == 0:
+    async def _in_voice_thread(self, fn, *args, **kwargs):
+        """在专用语音线程中执行阻塞的录音/播放调用，保证提示音、识别和播报按顺序进行且不阻塞事件循环"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.voice_executor, lambda: fn(*args, **kwargs))
+
+    def _propose_speculation(self, session: AgentSession, transcript: str):
+        """部分识别结果稳定（事件循环线程中执行）：需要模型规划的指令预先发起第一次模型调用"""
+        if EXIT_PATTERN.search(transcript) or self.request_slots.locked():
+            # 退出指令不需要模型；并发名额已满时不占用
+            return
+        if self.tools and self.router.route(transcript, [tool["function"]["name"] for tool in self.tools]):
+            return  # 本地意图路由即可完成
+        self.speculation.propose(transcript, lambda text: self._speculate(session, text))
+
+    async def _speculate(self, session: AgentSession, transcript: str):
+        """预先规划：构造与正式请求相同的消息，只进行第一次模型调用；返回 (上下文, 问题) 供正式请求复用"""
+        _current_session.set(session)
+        _speculating.set(True)
+        context = await self.context.collect()
+        question = self.build_question(transcript, context, with_file_path=False)
+        key = self.plans.key(transcript, context["window"], self.session.catalog_hash)
+        if key in self.plans:
+            return context, question  # 命中计划缓存，不需要模型规划
+        image_path = VOICE_IMAGE if os.path.exists(VOICE_IMAGE) else None
+        async with self.request_slots:
+            await self.chat([{"role": "user", "content": question}], image_path=image_path,
+                            history=self.memory.messages())
+        return context, question
+
+    async def _run_voice_session(self, player, initializing=False):
+        """语音对话使用独立的会话"""
+        _current_session.set(self.get_session(VOICE_SESSION))
+        await self.voice_session(player, initializing)
+
+    async def voice_session(self, player, initializing=False):
+        """一次语音对话：唤醒后循环进行 录音识别 -> 模型回答 -> 语音播报，直到用户退出"""
+        from tts import realtime_tts_speak
+        from tts2 import realtime_tts_speak2
+        from asr2 import speech_to_text
+
+        # 识别过程中部分结果稳定时回调（在语音线程中），预先发起模型规划
+        loop = asyncio.get_running_loop()
+        session = self.current_session
+        asr_options = {}
+        if "on_partial" in inspect.signature(speech_to_text).parameters:
+            asr_options["on_partial"] = lambda text: loop.call_soon_threadsafe(
+                self._propose_speculation, session, text
+            )
+
+        # 语音对话期间禁用悬浮球输入框
+        self.bus.set_input_disabled(True)
+        print("已禁用悬浮球输入框")
+
+        try:
+            if initializing:
+                await self._in_voice_thread(player.play)
+                await asyncio.sleep(0.3)
+                return
+
+            while True:
+                await self._in_voice_thread(player.play)
+                await asyncio.sleep(0.3)
+                #player.quit()
+
+                question = await self._in_voice_thread(speech_to_text, **asr_options)
+                question_users = question
+                # question = input("用户输入：")
+                if question == None:
+                    self.speculation.discard()
+                    await self._in_voice_thread(realtime_tts_speak, "我先退出了。", rate=26000)
                     break
-            else:
-                audio_data = None
-
-            message = None
-            screenshot_filename = None
-            input_data = None  # 重命名为input_data以避免变量名冲突
-        
-            # 检查输入文件是否存在且有更新
-            if os.path.exists(INPUT_FILE):
-                file_time = os.path.getmtime(INPUT_FILE)
-                #print(f"上次时间：{LAST_TIME} 当前时间：{time.time()}")
-                if file_time > last_input_time:
-                    # 如果if time.time()-LAST_TIME>2:就读取文件，否则就直接不读取操作
-                    if time.time()-LAST_TIME>2:
-                        # 读取输入消息
-                        try:
-                            with open(INPUT_FILE, 'r', encoding='utf-8') as f:
-                                content = f.read().strip()
-                                # 添加调试信息
-                                print(f"[调试] 从{INPUT_FILE}读取内容: {repr(content)}")
-                                if content:
-                                    try:
-                                        input_data = json.loads(content)
-                                        print(f"[调试] 成功解析JSON: {input_data.get('content', '无内容')}")
-                                    except json.JSONDecodeError as e:
-                                        print(f"[调试] JSON解析错误: {e}")
-                                        # JSON格式错误时，使用默认错误提示
-                                        default_json = '{"request_id": "1761143318.5938723", "content": "￥当前出错了，请重新输入。￥", "timestamp": 1761143318.5938723}'
-                                        input_data = json.loads(default_json)
-                                else:
-                                    print(f"[调试] {INPUT_FILE} 文件内容为空")
-                                    # 当文件为空时，检查是否有其他进程可能在频繁写入并清空
-                                    # 尝试等待一小段时间后再次读取
-                                    time.sleep(0.05)
-                                    with open(INPUT_FILE, 'r', encoding='utf-8') as f2:
-                                        retry_content = f2.read().strip()
-                                        if retry_content:
-                                            print(f"[调试] 重试读取到内容: {repr(retry_content)}")
-                                            input_data = json.loads(retry_content)
-                                        else:
-                                            # 文件确实为空时，使用默认的错误提示JSON
-                                            default_json = '{"request_id": "1761143318.5938723", "content": "￥当前出错了，请重新输入。￥", "timestamp": 1761143318.5938723}'
-                                            input_data = json.loads(default_json)
-                        except Exception as e:
-                            print(f"[调试] 读取文件时发生错误: {e}")
-                            # 发生其他错误时，使用默认错误提示
-                            current_time1 = time.time()
-                            default_json = f'{{"request_id": "{current_time1}", "content": "￥当前出错了，请重新输入。￥", "timestamp": {current_time1}}}'
-                            input_data = json.loads(default_json)
-                        
-                        # 打印接收到的消息和缩略图文件名（如果有）
-                        if input_data:  # 检查input_data是否为None
-                            message = input_data.get('content', '')
-                            screenshot_filename = input_data.get('screenshot_filename', None)
-                        else:
-                            message = ''
-                            screenshot_filename = None
-                        #print(f"消息2222: {message}")
-                        if screenshot_filename:
-                            print(f"接收到缩略图文件名: {screenshot_filename}")
-                        
-                        # 记录最后读取时间
-                        last_input_time = file_time
-                        #time.sleep(0.1)
-                    else:
-                        last_input_time = file_time
-        
-            #print("测试信息222: ", message)
-            if message and message.strip():
-                print("message: ",message)
-                print("screenshot_filename: ",screenshot_filename)
-                img_content = ""
-                                                        
-                # 只有当接收到有效信息时才执行延时和返回操作
-                
+                await self._in_voice_thread(player.play)
+                await asyncio.sleep(0.1)
+                await self._in_voice_thread(player.play)
+                await asyncio.sleep(0.2)
+
                 # 重置工具调用计数器（每次用户提问时重置）
                 self.tool_call_count = {}
 
-                # 从输入数据中提取消息内容
-                message_content = input_data.get('content', '')
-                print(f"原始消息: {message_content}")
-
-                # 使用async with self.session上下文管理器来确保客户端连接
-                async with self.session:
-                    try:
-                        # 先延时0.5秒
-                        await asyncio.sleep(0.5)
-                        current_activate_window = "当前活跃的软件为："+get_activate_path2()+"\n"
-                        if get_activate_path() == "":
-                            current_file_path = ""
-                        else:
-                            current_file_path = "当前文件路径为："+get_activate_path()+""
-                        current_time = "当前时间为："+datetime.today().strftime('%Y.%m.%d %H时%M分%S秒')+"\n"
-                        question = current_time+current_activate_window+current_file_path+ "用户问题：" + message_content
-                            
-                        # 确定图片路径
+                if EXIT_PATTERN.search(question):
+                    self.speculation.discard()
+                    await self._in_voice_thread(realtime_tts_speak, "好的，已退出，随时待命。", rate=27000)
+                    break
+
+                request_id = str(time.time())
+
+                # 简单命令直接在本地完成，不经过模型
+                response = await self.fast_path(question)
+                if response is not None:
+                    self.speculation.discard()
+                    self.bus.reply(request_id, "user: "+question_users + "\n\n" + "AI:\n\n" + response.content)
+                    await self._in_voice_thread(realtime_tts_speak2, response.content)
+                    continue
+
+                # 设置超时时间为120秒
+                try:
+                    # 最终识别结果与预先规划一致时沿用其上下文和问题，第一次模型调用直接复用预先得到的回复
+                    speculated = await self.speculation.resolve(question)
+                    if speculated is not None:
+                        context, question = speculated
+                    else:
+                        context = await self.context.collect()
+                        question = self.build_question(question, context, with_file_path=False)
+
+                    # 语音模式下使用截图图片imgs/test2.png
+                    # 判断imgs/test2.png是否存在
+                    if os.path.exists(VOICE_IMAGE):
+                        image_path = VOICE_IMAGE
+                    else:
                         image_path = None
-                        if screenshot_filename and os.path.exists(screenshot_filename):
-                            image_path = screenshot_filename
-                            print(f"使用指定图片: {image_path}")
-                        elif screenshot_filename:
-                            # 如果指定的路径不存在，尝试在imgs目录下查找
-                            test_image_path = "imgs/test.png"
-                            if os.path.exists(test_image_path):
-                                image_path = test_image_path
-                                print(f"使用默认测试图片: {image_path}")
-                        
-                        # 调用chat方法，传入图片路径（如果有）
+                    async with self.request_slots:
                         response = await asyncio.wait_for(
-                            self.chat([
+                            self.answer(question_users, context["window"], [
                                 {
                                     "role": "user",
                                     "content": question,
                                 }
-                            ], image_path=image_path),
+                            ], image_path=image_path, context=context),
                             timeout=120.0  # 120秒超时
                         )
-                    except asyncio.TimeoutError:
-                        print("请求超时，重新进入循环")
-                        response = type('obj', (object,), {'content': '请求超时。'})  # 创建一个具有content属性的对象
-                    except Exception as e:
-                        print(f"发生错误: {str(e)}")
-                        response = type('obj', (object,), {'content': f'处理请求时发生错误: {str(e)}'})  # 创建一个具有content属性的对象
-                    
-                    # 检查response是否有内容
-                    if not hasattr(response, 'content') or response.content is None:
-                        response.content = "无响应内容。"
-
-                    # 创建响应数据
-                    response_data = {
-                        'request_id': input_data.get('request_id', ''),
-                        'content': "user: "+message_content + "\n\n" + "AI:\n\n" + response.content,
-                        'timestamp': time.time()
-                    }
-                
-                    # 写入输出文件
-                    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                        json.dump(response_data, f, ensure_ascii=False)
-                    
-                    print(f"已返回响应: {response_data['content']}")
-                    LAST_TIME = time.time()
-                    
-                # except Exception as e:
-                #     print(f"发送响应时出错: {e}")
-            
-            else:
-                pass
+                except asyncio.TimeoutError:
+                    print("请求超时，重新进入循环")
+                    await self._in_voice_thread(realtime_tts_speak, "请求超时，重新进入循环", rate=27000)
+                    break  # 跳出内部循环，重新进入唤醒检测循环
+                finally:
+                    self.speculation.discard()
+
+                # 检查response是否有内容
+                if not hasattr(response, 'content') or response.content is None:
+                    print("无响应内容，重新进入循环")
+                    await self._in_voice_thread(realtime_tts_speak, "无响应内容，重新进入循环", rate=27000)
+                    break  # 跳出内部循环，重新进入唤醒检测循环
+
+                print(f"AI: {response.content}")
+                # 删除内容中的网页链接
+                cleaned_content = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', response.content)
+                # 清理多余的空格
+                cleaned_content = re.sub(r'\s+', ' ', cleaned_content).strip()
+                print(len(cleaned_content))
+                reply_content = "user: "+question_users + "\n\n" + "AI:\n\n" + response.content
+                self.bus.reply(request_id, reply_content)
 
-            if SOUND_ON == "True" and recognizer.AcceptWaveform(audio_data):
-                result = json.loads(recognizer.Result())
-                text = result["text"]
-                #print(text)
+                print(f"已返回响应: {reply_content}")
+
+                await self._in_voice_thread(realtime_tts_speak2, cleaned_content)
+        except Exception as e:
+            print(f"语音对话出错: {e}")
+        finally:
+            self.speculation.discard()
+            # 退出语音模式循环，启用悬浮球输入框
+            self.bus.set_input_disabled(False)
+            print("已启用悬浮球输入框")
+
+    async def loop(self):
+        from tts import realtime_tts_speak
+        from prompt_tone import DingPlayer
+
+        initialized = False
+        player = DingPlayer(frequency=600, duration_ms=100)
+
+        # 连接MCP服务器（整个运行期间复用同一个会话）
+        await self.session.connect()
+        self.context.start()
+
+        # 启动与悬浮球的消息通道，旧版悬浮球仍可通过文件收发消息
+        await self.bus.start()
+        self.bus.on_cancel(self.cancel)
+        file_shim_task = asyncio.create_task(FileShim(self.bus).run())
+
+        # 文字请求和唤醒事件汇入同一个队列
+        events = asyncio.Queue()
+
+        async def forward_requests():
+            while True:
+                events.put_nowait(("request", await self.bus.next_request()))
+
+        forward_task = asyncio.create_task(forward_requests())
+
+        # 语音模式开关修改后（sound_on.txt）无需重启，随时启动或停止唤醒词监听
+        loop = asyncio.get_running_loop()
+        get_settings_store().on_change(
+            "sound_on.txt", lambda _: loop.call_soon_threadsafe(events.put_nowait, ("sound_setting", None))
+        )
+
+        listener = None
+        if sound_on():
+            listener = WakeWordListener(loop, events)
+            listener.start()
+
+        voice_task = None
+        while True:
+            kind, payload = await events.get()
+
+            if kind == "request":
+                # 请求在后台并发处理，语音对话进行中也能处理文字请求
+                try:
+                    self.dispatch(payload)
+                except Exception as e:
+                    print(f"分发请求失败: {e}")
+                    self.bus.reply(payload.request_id, f"处理请求时发生错误: {e}")
+
+            elif kind == "wake":
+                if listener is None or (voice_task is not None and not voice_task.done()):
+                    continue
+                text = payload
                 # 使用正则表达式识别是否有hello
-                if re.search(r'\bhello\s[tcdjh]', text, re.IGNORECASE) or num_i == 1:
-                                       
-                    if num_i == 1:
-                        #realtime_tts_speak("正在初始化，听到“哔”声后喊hello jarvis，就可以对话了", rate=28000)
-                        print("正在初始化，听到“哔”声后喊hello jarvis，就可以对话了")
-                        response_data = {
-                                'request_id': str(time.time()),
-                                'content': "正在初始化，听到“哔”声后喊hello 贾维斯，就可以对话了",
-                                'timestamp': time.time()
-                            }
-                        
-                        # 写入输出文件
-                        with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                            json.dump(response_data, f, ensure_ascii=False)
-                            
-                    else:
-                        print("已正确识别")
-                        realtime_tts_speak("乐意效劳。", rate=28000)
-                    #break
-                    # 创建标志文件，禁用悬浮球输入框
-                    try:
-                        if not os.path.exists("data"):
-                            os.makedirs("data")
-                        with open(INPUT_DISABLE_FLAG, 'w') as f:
-                            f.write("1")
-                        print("已禁用悬浮球输入框")
-                    except Exception as e:
-                        print(f"创建禁用标志文件失败: {e}")
-                    
-                    while True:
-                        async with self.session:
-                            if num_i == 1:
-                                num_i = num_i + 1
-                                player.play()
-                                time.sleep(0.3)
-                                break
-                            player.play()
-                            time.sleep(0.3)
-                            #player.quit()
-
-                            question = speech_to_text()
-                            question_users = question
-                            # question = input("用户输入：")
-                            if question == None:
-                                realtime_tts_speak("我先退出了。", rate=26000)
-                                break
-                            player.play()
-                            time.sleep(0.1)
-                            player.play()
-                            time.sleep(0.2)
-
-                            # 重置工具调用计数器（每次用户提问时重置）
-                            self.tool_call_count = {}
-
-                            if re.search(r'[贾艾简]维斯[,，]?\s*(退出|推出|你可以退出了)', question) or re.search(r'退出程序', question):
-                                realtime_tts_speak("好的，已退出，随时待命。", rate=27000)
-                                break
-                            
-                            request_id = str(time.time())
-                            # 构建消息数据
-                            sound_input_data = {
-                                'request_id': request_id,
-                                'content': question_users,
-                                'timestamp': time.time()
-                            }
-
-                            # 设置超时时间为120秒
-                            start_time = time.time()
-                            try:
-                                current_activate_window = "当前活跃的软件为："+get_activate_path2()+"\n"
-                                current_time = "当前时间为："+datetime.today().strftime('%Y.%m.%d %H时%M分%S秒')+"\n"
-                                question = current_time+current_activate_window+ "用户问题：" + question
-                            
-                                # 语音模式下使用截图图片imgs/test2.png
-                                # 判断imgs/test2.png是否存在
-                                if os.path.exists("imgs/test2.png"):
-                                    image_path = "imgs/test2.png"
-                                else:
-                                    image_path = None
-                                response = await asyncio.wait_for(
-                                    self.chat([
-                                        {
-                                            "role": "user",
-                                            "content": question,
-                                        }
-                                    ], image_path=image_path),
-                                    timeout=120.0  # 120秒超时
-                                )
-                            except asyncio.TimeoutError:
-                                print("请求超时，重新进入循环")
-                                realtime_tts_speak("请求超时，重新进入循环", rate=27000)
-                                break  # 跳出内部循环，重新进入唤醒检测循环
-
-                            # 检查response是否有内容
-                            if not hasattr(response, 'content') or response.content is None:
-                                print("无响应内容，重新进入循环")
-                                realtime_tts_speak("无响应内容，重新进入循环", rate=27000)
-                                break  # 跳出内部循环，重新进入唤醒检测循环
-
-                            print(f"AI: {response.content}")
-                            # 删除内容中的网页链接
-                            cleaned_content = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', response.content)
-                            # 清理多余的空格
-                            cleaned_content = re.sub(r'\s+', ' ', cleaned_content).strip()
-                            print(len(cleaned_content))
-                            #continue# 创建响应数据
-                            response_data = {
-                                'request_id': sound_input_data.get('request_id', ''),
-                                'content': "user: "+question_users + "\n\n" + "AI:\n\n" + response.content,
-                                'timestamp': time.time()
-                            }
-                        
-                            # 写入输出文件
-                            with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
-                                json.dump(response_data, f, ensure_ascii=False)
-                            
-                            print(f"已返回响应: {response_data['content']}")
-
-                            rr = realtime_tts_speak2(cleaned_content)
-
-                            # if rr == 1:
-                            #     realtime_tts_speak("嗯。", rate=30000)
-                            # else:
-                            #     pass
-                        
-                    
-                    # 退出语音模式循环前删除标志文件，启用悬浮球输入框
-                    if SOUND_ON == "True":
-                        try:
-                            if os.path.exists(INPUT_DISABLE_FLAG):
-                                os.remove(INPUT_DISABLE_FLAG)
-                                print("已启用悬浮球输入框")
-                        except Exception as e:
-                            print(f"删除禁用标志文件失败: {e}")
+                if not (re.search(r'\bhello\s[tcdjh]', text, re.IGNORECASE) or not initialized):
+                    continue
+
+                if not initialized:
+                    #realtime_tts_speak("正在初始化，听到“哔”声后喊hello jarvis，就可以对话了", rate=28000)
+                    print("正在初始化，听到“哔”声后喊hello jarvis，就可以对话了")
+                    self.bus.reply(str(time.time()), "正在初始化，听到“哔”声后喊hello 贾维斯，就可以对话了")
+                else:
+                    print("已正确识别")
+                    await self._in_voice_thread(realtime_tts_speak, "乐意效劳。", rate=28000)
+
+                # 语音对话期间暂停唤醒词识别（ASR需要独占麦克风内容）
+                listener.paused.set()
+                voice_task = asyncio.create_task(self._run_voice_session(player, initializing=not initialized))
+                voice_task.add_done_callback(lambda _, paused=listener.paused: paused.clear())
+                initialized = True
+
+            elif kind == "sound_setting":
+                if sound_on() and listener is None:
+                    print("语音模式已开启")
+                    listener = WakeWordListener(loop, events)
+                    listener.start()
+                elif not sound_on() and listener is not None:
+                    print("语音模式已关闭")
+                    listener.stop()
+                    listener = None
+
+            elif kind == "audio_closed":
+                break
 
             #Sprint("循环结束。")
 
-    
+        forward_task.cancel()
+        file_shim_task.cancel()
+        self.cancel()
+        await self.bus.stop()
+        await self.session.close()
+        self.context.stop()
+
     def get_tool_call_stats(self):
         """
         获取工具调用统计信息
@@ -606,10 +1150,12 @@ class MCPClient:
 
 # 新增函数：运行MCP服务器
 def run_server():
+    from server import mcp
     mcp.run(transport="http", port=9000)
 
 # 运行悬浮球线程
 def run_float_ball():
+    from float_ball_line import main_float
     main_float()
 
 async def main():
@@ -5,86 +5,217 @@ AI服务客户端，集成Moonshot、DashScope、秘塔等服务
 
 import json
 import time
-from typing import Dict, List, Any, Optional
-from openai import OpenAI
-import requests
+from typing import Dict, List, Any, Optional, AsyncIterator
+import dataclasses
+import httpx
+
+from .config import get_config, RouteConfig
+from .response_cache import get_response_cache, make_cache_key, canonical_hash
+from .singleflight import SingleFlight
+from .rate_limit import get_rate_limiter, get_rate_limit_stats, estimate_tokens
+from .routing import ProviderRouter, get_route_policy
+from .resilience import get_breaker, get_breaker_stats, dependency_timeout
+from .usage_ledger import track_usage
+
+
+# 连接池参数：所有上游调用共享同一个连接池，复用keep-alive连接
+HTTP_POOL_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=20,
+    keepalive_expiry=30.0
+)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+def _http2_available() -> bool:
+    """HTTP/2需要可选依赖h2（httpx[http2]）"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """创建共享的异步HTTP连接池"""
+    return httpx.AsyncClient(
+        http2=_http2_available(),
+        limits=HTTP_POOL_LIMITS,
+        timeout=HTTP_TIMEOUT
+    )
+
+
+class ProviderError(Exception):
+    """上游提供商调用失败；retryable表示可以切换到其他提供商重试（超时、连接错误、429、5xx）"""
+
+    def __init__(self, message: str, provider: str, retryable: bool = False):
+        super().__init__(message)
+        self.provider = provider
+        self.retryable = retryable
+
+
+def _is_retryable(error: Exception) -> bool:
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class OpenAIChatClient:
+    """OpenAI兼容的聊天客户端"""
+
+    provider = "openai"
+    label = "OpenAI"
+
+    def __init__(self, api_key: str, base_url: str, model: str, temperature: float, max_tokens: int,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        # openai包导入较慢，推迟到首次创建客户端时
+        from openai import AsyncOpenAI
+
+        # 重试交给ProviderRouter（切换到其他提供商），SDK内部不再重试
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=http_client,
+            max_retries=0
+        )
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
 
-from .config import get_config
+    async def chat_completion(self, messages: List[Dict], **kwargs) -> Dict[str, Any]:
+        """调用聊天完成API"""
+        try:
+            # 设置参数
+            temperature = kwargs.get('temperature', self.temperature)
+            max_tokens = kwargs.get('max_tokens', self.max_tokens)
+            timeout = kwargs.get('timeout', HTTP_TIMEOUT)
 
+            # 调用API（流式请求请使用 chat_completion_stream）
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
 
-class MoonshotClient:
-    """Moonshot Kimi API客户端"""
+            content = response.choices[0].message.content
+            usage = response.usage.model_dump() if response.usage else None
 
-    def __init__(self):
-        from .config import get_config
-        config = get_config()
-        moonshot_config = config.ai.moonshot
+            return {
+                "content": content,
+                "model": self.model,
+                "provider": self.provider,
+                "usage": usage
+            }
 
-        self.client = OpenAI(
-            api_key=moonshot_config.api_key,
-            base_url=moonshot_config.base_url
-        )
-        self.model = moonshot_config.model
-        self.temperature = moonshot_config.temperature
-        self.max_tokens = moonshot_config.max_tokens
+        except Exception as e:
+            raise ProviderError(f"{self.label} API调用失败: {str(e)}", self.provider, _is_retryable(e)) from e
 
-    async def chat_completion(self, messages: List[Dict], **kwargs) -> Dict[str, Any]:
-        """调用Moonshot聊天完成API"""
+    async def chat_completion_stream(self, messages: List[Dict], **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式调用聊天完成API
+
+        逐个产出 {"type": "delta", "content": ...}，结束时产出
+        {"type": "done", "content": 完整内容, "model": ..., "usage": ...}
+        """
         try:
-            # 设置参数
             temperature = kwargs.get('temperature', self.temperature)
             max_tokens = kwargs.get('max_tokens', self.max_tokens)
-            stream = kwargs.get('stream', False)
+            timeout = kwargs.get('timeout', HTTP_TIMEOUT)
 
-            # 调用API
-            response = self.client.chat.completions.create(
+            stream = await self.client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                stream=stream
+                stream=True,
+                timeout=timeout
             )
 
-            if stream:
-                # 处理流式响应
-                return {"content": "流式响应暂未实现", "model": self.model}
-            else:
-                # 处理普通响应
-                content = response.choices[0].message.content
-                usage = response.usage.model_dump() if response.usage else None
-
-                return {
-                    "content": content,
-                    "model": self.model,
-                    "usage": usage
-                }
+            parts = []
+            usage = None
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage.model_dump()
+                if not chunk.choices:
+                    continue
+
+                choice = chunk.choices[0]
+                # Moonshot在最后一个choice中携带usage
+                choice_usage = getattr(choice, "usage", None)
+                if choice_usage:
+                    usage = choice_usage if isinstance(choice_usage, dict) else choice_usage.model_dump()
+
+                if choice.delta and choice.delta.content:
+                    parts.append(choice.delta.content)
+                    yield {"type": "delta", "content": choice.delta.content}
+
+            yield {
+                "type": "done",
+                "content": "".join(parts),
+                "model": self.model,
+                "provider": self.provider,
+                "usage": usage
+            }
 
         except Exception as e:
-            raise Exception(f"Moonshot API调用失败: {str(e)}")
+            raise ProviderError(f"{self.label} API流式调用失败: {str(e)}", self.provider, _is_retryable(e)) from e
 
 
-class DashScopeClient:
+class MoonshotClient(OpenAIChatClient):
+    """Moonshot Kimi API客户端"""
+
+    provider = "moonshot"
+    label = "Moonshot"
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
+        moonshot_config = get_config().ai.moonshot
+        super().__init__(
+            api_key=moonshot_config.api_key,
+            base_url=moonshot_config.base_url,
+            model=moonshot_config.model,
+            temperature=moonshot_config.temperature,
+            max_tokens=moonshot_config.max_tokens,
+            http_client=http_client
+        )
+
+
+class DashScopeClient(OpenAIChatClient):
     """DashScope API客户端"""
 
-    def __init__(self):
+    provider = "dashscope"
+    label = "DashScope"
+
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         config = get_config()
         dashscope_config = config.ai.dashscope
 
-        self.client = OpenAI(
+        # 聊天默认参数与Moonshot保持一致，便于故障转移时行为一致
+        super().__init__(
             api_key=dashscope_config.api_key,
-            base_url=dashscope_config.base_url
+            base_url=dashscope_config.base_url,
+            model=dashscope_config.chat_model,
+            temperature=config.ai.moonshot.temperature,
+            max_tokens=config.ai.moonshot.max_tokens,
+            http_client=http_client
         )
         self.tts_model = dashscope_config.tts_model
         self.asr_model = dashscope_config.asr_model
 
-    async def text_to_speech(self, text: str, voice: str = "zhichu") -> bytes:
+    async def text_to_speech(self, text: str, voice: str = "zhichu", timeout: Any = HTTP_TIMEOUT) -> bytes:
         """文本转语音"""
         try:
             # 调用DashScope TTS API
-            response = self.client.audio.speech.create(
+            response = await self.client.audio.speech.create(
                 model=self.tts_model,
                 voice=voice,
-                input=text
+                input=text,
+                timeout=timeout
             )
             return response.content
 
@@ -105,12 +236,13 @@ class DashScopeClient:
 class MetasoClient:
     """秘塔搜索API客户端"""
 
-    def __init__(self):
+    def __init__(self, http_client: Optional[httpx.AsyncClient] = None):
         config = get_config()
         metaso_config = config.ai.metaso
 
         self.api_key = metaso_config.api_key
         self.base_url = metaso_config.base_url
+        self.http_client = http_client or create_http_client()
 
     async def search(self, query: str, **kwargs) -> Dict[str, Any]:
         """执行搜索"""
@@ -132,7 +264,9 @@ class MetasoClient:
                 'Content-Type': 'application/json'
             }
 
-            response = requests.post(url, headers=headers, data=payload)
+            response = await self.http_client.post(
+                url, headers=headers, content=payload, timeout=kwargs.get("timeout", HTTP_TIMEOUT)
+            )
             response.raise_for_status()
 
             return response.json()
@@ -144,28 +278,207 @@ class MetasoClient:
 class AIClientManager:
     """AI客户端管理器"""
 
+    # 提供商名称到客户端类型的映射，聊天提供商可参与路由
+    CLIENT_TYPES = {
+        "moonshot": MoonshotClient,
+        "dashscope": DashScopeClient,
+        "metaso": MetasoClient
+    }
+    CHAT_PROVIDERS = ("moonshot", "dashscope")
+
     def __init__(self):
-        self.moonshot = MoonshotClient()
-        self.dashscope = DashScopeClient()
-        self.metas = MetasoClient()
-
-    async def chat_completion(self, messages: List[Dict], provider: str = "moonshot", **kwargs) -> Dict[str, Any]:
-        """统一的聊天完成接口"""
-        if provider == "moonshot":
-            return await self.moonshot.chat_completion(messages, **kwargs)
-        elif provider == "dashscope":
-            # DashScope也可以做聊天，但这里主要用Moonshot
-            return await self.moonshot.chat_completion(messages, **kwargs)
-        else:
-            raise ValueError(f"不支持的AI提供商: {provider}")
+        # 连接池和各提供商客户端在首次使用时才创建，缩短应用启动时间
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._clients: Dict[str, Any] = {}
+        # 多提供商路由（健康度、故障转移、对冲）
+        self.router = ProviderRouter()
+        self.cache = get_response_cache()
+        # 合并相同的并发请求（聊天、搜索、TTS共享）
+        self.singleflight = SingleFlight()
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """所有提供商共享的连接池"""
+        if self._http_client is None:
+            self._http_client = create_http_client()
+        return self._http_client
+
+    def _client(self, provider: str) -> Any:
+        """获取提供商客户端，首次使用时创建"""
+        client = self._clients.get(provider)
+        if client is None:
+            client = self.CLIENT_TYPES[provider](self.http_client)
+            self._clients[provider] = client
+        return client
+
+    @property
+    def moonshot(self) -> MoonshotClient:
+        return self._client("moonshot")
+
+    @property
+    def dashscope(self) -> DashScopeClient:
+        return self._client("dashscope")
+
+    @property
+    def metas(self) -> MetasoClient:
+        return self._client("metaso")
+
+    def warm_up(self):
+        """预先创建连接池和所有提供商客户端（可选，在应用启动时调用）"""
+        for provider in self.CLIENT_TYPES:
+            self._client(provider)
+
+    async def aclose(self):
+        """关闭共享连接池"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+        self._clients.clear()
+
+    async def chat_completion(self, messages: List[Dict], provider: Optional[str] = None,
+                              cache: Optional[bool] = None, route: Optional[str] = None,
+                              **kwargs) -> Dict[str, Any]:
+        """
+        统一的聊天完成接口
+
+        - **provider**: 指定提供商；为None时按路由策略在多个提供商之间故障转移/对冲
+        - **cache**: True强制使用缓存，False绕过缓存，None按配置决定
+          （温度为0或路由配置了TTL时启用）
+        - **route**: 调用方路由，用于查找路由策略和按路由配置的缓存TTL
+        """
+        policy = self._chat_policy(provider, route)
+        primary = self._client(policy.providers[0])
+
+        request_key = make_cache_key(
+            provider=",".join(policy.providers),
+            model=primary.model,
+            messages=messages,
+            temperature=kwargs.get("temperature", primary.temperature),
+            max_tokens=kwargs.get("max_tokens", primary.max_tokens),
+            tools=kwargs.get("tools")
+        )
+
+        use_cache = self._should_cache(cache, route, kwargs)
+        if use_cache:
+            cached = self.cache.get(request_key)
+            if cached is not None:
+                with track_usage("llm", cached.get("provider", policy.providers[0]),
+                                 cached.get("model", primary.model), cached=True) as usage:
+                    usage.add_usage(cached.get("usage"))
+                return {**cached, "cached": True}
+
+        response = await self.singleflight.do(
+            request_key,
+            lambda: self.router.run(policy, lambda p: self._limited_chat_completion(p, messages, **kwargs)),
+            namespace="chat"
+        )
+
+        if use_cache:
+            self.cache.set(request_key, response, ttl=self._cache_ttl(route))
+
+        return dict(response)
+
+    def _chat_policy(self, provider: Optional[str], route: Optional[str]) -> RouteConfig:
+        """获取路由策略；指定provider时只使用该提供商"""
+        policy = get_route_policy(route)
+        if provider is not None:
+            policy = dataclasses.replace(policy, providers=[provider])
+
+        for name in policy.providers:
+            if name not in self.CHAT_PROVIDERS:
+                raise ValueError(f"不支持的AI提供商: {name}")
+        return policy
+
+    async def _limited_chat_completion(self, provider: str, messages: List[Dict], **kwargs) -> Dict[str, Any]:
+        """经过熔断器和提供商限流器的聊天调用（熔断时不排队，直接失败）"""
+        client = self._client(provider)
+        tokens = estimate_tokens(messages) + kwargs.get("max_tokens", client.max_tokens)
+        with get_breaker(provider).guard():
+            async with get_rate_limiter(provider).aslot(tokens):
+                timeout = dependency_timeout(provider)
+                with track_usage("llm", provider, client.model) as usage:
+                    response = await client.chat_completion(messages, timeout=timeout, **kwargs)
+                    usage.add_usage(response.get("usage"))
+                return response
+
+    async def _limited_chat_stream(self, provider: str, messages: List[Dict], **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """经过熔断器和提供商限流器的流式聊天调用"""
+        client = self._client(provider)
+        tokens = estimate_tokens(messages) + kwargs.get("max_tokens", client.max_tokens)
+        with get_breaker(provider).guard():
+            async with get_rate_limiter(provider).aslot(tokens):
+                timeout = dependency_timeout(provider)
+                with track_usage("llm", provider, client.model) as usage:
+                    async for event in client.chat_completion_stream(messages, timeout=timeout, **kwargs):
+                        usage.first_byte()
+                        if event["type"] == "done":
+                            usage.add_usage(event.get("usage"))
+                        yield event
+
+    def _should_cache(self, cache: Optional[bool], route: Optional[str], kwargs: Dict[str, Any]) -> bool:
+        """判断本次请求是否使用响应缓存"""
+        cache_config = get_config().cache
+        if cache is not None:
+            return cache and cache_config.enabled
+        if not cache_config.enabled:
+            return False
+
+        # 确定性请求默认可缓存
+        temperature = kwargs.get("temperature", get_config().ai.moonshot.temperature)
+        return temperature == 0 or (route in cache_config.route_ttls)
+
+    def _cache_ttl(self, route: Optional[str]) -> int:
+        cache_config = get_config().cache
+        return cache_config.route_ttls.get(route, cache_config.default_ttl)
+
+    async def chat_completion_stream(self, messages: List[Dict], provider: Optional[str] = None,
+                                     route: Optional[str] = None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """统一的流式聊天接口（首个token到达前可故障转移/对冲）"""
+        policy = self._chat_policy(provider, route)
+        async for event in self.router.stream(
+            policy, lambda p: self._limited_chat_stream(p, messages, **kwargs)
+        ):
+            yield event
 
     async def text_to_speech(self, text: str, provider: str = "dashscope", **kwargs) -> bytes:
         """统一的文本转语音接口"""
         if provider == "dashscope":
-            return await self.dashscope.text_to_speech(text, **kwargs)
+            request_key = canonical_hash({"provider": provider, "text": text, "kwargs": kwargs})
+            return await self.singleflight.do(
+                request_key,
+                lambda: self._limited_call(
+                    "dashscope", estimate_tokens(text),
+                    lambda timeout: self.dashscope.text_to_speech(text, timeout=timeout, **kwargs),
+                    usage=("tts", self.dashscope.tts_model)
+                ),
+                namespace="tts"
+            )
         else:
             raise ValueError(f"不支持的TTS提供商: {provider}")
 
+    async def _limited_call(self, provider: str, tokens: int, fn, usage: tuple):
+        """
+        在熔断器和提供商限流器的保护下执行异步调用，fn接收本次调用的超时
+
+        - **usage**: 记入用量账本的 (调用类型, 模型)
+        """
+        kind, model = usage
+        with get_breaker(provider).guard():
+            async with get_rate_limiter(provider).aslot(tokens):
+                timeout = dependency_timeout(provider)
+                with track_usage(kind, provider, model):
+                    return await fn(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        """获取客户端运行指标"""
+        return {
+            "cache": self.cache.stats(),
+            "singleflight": self.singleflight.stats(),
+            "rate_limits": get_rate_limit_stats(),
+            "providers": self.router.stats(),
+            "circuit_breakers": get_breaker_stats()
+        }
+
     async def speech_to_text(self, audio_data: bytes, provider: str = "dashscope", **kwargs) -> str:
         """统一的语音转文本接口"""
         if provider == "dashscope":
@@ -176,7 +489,17 @@ class AIClientManager:
     async def search(self, query: str, provider: str = "metaso", **kwargs) -> Dict[str, Any]:
         """统一的搜索接口"""
         if provider == "metaso":
-            return await self.metas.search(query, **kwargs)
+            request_key = canonical_hash({"provider": provider, "query": query, "kwargs": kwargs})
+            response = await self.singleflight.do(
+                request_key,
+                lambda: self._limited_call(
+                    "metaso", 0,
+                    lambda timeout: self.metas.search(query, timeout=timeout, **kwargs),
+                    usage=("search", "metaso-search")
+                ),
+                namespace="search"
+            )
+            return dict(response)
         else:
             raise ValueError(f"不支持的搜索提供商: {provider}")
 
@@ -193,6 +516,14 @@ def get_ai_client() -> AIClientManager:
     return _ai_client
 
 
+async def close_ai_client():
+    """关闭全局AI客户端的连接池"""
+    global _ai_client
+    if _ai_client is not None:
+        await _ai_client.aclose()
+        _ai_client = None
+
+
 # 兼容性函数 - 用于兼容原有代码
 async def chat_completion(messages: List[Dict], **kwargs) -> Dict[str, Any]:
     """兼容性函数：聊天完成"""
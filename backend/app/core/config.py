@@ -6,8 +6,8 @@ AI Agent Floating Ball - Configuration Management
 import json
 import os
 from pathlib import Path
-from typing import Dict, Any, Optional
-from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -27,6 +27,7 @@ class DashScopeConfig:
     base_url: str
     tts_model: str
     asr_model: str
+    chat_model: str = "qwen-plus"
 
 
 @dataclass
@@ -98,6 +99,64 @@ class DataConfig:
     models_dir: str
 
 
+@dataclass
+class CacheConfig:
+    """LLM响应缓存配置"""
+    enabled: bool = True
+    max_entries: int = 512
+    default_ttl: int = 3600
+    disk_enabled: bool = False
+    # 按路由配置TTL（秒），出现在此处的路由即使温度非0也会启用缓存
+    route_ttls: Dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class RateLimitConfig:
+    """单个提供商的限流配置（0表示不限制）"""
+    rpm: int = 0
+    tpm: int = 0
+    max_concurrency: int = 0
+
+
+@dataclass
+class RouteConfig:
+    """聊天路由策略：提供商顺序、单次超时和对冲设置"""
+    providers: List[str] = field(default_factory=lambda: ["moonshot", "dashscope"])
+    timeout: float = 60.0
+    hedge: bool = False
+    hedge_min_delay: float = 0.5
+    hedge_max_delay: float = 8.0
+
+
+@dataclass
+class ResilienceConfig:
+    """外部依赖的熔断与超时配置"""
+    failure_threshold: int = 5
+    reset_timeout: float = 30.0
+    half_open_max_calls: int = 1
+    # 每个HTTP请求的时间预算（秒），出站调用的超时不会超过剩余预算
+    request_budget: float = 120.0
+    # 按依赖配置的默认超时（秒）
+    timeouts: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class UsageConfig:
+    """上游调用用量账本配置"""
+    enabled: bool = True
+    # 账本目录，按天写入 usage-YYYYMMDD.jsonl
+    directory: str = "data/usage"
+
+
+@dataclass
+class AgentConfig:
+    """智能体服务配置（agent_client）"""
+    # 全局同时处理的请求数上限（所有会话合计），按上游模型的并发能力调整
+    max_concurrent_requests: int = 4
+    # 保留的会话数上限，超过时淘汰最久未使用的空闲会话
+    max_sessions: int = 32
+
+
 @dataclass
 class AppConfig:
     """应用配置"""
@@ -112,6 +171,8 @@ class ServerConfig:
     host: str
     port: int
     debug: bool
+    # 启动后在后台预先创建AI客户端、加载分词器，避免首个请求承担初始化开销
+    warm_up: bool = False
 
 
 class Config:
@@ -141,6 +202,18 @@ class Config:
         self.ui = UIConfig(**self._config_data.get("ui", {}))
         self.logging = LoggingConfig(**self._config_data.get("logging", {}))
         self.data = DataConfig(**self._config_data.get("data", {}))
+        self.cache = CacheConfig(**self._config_data.get("cache", {}))
+        self.rate_limits = {
+            provider: RateLimitConfig(**limits)
+            for provider, limits in self._config_data.get("rate_limits", {}).items()
+        }
+        self.routing = {
+            route: RouteConfig(**policy)
+            for route, policy in self._config_data.get("routing", {}).items()
+        }
+        self.resilience = ResilienceConfig(**self._config_data.get("resilience", {}))
+        self.usage = UsageConfig(**self._config_data.get("usage", {}))
+        self.agent = AgentConfig(**self._config_data.get("agent", {}))
 
     def _load_config(self):
         """加载配置文件"""
@@ -175,12 +248,23 @@ class Config:
 
 # 全局配置实例
 _config: Optional[Config] = None
+_env_loaded = False
+
+
+def load_env():
+    """加载根目录下的.env文件（只在第一次调用时加载，不在模块导入时执行）"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
 
 
 def get_config() -> Config:
-    """获取全局配置实例"""
+    """获取全局配置实例（首次调用时同时加载.env）"""
     global _config
     if _config is None:
+        load_env()
         _config = Config()
     return _config
 
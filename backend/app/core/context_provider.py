@@ -0,0 +1,144 @@
+"""
+AI Agent Floating Ball - Context Provider
+用户问题的上下文（当前时间、活跃窗口、当前文件路径）提供者：读取时直接返回缓存，不阻塞提问
+
+- 活跃窗口在后台线程中定期刷新
+- 当前文件路径需要启动PowerShell查询资源管理器，较慢：按窗口缓存，窗口变化时在后台预取；
+  提问时只等待很短的预算，未完成就不附加
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+# 活跃窗口的刷新间隔（秒）
+REFRESH_INTERVAL = 1.0
+# 提问时等待慢速上下文（文件路径）的最长时间（秒）
+ENRICH_BUDGET = 0.3
+# 时间格式（与提示词中使用的格式一致）
+TIME_FORMAT = '%Y.%m.%d %H时%M分%S秒'
+
+
+class ContextProvider:
+    """
+    上下文提供者
+
+        provider = ContextProvider(get_activate_path2, get_activate_path)
+        provider.start()
+        context = await provider.collect()   # {"time": ..., "window": ..., "file_path": ...}
+    """
+
+    def __init__(self, get_window: Callable[[], str], get_file_path: Callable[[], str],
+                 refresh_interval: float = REFRESH_INTERVAL, enrich_budget: float = ENRICH_BUDGET):
+        self.get_window = get_window
+        self.get_file_path = get_file_path
+        self.refresh_interval = refresh_interval
+        self.enrich_budget = enrich_budget
+
+        self._lock = threading.Lock()
+        self._window: Optional[str] = None
+        # 文件路径缓存及其对应的窗口
+        self._file_path = ""
+        self._file_path_window: Optional[str] = None
+        self._file_path_future: Optional[Future] = None
+        self._file_path_future_window: Optional[str] = None
+
+        # 文件路径查询在单独的线程中串行执行，同一时刻最多一个PowerShell
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context")
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """启动后台刷新线程"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._refresh_loop, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def _read_window(self) -> str:
+        try:
+            window = self.get_window() or ""
+        except Exception as e:
+            print(f"获取活跃窗口失败: {e}")
+            window = ""
+        with self._lock:
+            changed = window != self._window
+            self._window = window
+        if changed:
+            # 窗口变化后预取文件路径，提问时通常已经就绪
+            self._prefetch_file_path(window)
+        return window
+
+    def _refresh_loop(self):
+        self._read_window()
+        while not self._stop.wait(self.refresh_interval):
+            self._read_window()
+
+    def _prefetch_file_path(self, window: str) -> Optional[Future]:
+        """确保窗口对应的文件路径已缓存或正在查询；已缓存时返回None"""
+        with self._lock:
+            if self._file_path_window == window:
+                return None
+            if self._file_path_future is not None and self._file_path_future_window == window \
+                    and not self._file_path_future.done():
+                return self._file_path_future
+            if self._file_path_future is not None:
+                # 之前窗口的查询尚未开始时直接取消
+                self._file_path_future.cancel()
+            try:
+                future = self._executor.submit(self._load_file_path, window)
+            except RuntimeError:
+                return None  # 已停止
+            self._file_path_future = future
+            self._file_path_future_window = window
+            return future
+
+    def _load_file_path(self, window: str):
+        with self._lock:
+            # 排队期间窗口已切换，不再查询（Explorer窗口的查询需要调用PowerShell）
+            if self._window != window:
+                return
+        try:
+            file_path = self.get_file_path() or ""
+        except Exception as e:
+            print(f"获取当前文件路径失败: {e}")
+            file_path = ""
+        with self._lock:
+            # 查询期间窗口已切换时结果作废
+            if self._window == window:
+                self._file_path = file_path
+                self._file_path_window = window
+
+    async def collect(self) -> Dict[str, str]:
+        """获取上下文：时间和活跃窗口立即返回，文件路径只在预算内就绪时附加"""
+        with self._lock:
+            window = self._window
+        if window is None:
+            window = await asyncio.to_thread(self._read_window)
+
+        future = self._prefetch_file_path(window)
+        if future is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.enrich_budget)
+            except asyncio.TimeoutError:
+                print(f"当前文件路径未在{self.enrich_budget}秒内就绪，本次不附加")
+            except asyncio.CancelledError:
+                # 查询因窗口切换被取消时不附加文件路径；本任务被取消时继续抛出
+                if not future.cancelled():
+                    raise
+
+        with self._lock:
+            file_path = self._file_path if self._file_path_window == window else ""
+
+        return {
+            "time": datetime.today().strftime(TIME_FORMAT),
+            "window": window,
+            "file_path": file_path
+        }
@@ -0,0 +1,233 @@
+"""
+AI Agent Floating Ball - Intent Router
+本地快速意图路由：“打开微信”“下一首”“关闭标签页”“音量加”这类一句话命令直接映射到MCP工具，
+不经过大模型，毫秒级完成；置信度不够或句子带有额外要求时返回None，交给大模型处理
+
+可路由的应用和动作由调用方传入的表决定（app/services/automation/action_tables.py）：
+- launch_application: APP_COMMANDS
+- control_music_player / control_browser: MUSIC_ACTIONS / BROWSER_ACTIONS
+- execute_keyboard_shortcuts: SHORTCUTS
+本模块只提供这些名称的中文说法，表中新增的应用按名称本身即可打开，新增的动作补充说法后才会被路由
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# 直接调用工具所需的最低置信度
+CONFIDENCE_THRESHOLD = 0.8
+# 最佳匹配与其他意图的次佳匹配至少要拉开的差距，差距太小视为有歧义
+MIN_MARGIN = 0.1
+# 超过该长度（归一化后的字符数）的句子通常带有额外要求，不走快速路径
+MAX_COMMAND_LENGTH = 12
+
+# 启动应用的动词
+LAUNCH_VERBS = ("打开", "启动", "运行", "开启", "开一下")
+
+# 应用的中文名称: 应用名 -> (显示名称, 别名)
+APP_ALIASES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "notepad": ("记事本", ("记事本", "notepad")),
+    "calculator": ("计算器", ("计算器", "calculator")),
+    "explorer": ("资源管理器", ("explorer",)),
+    "cmd": ("命令提示符", ("命令提示符", "命令行", "cmd")),
+    "powershell": ("PowerShell", ("powershell",)),
+    "chrome": ("谷歌浏览器", ("谷歌浏览器", "chrome", "chrome浏览器")),
+    "edge": ("Edge浏览器", ("edge", "edge浏览器", "微软浏览器")),
+    "vscode": ("VS Code", ("vscode", "vs code", "visual studio code")),
+    "word": ("Word", ("word",)),
+    "excel": ("Excel", ("excel",)),
+    "powerpoint": ("PowerPoint", ("powerpoint", "ppt")),
+    "netease": ("网易云音乐", ("网易云音乐", "网易云")),
+    "wechat": ("微信", ("微信", "wechat")),
+    "qq": ("QQ", ("qq",)),
+    "dingtalk": ("钉钉", ("钉钉", "dingtalk")),
+}
+
+# 动作的中文说法: 工具名 -> 动作名 -> (回复中的描述, 触发短语)
+ACTION_PHRASES: Dict[str, Dict[str, Tuple[str, Tuple[str, ...]]]] = {
+    "control_music_player": {
+        "play_pause": ("切换播放/暂停", ("暂停", "播放", "暂停音乐", "播放音乐", "继续播放", "暂停播放", "暂停一下音乐")),
+        "next_song": ("切换到下一首", ("下一首", "下一曲", "下一首歌", "切歌", "换一首", "换首歌")),
+        "previous_song": ("切换到上一首", ("上一首", "上一曲", "上一首歌")),
+        "volume_up": ("调大音量", ("音量加", "音量增大", "音量调高", "调大音量", "大声点", "声音大一点", "大点声")),
+        "volume_down": ("调小音量", ("音量减", "音量减小", "音量调低", "调小音量", "小声点", "声音小一点", "小点声")),
+        "mute": ("切换静音", ("静音", "取消静音")),
+        "like_song": ("收藏当前歌曲", ("喜欢这首歌", "收藏这首歌", "红心这首歌")),
+        "lyrics_toggle": ("切换歌词显示", ("打开歌词", "关闭歌词", "显示歌词", "隐藏歌词")),
+        "shuffle": ("切换随机播放", ("随机播放",)),
+        "repeat": ("切换循环播放", ("单曲循环", "循环播放")),
+        "mini_mode": ("切换迷你模式", ("迷你模式",)),
+    },
+    "control_browser": {
+        "new_tab": ("新建标签页", ("新建标签页", "新建标签", "打开新标签页", "新标签页")),
+        "close_tab": ("关闭标签页", ("关闭标签页", "关闭标签", "关掉标签页", "关闭当前标签页", "关闭这个标签页")),
+        "next_tab": ("切换到下一个标签页", ("下一个标签页", "下一个标签")),
+        "previous_tab": ("切换到上一个标签页", ("上一个标签页", "上一个标签")),
+        "reopen_closed_tab": ("恢复关闭的标签页", ("恢复标签页", "重新打开关闭的标签页", "恢复关闭的标签页")),
+        "refresh": ("刷新页面", ("刷新", "刷新页面", "刷新网页", "刷新一下")),
+        "hard_refresh": ("强制刷新页面", ("强制刷新", "强制刷新页面")),
+        "back": ("后退", ("后退", "返回上一页", "网页后退")),
+        "forward": ("前进", ("前进", "网页前进")),
+        "history": ("打开历史记录", ("历史记录", "打开历史记录")),
+        "downloads": ("打开下载", ("打开下载", "打开下载内容", "下载列表")),
+        "bookmarks": ("打开书签", ("书签", "打开书签")),
+        "fullscreen": ("切换全屏", ("全屏", "退出全屏", "网页全屏")),
+        "zoom_in": ("放大页面", ("放大页面", "放大网页")),
+        "zoom_out": ("缩小页面", ("缩小页面", "缩小网页")),
+        "reset_zoom": ("重置缩放", ("重置缩放", "恢复缩放")),
+    },
+    "execute_keyboard_shortcuts": {
+        "lock_screen": ("锁定屏幕", ("锁屏", "锁定屏幕", "锁定电脑")),
+        "task_manager": ("打开任务管理器", ("任务管理器", "打开任务管理器")),
+        "file_explorer": ("打开资源管理器", ("打开资源管理器", "打开文件资源管理器", "打开此电脑", "打开我的电脑")),
+        "settings": ("打开系统设置", ("打开设置", "打开系统设置", "系统设置")),
+        "run_dialog": ("打开运行窗口", ("打开运行", "打开运行窗口")),
+        "notifications": ("打开通知中心", ("通知中心", "打开通知中心")),
+        "show_desktop": ("显示桌面", ("显示桌面", "回到桌面", "返回桌面")),
+        "minimize_all": ("最小化所有窗口", ("最小化所有窗口", "全部最小化")),
+        "maximize_window": ("最大化窗口", ("最大化窗口", "窗口最大化", "最大化")),
+        "minimize_window": ("最小化窗口", ("最小化窗口", "窗口最小化", "最小化")),
+        "task_view": ("打开任务视图", ("任务视图", "打开任务视图")),
+        "new_virtual_desktop": ("新建虚拟桌面", ("新建虚拟桌面", "新建桌面")),
+        "copy": ("复制", ("复制",)),
+        "cut": ("剪切", ("剪切",)),
+        "paste": ("粘贴", ("粘贴",)),
+        "undo": ("撤销", ("撤销", "撤回")),
+        "redo": ("重做", ("重做",)),
+        "select_all": ("全选", ("全选",)),
+        "save": ("保存", ("保存", "保存文件")),
+        "screenshot_rectangular": ("打开区域截图", ("截图", "截屏", "区域截图")),
+        "screen_recording": ("开始录屏", ("录屏", "开始录屏")),
+    },
+}
+
+# 句首的称呼、客套话和句尾的语气词，匹配前去掉
+_PREFIX_PATTERN = re.compile(r"^(?:[贾艾简]维斯|jarvis|请你|请|麻烦你|麻烦|帮我|给我|替我|你|把)+")
+_SUFFIX_PATTERN = re.compile(r"(?:一下子|一下|吧|呀|啊|哦|呢|了|谢谢)+$")
+_PUNCTUATION_PATTERN = re.compile(r"[\s，。！？、,.!?~～…：:；;\"'“”‘’]+")
+# 否定或组合命令，不走快速路径
+_REJECT_PATTERN = re.compile(r"不要|别|不用|然后|并|再|之后|同时|如果")
+
+
+def normalize(text: str) -> str:
+    """统一大小写，去掉标点、称呼、客套话和语气词"""
+    text = _PUNCTUATION_PATTERN.sub("", text.lower())
+    previous = None
+    while text != previous:
+        previous = text
+        text = _SUFFIX_PATTERN.sub("", _PREFIX_PATTERN.sub("", text))
+    return text
+
+
+def _bigrams(text: str) -> Set[str]:
+    if len(text) < 2:
+        return {text}
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+@dataclass
+class Intent:
+    """路由结果：要直接调用的工具及参数"""
+    tool: str
+    arguments: Dict[str, Any]
+    label: str
+    confidence: float = 1.0
+    phrase: str = ""
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.tool, repr(sorted(self.arguments.items()))
+
+
+@dataclass
+class _Phrase:
+    text: str
+    intent: Intent
+    bigrams: Set[str] = field(default_factory=set)
+
+
+class IntentRouter:
+    """
+    本地意图路由
+
+        router = IntentRouter(APP_COMMANDS, {"control_music_player": MUSIC_ACTIONS, ...})
+        intent = router.route("下一首", tool_names)   # Intent 或 None
+        if intent:
+            await session.call_tool(intent.tool, intent.arguments)
+
+    apps为预定义应用名，actions为动作型工具名 -> 动作名，只为表中存在的名称建立短语
+    """
+
+    def __init__(self, apps: Iterable[str], actions: Dict[str, Iterable[str]],
+                 threshold: float = CONFIDENCE_THRESHOLD, min_margin: float = MIN_MARGIN,
+                 max_length: int = MAX_COMMAND_LENGTH):
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.max_length = max_length
+        self._phrases: List[_Phrase] = []
+        self._exact: Dict[str, Intent] = {}
+
+        for app in apps:
+            label, aliases = APP_ALIASES.get(app, (app, ()))
+            intent = Intent("launch_application", {"app_name": app}, "打开" + label)
+            for alias in aliases + (app,):
+                for verb in LAUNCH_VERBS:
+                    self._add(verb + alias, intent)
+
+        for tool, names in actions.items():
+            phrases_by_action = ACTION_PHRASES.get(tool, {})
+            for action in names:
+                if action not in phrases_by_action:
+                    continue
+                label, phrases = phrases_by_action[action]
+                intent = Intent(tool, {"actions": [action]}, label)
+                for phrase in phrases:
+                    self._add(phrase, intent)
+
+    def _add(self, phrase: str, intent: Intent):
+        text = normalize(phrase)
+        # 同一短语只保留第一个意图（工具表的顺序即优先级）
+        if text and text not in self._exact:
+            self._exact[text] = intent
+            self._phrases.append(_Phrase(text, intent, _bigrams(text)))
+
+    def classify(self, text: str, tool_names: Optional[Iterable[str]] = None) -> Optional[Intent]:
+        """返回最可能的意图及置信度（不做阈值判断）；句子为空、过长、否定或组合命令时返回None"""
+        text = normalize(text)
+        if not text or len(text) > self.max_length or _REJECT_PATTERN.search(text):
+            return None
+        available = set(tool_names) if tool_names is not None else None
+
+        intent = self._exact.get(text)
+        if intent is not None:
+            if available is not None and intent.tool not in available:
+                return None
+            return Intent(intent.tool, intent.arguments, intent.label, 1.0, text)
+
+        # 与所有短语做相似度打分，取最佳意图，并以与其他意图的差距衡量歧义
+        grams = _bigrams(text)
+        scores: Dict[Tuple[str, str], Tuple[float, _Phrase]] = {}
+        for phrase in self._phrases:
+            if available is not None and phrase.intent.tool not in available:
+                continue
+            score = 2 * len(grams & phrase.bigrams) / (len(grams) + len(phrase.bigrams))
+            key = phrase.intent.key
+            if key not in scores or score > scores[key][0]:
+                scores[key] = (score, phrase)
+        if not scores:
+            return None
+
+        ranked = sorted(scores.values(), key=lambda item: item[0], reverse=True)
+        best_score, best = ranked[0]
+        runner_up = ranked[1][0] if len(ranked) > 1 else 0.0
+        confidence = best_score if best_score - runner_up >= self.min_margin else best_score - self.min_margin
+        return Intent(best.intent.tool, best.intent.arguments, best.intent.label, max(confidence, 0.0), best.text)
+
+    def route(self, text: str, tool_names: Optional[Iterable[str]] = None) -> Optional[Intent]:
+        """置信度达到阈值时返回意图，否则返回None（交给大模型）"""
+        intent = self.classify(text, tool_names)
+        if intent is None or intent.confidence < self.threshold:
+            return None
+        return intent
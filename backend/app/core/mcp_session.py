@@ -0,0 +1,184 @@
+"""
+AI Agent Floating Ball - MCP Session
+长连接的MCP会话：启动时连接一次并保持心跳，断开后按退避间隔自动重连；
+工具目录按schema哈希缓存，只在服务端发出tools/list_changed通知或重连后才重新拉取
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from fastmcp import Client
+
+# 心跳间隔（秒）
+KEEPALIVE_INTERVAL = 30.0
+# 重连退避的初始和最大间隔（秒）
+INITIAL_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+# 服务端通知工具列表变化的方法名
+TOOLS_CHANGED_METHOD = "notifications/tools/list_changed"
+
+
+def tool_to_openai(tool: Any) -> Dict[str, Any]:
+    """MCP工具定义转换为OpenAI兼容的function工具"""
+    return {
+        "type": "function",
+        "function": {
+            "name": tool.name,
+            "description": tool.description,
+            "parameters": tool.inputSchema
+        }
+    }
+
+
+def catalog_hash(tools: List[Dict[str, Any]]) -> str:
+    """工具目录的schema哈希（与顺序无关）"""
+    payload = json.dumps(sorted(tools, key=lambda t: t["function"]["name"]), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MCPSession:
+    """
+    长连接MCP会话
+
+        session = MCPSession("http://localhost:9000/mcp")
+        await session.connect()
+        tools = await session.list_tools()       # OpenAI格式，已缓存
+        result = await session.call_tool(name, args)
+        await session.close()
+
+    工具调用失败不会自动重试（工具可能有副作用），只把连接标记为断开，下次调用前重连
+    """
+
+    def __init__(self, url: str, keepalive_interval: float = KEEPALIVE_INTERVAL,
+                 max_backoff: float = MAX_BACKOFF):
+        self.url = url
+        self.keepalive_interval = keepalive_interval
+        self.max_backoff = max_backoff
+        self.client = Client(url, message_handler=self._on_message)
+
+        self._connected = False
+        self._connect_lock = asyncio.Lock()
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+        self._tools: List[Dict[str, Any]] = []
+        self._catalog_hash: Optional[str] = None
+        self._catalog_stale = True
+
+    @property
+    def connected(self) -> bool:
+        return self._connected
+
+    @property
+    def catalog_hash(self) -> Optional[str]:
+        """当前工具目录的哈希，目录未变化时保持不变，可作为下游缓存的键"""
+        return self._catalog_hash
+
+    async def _on_message(self, message: Any):
+        root = getattr(message, "root", message)
+        if getattr(root, "method", None) == TOOLS_CHANGED_METHOD:
+            print("MCP服务端工具列表已变化，下次使用前刷新")
+            self._catalog_stale = True
+
+    async def connect(self, retries: Optional[int] = None):
+        """建立连接（失败时按指数退避重试，retries为None时一直重试）并启动心跳"""
+        async with self._connect_lock:
+            if self._connected:
+                return
+            backoff = INITIAL_BACKOFF
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    await self.client.__aenter__()
+                    self._connected = True
+                    # 重连后服务端可能已经变化，重新核对工具目录
+                    self._catalog_stale = True
+                    print(f"已连接MCP服务器: {self.url}")
+                    break
+                except Exception as e:
+                    if retries is not None and attempt > retries:
+                        raise
+                    print(f"连接MCP服务器失败（{e}），{backoff:.1f}秒后重试")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def _disconnect(self):
+        if not self._connected:
+            return
+        self._connected = False
+        try:
+            await self.client.__aexit__(None, None, None)
+        except Exception as e:
+            print(f"关闭MCP连接时出错: {e}")
+
+    async def _reconnect(self):
+        async with self._connect_lock:
+            await self._disconnect()
+        await self.connect()
+
+    async def _keepalive(self):
+        """定期ping，发现连接断开时重连"""
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if not self._connected:
+                continue
+            try:
+                alive = await asyncio.wait_for(self.client.ping(), timeout=self.keepalive_interval)
+            except Exception:
+                alive = False
+            if not alive:
+                print("MCP连接心跳失败，正在重连")
+                await self._reconnect()
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
+        async with self._connect_lock:
+            await self._disconnect()
+
+    async def _ensure_connected(self):
+        if not self._connected:
+            await self.connect()
+
+    async def list_tools(self) -> List[Dict[str, Any]]:
+        """获取OpenAI格式的工具目录；目录未变化时直接返回缓存"""
+        if not self._catalog_stale and self._catalog_hash is not None:
+            return self._tools
+
+        await self._ensure_connected()
+        try:
+            tools = [tool_to_openai(tool) for tool in await self.client.list_tools()]
+        except Exception:
+            if not self.client.is_connected():
+                await self._disconnect()
+            raise
+        self._catalog_stale = False
+
+        new_hash = catalog_hash(tools)
+        if new_hash != self._catalog_hash:
+            if self._catalog_hash is not None:
+                print(f"MCP工具目录已更新，共{len(tools)}个工具")
+            self._tools = tools
+            self._catalog_hash = new_hash
+        return self._tools
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], timeout: Optional[float] = None):
+        """调用工具；连接层错误会把连接标记为断开，下次调用前重连"""
+        await self._ensure_connected()
+        try:
+            return await self.client.call_tool(name, arguments, timeout=timeout)
+        except (ConnectionError, OSError):
+            await self._disconnect()
+            raise
+        except Exception:
+            if not self.client.is_connected():
+                await self._disconnect()
+            raise
@@ -0,0 +1,229 @@
+"""
+AI Agent Floating Ball - Plan Cache
+工具调用计划缓存：按 归一化后的指令 + 上下文类别（活跃软件类型）+ 工具目录哈希 记录上次成功执行的工具调用序列，
+同样的指令再次出现时直接按计划调用工具，不再让模型重新规划
+
+- 参数固定的计划（如“打开网易云并播放”）直接重放；工具结果与上次相同时复用上次的回答
+- 参数依赖内容的计划（如“把这个表格转成Excel”）只把计划交给廉价模型核对参数后执行
+
+缓存保存在plan_cache.json中，重启后仍然有效
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    from .intent_router import _bigrams, normalize
+except ImportError:
+    from intent_router import _bigrams, normalize
+
+# 缓存文件
+PLAN_CACHE_FILE = "plan_cache.json"
+# 最多缓存的计划数
+MAX_PLANS = 128
+# 计划的有效期（秒），过期后重新规划
+PLAN_TTL = 7 * 24 * 3600
+# 字符串参数超过该长度时视为由内容生成（如Markdown表格、文稿）
+CONTENT_ARG_LENGTH = 32
+# 指令中指代屏幕/选中内容、当前文件窗口或之前对话的词，出现时参数通常依赖内容
+_CONTENT_REFERENCE = re.compile(r"这个|这段|这些|这张|这篇|这份|当前|上面|下面|刚才|选中|屏幕上|图片|图中|截图|那个|它|再|继续")
+# 工具的固定选项（如 play、next、ctrl+w），视为由指令含义确定
+_OPTION_ARGUMENT = re.compile(r"^[A-Za-z0-9_+\-]{1,24}$")
+# 提问上下文中可能被工具参数引用的字段
+CONTEXT_FIELDS = ("window", "file_path")
+# 参数中至少有该比例的字符二元组出现在指令中时，视为取自指令
+MIN_INSTRUCTION_OVERLAP = 0.5
+
+# 活跃窗口标题中的关键词 -> 上下文类别
+CONTEXT_CLASSES = {
+    "browser": ("chrome", "edge", "firefox", "浏览器"),
+    "music": ("网易云", "cloudmusic", "qq音乐", "酷狗", "spotify"),
+    "office": ("word", "excel", "powerpoint", "wps"),
+    "editor": ("visual studio code", "vscode", "pycharm", "记事本", "notepad"),
+    "explorer": ("资源管理器", "explorer"),
+    "chat": ("微信", "wechat", "qq", "钉钉", "dingtalk"),
+}
+
+
+def context_class(window: str) -> str:
+    """活跃窗口标题归类为软件类型，未识别时为other"""
+    window = (window or "").lower()
+    for name, keywords in CONTEXT_CLASSES.items():
+        if any(keyword in window for keyword in keywords):
+            return name
+    return "other"
+
+
+@dataclass
+class PlanStep:
+    """计划中的一次工具调用及上次的结果"""
+    tool: str
+    arguments: Dict[str, Any]
+    result: str = ""
+
+
+@dataclass
+class Plan:
+    """一条指令的工具调用计划：groups中每组对应模型的一步，组内并发、组间顺序执行"""
+    instruction: str
+    groups: List[List[PlanStep]]
+    answer: str
+    content_dependent: bool = False
+    created_at: float = field(default_factory=time.time)
+    hits: int = 0
+
+    @property
+    def tools(self) -> List[str]:
+        return [step.tool for group in self.groups for step in group]
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Plan":
+        groups = [[PlanStep(**step) for step in group] for group in data.pop("groups")]
+        return cls(groups=groups, **data)
+
+
+def _from_instruction(value: str, instruction: str) -> bool:
+    """字符串参数能否由指令文本得到：固定选项、指令中的原文或与指令大部分重合的名称（如 网易云 -> 网易云音乐）"""
+    if _OPTION_ARGUMENT.match(value):
+        return True
+    text = value.strip().lower()
+    if not text or text in instruction:
+        return True
+    grams = _bigrams(text)
+    return len(grams & _bigrams(instruction)) >= MIN_INSTRUCTION_OVERLAP * len(grams)
+
+
+def _is_content_argument(value: Any, instruction: str, context: List[str]) -> bool:
+    if isinstance(value, str):
+        if len(value) > CONTENT_ARG_LENGTH or "\n" in value:
+            return True
+        text = value.strip().lower()
+        # 取自提问上下文（当前文件路径、窗口标题）的参数下次可能不同
+        if text and any(item in text or (len(text) > 4 and text in item) for item in context):
+            return True
+        return not _from_instruction(value, instruction)
+    if isinstance(value, (list, tuple)):
+        return any(_is_content_argument(item, instruction, context) for item in value)
+    if isinstance(value, dict):
+        return any(_is_content_argument(item, instruction, context) for item in value.values())
+    return False
+
+
+def is_content_dependent(instruction: str, groups: List[List[PlanStep]], with_image: bool = False,
+                         context: Optional[Dict[str, str]] = None) -> bool:
+    """
+    计划的参数是否依赖内容：图片、选中内容、由模型生成的长文本，
+    或取自提问上下文（context中的文件路径、窗口标题）/无法由指令文本得到的参数
+    """
+    if with_image or _CONTENT_REFERENCE.search(instruction):
+        return True
+    instruction = instruction.lower()
+    values = [str((context or {}).get(name) or "").strip().lower() for name in CONTEXT_FIELDS]
+    values = [item for item in values if len(item) >= 2]
+    return any(_is_content_argument(step.arguments, instruction, values) for group in groups for step in group)
+
+
+class PlanCache:
+    """
+    工具调用计划缓存
+
+        cache = PlanCache()
+        key = cache.key(instruction, window, session.catalog_hash)
+        plan = cache.get(key)            # Plan 或 None
+        cache.put(key, instruction, groups, answer, with_image=False, context=context)
+        cache.invalidate(key)            # 重放失败时
+    """
+
+    def __init__(self, path: Optional[str] = PLAN_CACHE_FILE, max_plans: int = MAX_PLANS, ttl: float = PLAN_TTL):
+        self.path = path
+        self.max_plans = max_plans
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._plans: "OrderedDict[str, Plan]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def __contains__(self, key: Optional[str]) -> bool:
+        """是否有该键的有效计划（不计入命中统计）"""
+        with self._lock:
+            plan = self._plans.get(key) if key is not None else None
+            return plan is not None and time.time() - plan.created_at <= self.ttl
+
+    @staticmethod
+    def key(instruction: str, window: str, catalog: Optional[str]) -> Optional[str]:
+        """缓存键；指令为空或工具目录未知时返回None（不缓存）"""
+        text = normalize(instruction)
+        if not text or not catalog:
+            return None
+        return f"{context_class(window)}|{catalog[:16]}|{text}"
+
+    def get(self, key: Optional[str]) -> Optional[Plan]:
+        if key is None:
+            return None
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None and time.time() - plan.created_at > self.ttl:
+                del self._plans[key]
+                plan = None
+            if plan is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            plan.hits += 1
+            self._plans.move_to_end(key)
+            return plan
+
+    def put(self, key: Optional[str], instruction: str, groups: List[List[PlanStep]], answer: str,
+            with_image: bool = False, context: Optional[Dict[str, str]] = None):
+        """记录成功的计划；没有工具调用时不缓存（直接回答的问题交给模型）。context为提问时注入的上下文"""
+        groups = [group for group in groups if group]
+        if key is None or not groups:
+            return
+        plan = Plan(instruction, groups, answer, is_content_dependent(instruction, groups, with_image, context))
+        with self._lock:
+            previous = self._plans.pop(key, None)
+            if previous is not None:
+                plan.hits = previous.hits
+            self._plans[key] = plan
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        self._save()
+
+    def invalidate(self, key: Optional[str]):
+        with self._lock:
+            removed = self._plans.pop(key, None) if key is not None else None
+        if removed is not None:
+            self._save()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, plan in data.items():
+                self._plans[key] = Plan.from_dict(plan)
+        except Exception as e:
+            print(f"读取计划缓存失败，将重新记录: {e}")
+            self._plans.clear()
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            data = {key: asdict(plan) for key, plan in self._plans.items()}
+        # 先写临时文件再替换，避免写到一半时被读取
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"保存计划缓存失败: {e}")
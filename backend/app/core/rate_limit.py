@@ -0,0 +1,237 @@
+"""
+AI Agent Floating Ball - Provider Rate Limiter
+按提供商的并发控制与令牌桶限流（请求数/估算token数），同时支持线程和协程调用方
+"""
+
+import asyncio
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from typing import Any, Dict, List, Optional, Union
+
+try:
+    from .config import get_config
+    from .token_budget import count_tokens
+except ImportError:
+    # 作为独立脚本（tts等）导入时
+    from config import get_config
+    from token_budget import count_tokens
+
+
+# 等待队首或并发槽位时的轮询间隔（秒）
+POLL_INTERVAL = 0.02
+
+
+def estimate_tokens(content: Union[str, List[Dict], None]) -> int:
+    """估算文本或消息列表的token数（用于TPM限流）"""
+    if not content:
+        return 0
+    if isinstance(content, str):
+        return max(1, count_tokens(content))
+
+    total = 0
+    for message in content:
+        value = message.get("content", "") if isinstance(message, dict) else message
+        total += estimate_tokens(value if isinstance(value, str) else str(value))
+    return total
+
+
+class TokenBucket:
+    """令牌桶，按每分钟速率匀速补充"""
+
+    def __init__(self, per_minute: int, capacity: Optional[int] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: int, now: float) -> float:
+        """距离能够扣除amount个令牌还需等待的秒数"""
+        self._refill(now)
+        need = min(amount, self.capacity)
+        if self.tokens >= need:
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+    def consume(self, amount: int):
+        self.tokens -= min(amount, self.capacity)
+
+
+class ProviderLimiter:
+    """
+    单个提供商的限流器
+
+    - 请求令牌桶（RPM）与token令牌桶（TPM），速率<=0表示不限制
+    - 并发信号量，限制同时在途的请求数
+    - 调用方按到达顺序（FIFO）排队，只有队首能获取配额
+    """
+
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0, max_concurrency: int = 0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.request_bucket = TokenBucket(rpm) if rpm > 0 else None
+        self.token_bucket = TokenBucket(tpm) if tpm > 0 else None
+
+        self._lock = threading.Lock()
+        self._queue: deque = deque()
+        self._tickets = itertools.count()
+        self._in_flight = 0
+
+        self._acquired = 0
+        self._throttled = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._recent_waits: deque = deque(maxlen=500)
+
+    def _enqueue(self) -> int:
+        with self._lock:
+            ticket = next(self._tickets)
+            self._queue.append(ticket)
+            return ticket
+
+    def _dequeue(self, ticket: int):
+        """放弃排队（超时或被取消）"""
+        with self._lock:
+            try:
+                self._queue.remove(ticket)
+            except ValueError:
+                pass
+
+    def _try_acquire(self, ticket: int, tokens: int) -> float:
+        """尝试获取配额，成功返回0，否则返回建议等待的秒数"""
+        with self._lock:
+            if self._queue[0] != ticket:
+                return POLL_INTERVAL
+            if self.max_concurrency > 0 and self._in_flight >= self.max_concurrency:
+                return POLL_INTERVAL
+
+            now = time.monotonic()
+            wait = 0.0
+            if self.request_bucket:
+                wait = max(wait, self.request_bucket.wait_time(1, now))
+            if self.token_bucket and tokens > 0:
+                wait = max(wait, self.token_bucket.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+
+            if self.request_bucket:
+                self.request_bucket.consume(1)
+            if self.token_bucket and tokens > 0:
+                self.token_bucket.consume(tokens)
+            self._queue.popleft()
+            self._in_flight += 1
+            return 0.0
+
+    def _record_wait(self, waited: float):
+        with self._lock:
+            self._acquired += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._recent_waits.append(waited)
+            if waited > POLL_INTERVAL:
+                self._throttled += 1
+
+    def acquire(self, tokens: int = 0):
+        """阻塞获取配额（线程调用方）"""
+        ticket = self._enqueue()
+        start = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, tokens)
+                if wait == 0:
+                    break
+                time.sleep(min(wait, 1.0))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    async def acquire_async(self, tokens: int = 0):
+        """异步获取配额（协程调用方）"""
+        ticket = self._enqueue()
+        start = time.monotonic()
+        try:
+            while True:
+                wait = self._try_acquire(ticket, tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, 1.0))
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        self._record_wait(time.monotonic() - start)
+
+    def release(self):
+        """释放并发槽位"""
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    @contextmanager
+    def slot(self, tokens: int = 0):
+        """同步上下文：with limiter.slot(tokens): ..."""
+        self.acquire(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int = 0):
+        """异步上下文：async with limiter.aslot(tokens): ..."""
+        await self.acquire_async(tokens)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取排队深度与等待时间指标"""
+        with self._lock:
+            waits = sorted(self._recent_waits)
+            return {
+                "queue_depth": len(self._queue),
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "acquired": self._acquired,
+                "throttled": self._throttled,
+                "avg_wait": round(self._total_wait / self._acquired, 4) if self._acquired else 0.0,
+                "p95_wait": round(waits[int(len(waits) * 0.95) - 1], 4) if waits else 0.0,
+                "max_wait": round(self._max_wait, 4)
+            }
+
+
+# 全局限流器
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> ProviderLimiter:
+    """获取指定提供商的限流器（按config.json中的rate_limits配置创建）"""
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limit_config = get_config().rate_limits.get(provider)
+            if limit_config is None:
+                limiter = ProviderLimiter(provider)
+            else:
+                limiter = ProviderLimiter(
+                    provider,
+                    rpm=limit_config.rpm,
+                    tpm=limit_config.tpm,
+                    max_concurrency=limit_config.max_concurrency
+                )
+            _limiters[provider] = limiter
+        return limiter
+
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有提供商的限流指标"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
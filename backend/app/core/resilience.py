@@ -0,0 +1,245 @@
+"""
+AI Agent Floating Ball - Resilience
+外部依赖的熔断器与基于截止时间的超时：上游挂起或持续失败时快速失败，不再长期占用工作线程
+"""
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+from .config import get_config
+
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 未单独配置的依赖使用的默认超时（秒）
+DEFAULT_TIMEOUT = 30.0
+# 剩余预算低于该值时视为截止时间已到（秒）
+MIN_TIMEOUT = 0.05
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被快速拒绝；retryable=True使路由可以切换到其他提供商"""
+
+    retryable = True
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"依赖 {name} 已熔断，{retry_after:.1f}秒后重试")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(TimeoutError):
+    """调用方的时间预算已经用完（与依赖是否健康无关，不计入熔断）"""
+
+    retryable = False
+
+
+def is_dependency_failure(error: BaseException) -> bool:
+    """
+    判断异常是否应计入熔断失败
+
+    取消/退出不计入；4xx（429除外）或retryable=False的错误说明依赖本身可用，也不计入
+    """
+    if not isinstance(error, Exception):
+        return False
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return False
+    return bool(getattr(error, "retryable", True))
+
+
+class CircuitBreaker:
+    """
+    单个外部依赖的熔断器
+
+    - closed：正常放行，连续失败达到阈值后打开
+    - open：直接拒绝调用，reset_timeout秒后进入半开
+    - half_open：只放行少量探测调用，成功则关闭，失败则重新打开
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+
+        self._successes = 0
+        self._failures = 0
+        self._rejected = 0
+        self._opened = 0
+
+    def _current_state(self, now: float) -> str:
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._half_open_calls = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def before_call(self):
+        """调用前检查，熔断时抛出CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == OPEN:
+                self._rejected += 1
+                raise CircuitOpenError(self.name, self.reset_timeout - (now - self._opened_at))
+            if state == HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    self._rejected += 1
+                    raise CircuitOpenError(self.name, 0.0)
+                self._half_open_calls += 1
+
+    def record_success(self):
+        with self._lock:
+            self._successes += 1
+            self._consecutive_failures = 0
+            if self._state != CLOSED:
+                print(f"依赖 {self.name} 已恢复，熔断关闭")
+            self._state = CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._failures += 1
+            self._consecutive_failures += 1
+            state = self._current_state(now)
+            if state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if state != OPEN:
+                    self._opened += 1
+                    print(f"依赖 {self.name} 连续失败{self._consecutive_failures}次，熔断打开{self.reset_timeout}秒")
+                self._state = OPEN
+                self._opened_at = now
+
+    def _release(self):
+        """调用被取消，既不算成功也不算失败，归还半开探测名额"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._half_open_calls = max(0, self._half_open_calls - 1)
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """with breaker.guard(): ...（同步和异步代码中均可使用）"""
+        self.before_call()
+        try:
+            yield
+        except BaseException as e:
+            if is_dependency_failure(e):
+                self.record_failure()
+            elif isinstance(e, Exception):
+                self.record_success()
+            else:
+                self._release()
+            raise
+        self.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self._current_state(time.monotonic()),
+                "consecutive_failures": self._consecutive_failures,
+                "successes": self._successes,
+                "failures": self._failures,
+                "rejected": self._rejected,
+                "opened": self._opened
+            }
+
+
+# 调用方的截止时间（time.monotonic()），随上下文传播到子任务和线程池
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float) -> Iterator[None]:
+    """在该上下文内设置时间预算；嵌套时取更早的截止时间"""
+    value = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        value = min(value, current)
+    token = _deadline.set(value)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """调用方剩余的时间预算（秒），未设置截止时间时返回None"""
+    value = _deadline.get()
+    if value is None:
+        return None
+    return value - time.monotonic()
+
+
+def timeout_for(default: float) -> float:
+    """本次调用应使用的超时：依赖默认超时与调用方剩余预算中较小者"""
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    if remaining <= MIN_TIMEOUT:
+        raise DeadlineExceeded("调用方时间预算已用完")
+    return min(default, remaining)
+
+
+def dependency_timeout(name: str) -> float:
+    """按config.json中resilience.timeouts配置推导依赖的超时"""
+    return timeout_for(get_config().resilience.timeouts.get(name, DEFAULT_TIMEOUT))
+
+
+# 全局熔断器
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取指定依赖的熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            resilience_config = get_config().resilience
+            breaker = CircuitBreaker(
+                name,
+                failure_threshold=resilience_config.failure_threshold,
+                reset_timeout=resilience_config.reset_timeout,
+                half_open_max_calls=resilience_config.half_open_max_calls
+            )
+            _breakers[name] = breaker
+        return breaker
+
+
+def get_breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """获取所有依赖的熔断状态"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
+
+
+@contextmanager
+def protect(name: str) -> Iterator[float]:
+    """
+    保护一次外部依赖调用：熔断检查 + 推导超时
+
+        with protect("ip_api") as timeout:
+            requests.get(url, timeout=timeout)
+    """
+    timeout = dependency_timeout(name)
+    with get_breaker(name).guard():
+        yield timeout
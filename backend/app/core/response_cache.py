@@ -0,0 +1,164 @@
+"""
+AI Agent Floating Ball - LLM Response Cache
+LLM响应缓存：内存LRU + 可选磁盘层，支持TTL与命中统计
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+from .config import get_config
+
+
+def canonical_hash(payload: Dict[str, Any]) -> str:
+    """对请求参数做规范化JSON序列化后取sha256"""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(provider: str, model: str, messages: List[Dict], temperature: Optional[float] = None,
+                   max_tokens: Optional[int] = None, tools: Optional[List[Dict]] = None) -> str:
+    """根据聊天请求参数生成规范化的缓存键"""
+    return canonical_hash({
+        "provider": provider,
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "tools": tools
+    })
+
+
+class ResponseCache:
+    """带TTL的LRU响应缓存"""
+
+    def __init__(self, max_entries: int = 512, default_ttl: int = 3600, disk_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，过期或不存在时返回None"""
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._entries[key]
+
+        # 内存未命中时查询磁盘层
+        disk_entry = self._read_disk(key)
+        if disk_entry is not None and disk_entry["expires_at"] > now:
+            with self._lock:
+                self._store(key, disk_entry["expires_at"], disk_entry["value"])
+                self._stats["disk_hits"] += 1
+            return disk_entry["value"]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: Optional[int] = None):
+        """写入缓存"""
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+
+        with self._lock:
+            self._store(key, expires_at, value)
+            self._stats["sets"] += 1
+
+        self._write_disk(key, expires_at, value)
+
+    def clear(self):
+        """清空缓存（包括磁盘层）"""
+        with self._lock:
+            self._entries.clear()
+
+        if self.disk_dir and self.disk_dir.exists():
+            for path in self.disk_dir.glob("*/*.json"):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        """获取命中统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["disk_enabled"] = self.disk_dir is not None
+        return stats
+
+    def _store(self, key: str, expires_at: float, value: Dict[str, Any]):
+        """写入内存层并按LRU淘汰（调用方持有锁）"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_disk(self, key: str, expires_at: float, value: Dict[str, Any]):
+        if not self.disk_dir:
+            return
+
+        try:
+            path = self._disk_path(key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # 先写临时文件再替换，避免读到半写入的内容
+            tmp_path = path.with_suffix(".tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+            tmp_path.replace(path)
+        except (OSError, TypeError) as e:
+            print(f"写入磁盘缓存失败: {e}")
+
+
+# 全局缓存实例
+_response_cache: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> ResponseCache:
+    """获取全局响应缓存实例"""
+    global _response_cache
+    if _response_cache is None:
+        config = get_config()
+        disk_dir = str(Path(config.data.temp_dir) / "llm_cache") if config.cache.disk_enabled else None
+        _response_cache = ResponseCache(
+            max_entries=config.cache.max_entries,
+            default_ttl=config.cache.default_ttl,
+            disk_dir=disk_dir
+        )
+    return _response_cache
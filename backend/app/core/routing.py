@@ -0,0 +1,287 @@
+"""
+AI Agent Floating Ball - Provider Routing
+多提供商路由：按健康度排序、超时/5xx自动故障转移、可选的对冲请求（hedged request）
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from .config import get_config, RouteConfig
+from .resilience import DeadlineExceeded, get_breaker, is_dependency_failure, timeout_for
+
+
+# 样本数不足时使用的对冲延迟（秒）
+DEFAULT_HEDGE_DELAY = 2.0
+# 判定提供商不健康的最少样本数和错误率
+MIN_HEALTH_SAMPLES = 5
+UNHEALTHY_ERROR_RATE = 0.5
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """超时、连接错误、429和5xx可以切换到下一个提供商；调用方时间预算用完时不再切换"""
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return bool(getattr(error, "retryable", False))
+
+
+async def _wait_bounded(make: Callable[[], Awaitable[Any]], timeout: float, default: float) -> Any:
+    """
+    在timeout内等待make()的结果
+
+    timeout被调用方剩余预算截短（小于依赖默认超时default）时，超时说明调用方预算用完，
+    抛出DeadlineExceeded，不计入提供商的健康度和熔断
+    """
+    try:
+        return await asyncio.wait_for(make(), timeout=timeout)
+    except asyncio.TimeoutError:
+        if timeout < default:
+            raise DeadlineExceeded("调用方时间预算已用完") from None
+        raise
+
+
+class ProviderHealth:
+    """基于最近请求的延迟和错误率的健康度统计"""
+
+    def __init__(self, window: int = 100):
+        self._latencies: deque = deque(maxlen=window)
+        self._outcomes: deque = deque(maxlen=window)
+
+    def record_success(self, latency: float):
+        self._latencies.append(latency)
+        self._outcomes.append(True)
+
+    def record_failure(self):
+        self._outcomes.append(False)
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    @property
+    def healthy(self) -> bool:
+        return len(self._outcomes) < MIN_HEALTH_SAMPLES or self.error_rate < UNHEALTHY_ERROR_RATE
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        values = sorted(self._latencies)
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+    def stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(0.5)
+        p95 = self.percentile(0.95)
+        return {
+            "samples": len(self._outcomes),
+            "error_rate": round(self.error_rate, 4),
+            "healthy": self.healthy,
+            "p50_latency": round(p50, 4) if p50 is not None else None,
+            "p95_latency": round(p95, 4) if p95 is not None else None
+        }
+
+
+class ProviderRouter:
+    """按路由策略在多个提供商之间调度请求"""
+
+    def __init__(self):
+        self.health: Dict[str, ProviderHealth] = {}
+
+    def _health(self, provider: str) -> ProviderHealth:
+        if provider not in self.health:
+            self.health[provider] = ProviderHealth()
+        return self.health[provider]
+
+    def order(self, providers: List[str]) -> List[str]:
+        """保持配置的优先顺序，但把不健康的提供商排到最后"""
+        return sorted(providers, key=lambda p: not self._health(p).healthy)
+
+    def hedge_delay(self, provider: str, policy: RouteConfig) -> float:
+        """对冲延迟：主提供商最近p95延迟，限制在[hedge_min_delay, hedge_max_delay]内"""
+        p95 = self._health(provider).percentile(0.95)
+        delay = p95 if p95 is not None else DEFAULT_HEDGE_DELAY
+        return min(max(delay, policy.hedge_min_delay), policy.hedge_max_delay)
+
+    async def _attempt(self, provider: str, call: Callable[[str], Awaitable[Any]], timeout: float) -> Any:
+        # 单次超时不超过调用方剩余的时间预算；预算已用完时直接抛出DeadlineExceeded，不发起调用
+        bounded = timeout_for(timeout)
+        start = time.monotonic()
+        try:
+            result = await _wait_bounded(lambda: call(provider), bounded, timeout)
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            self._record_failure(provider, e)
+            raise
+        self._health(provider).record_success(time.monotonic() - start)
+        return result
+
+    def _record_failure(self, provider: str, error: BaseException):
+        if isinstance(error, DeadlineExceeded):
+            return  # 调用方的预算用完，与提供商是否健康无关
+        self._health(provider).record_failure()
+        # 超时是由wait_for取消调用实现的，调用内部的熔断器只看到取消，这里补记一次失败
+        if isinstance(error, asyncio.TimeoutError) and is_dependency_failure(error):
+            get_breaker(provider).record_failure()
+
+    async def run(self, policy: RouteConfig, call: Callable[[str], Awaitable[Any]]) -> Any:
+        """
+        按策略执行请求
+
+        依次尝试各提供商，遇到可重试错误时切换到下一个；
+        开启对冲时，主提供商超过对冲延迟仍未返回则并行请求下一个，取先成功者。
+        """
+        providers = self.order(policy.providers)
+        last_error: Optional[BaseException] = None
+        index = 0
+
+        while index < len(providers):
+            primary = providers[index]
+            secondary = providers[index + 1] if index + 1 < len(providers) else None
+
+            if policy.hedge and secondary:
+                try:
+                    return await self._run_hedged(primary, secondary, call, policy)
+                except BaseException as e:
+                    if not is_retryable_error(e):
+                        raise
+                    last_error = e
+                index += 2
+                continue
+
+            try:
+                return await self._attempt(primary, call, policy.timeout)
+            except BaseException as e:
+                if not is_retryable_error(e):
+                    raise
+                last_error = e
+                print(f"提供商 {primary} 调用失败，切换到下一个: {e}")
+            index += 1
+
+        raise last_error or RuntimeError("没有可用的提供商")
+
+    async def _run_hedged(self, primary: str, secondary: str,
+                          call: Callable[[str], Awaitable[Any]], policy: RouteConfig) -> Any:
+        first = asyncio.ensure_future(self._attempt(primary, call, policy.timeout))
+        pending = {first}
+
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_delay(primary, policy))
+            if first in done and first.exception() is None:
+                return first.result()
+            if first in done and not is_retryable_error(first.exception()):
+                return first.result()
+
+            # 主提供商过慢或失败：发起对冲请求
+            pending = {t for t in pending if not t.done()}
+            pending.add(asyncio.ensure_future(self._attempt(secondary, call, policy.timeout)))
+            last_error = first.exception() if first.done() else None
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, policy: RouteConfig,
+                     open_stream: Callable[[str], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式请求路由
+
+        只在首个事件到达前允许故障转移或对冲，首个事件到达后固定使用该提供商。
+        """
+        providers = self.order(policy.providers)
+        last_error: Optional[BaseException] = None
+        index = 0
+
+        while index < len(providers):
+            candidates = [providers[index]]
+            if policy.hedge and index + 1 < len(providers):
+                candidates.append(providers[index + 1])
+            index += len(candidates)
+
+            try:
+                provider, stream, first_event = await self._first_event(candidates, open_stream, policy)
+            except BaseException as e:
+                if not is_retryable_error(e):
+                    raise
+                last_error = e
+                continue
+
+            yield first_event
+            try:
+                async for event in stream:
+                    yield event
+            finally:
+                await stream.aclose()
+            return
+
+        raise last_error or RuntimeError("没有可用的提供商")
+
+    async def _first_event(self, candidates: List[str], open_stream, policy: RouteConfig):
+        """等待候选提供商中第一个产出事件的流，必要时在对冲延迟后启动下一个候选"""
+        streams: Dict[asyncio.Task, tuple] = {}
+
+        def start(provider: str):
+            timeout = timeout_for(policy.timeout)
+            stream = open_stream(provider)
+            task = asyncio.ensure_future(_wait_bounded(stream.__anext__, timeout, policy.timeout))
+            streams[task] = (provider, stream, time.monotonic())
+
+        start(candidates[0])
+        remaining = candidates[1:]
+        last_error: Optional[BaseException] = None
+
+        try:
+            while streams:
+                timeout = self.hedge_delay(candidates[0], policy) if remaining else None
+                done, _ = await asyncio.wait(streams.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done and remaining:
+                    start(remaining.pop(0))
+                    continue
+
+                for task in done:
+                    provider, stream, started = streams.pop(task)
+                    if task.exception() is None:
+                        self._health(provider).record_success(time.monotonic() - started)
+                        return provider, stream, task.result()
+                    last_error = task.exception()
+                    self._record_failure(provider, last_error)
+                    await stream.aclose()
+                    if not is_retryable_error(last_error):
+                        raise last_error
+                    if remaining:
+                        start(remaining.pop(0))
+
+            raise last_error or RuntimeError("没有可用的提供商")
+        finally:
+            # 关闭未被选中的流：先等待其__anext__任务结束，才能安全地aclose
+            for task, (_, stream, _) in streams.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                try:
+                    await stream.aclose()
+                except Exception:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {provider: health.stats() for provider, health in self.health.items()}
+
+
+def get_route_policy(route: Optional[str]) -> RouteConfig:
+    """获取路由策略，未单独配置的路由使用default"""
+    routing = get_config().routing
+    if route and route in routing:
+        return routing[route]
+    return routing.get("default") or RouteConfig()
@@ -0,0 +1,128 @@
+"""
+AI Agent Floating Ball - Session Memory
+智能体的会话记忆：最近K轮对话原样保留，更早的对话压缩为滚动摘要，
+“再详细一点”这类追问能接上之前的内容，而提示长度不随会话变长而增长
+
+摘要在每次回复之后于后台刷新，不占用回答用户的时间
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# 原样保留的最近对话轮数
+MAX_TURNS = 4
+# 保留的每条消息、摘要的最大字符数
+MAX_MESSAGE_CHARS = 600
+MAX_SUMMARY_CHARS = 500
+# 会话空闲超过该时间（秒）后视为新话题，清空记忆
+IDLE_TIMEOUT = 600.0
+
+
+@dataclass
+class Turn:
+    """一轮对话"""
+    user: str
+    assistant: str
+    timestamp: float = field(default_factory=time.time)
+
+
+def _clip(text: str, limit: int) -> str:
+    """超长时保留开头和结尾"""
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return text[:half] + "……" + text[-half:]
+
+
+class SessionMemory:
+    """
+    会话记忆
+
+        memory = SessionMemory(summarize)
+        messages = memory.messages() + [{"role": "user", "content": question}]
+        ...
+        memory.add(instruction, answer)      # 回复后记录，必要时在后台刷新摘要
+
+    summarize(旧摘要, 需要并入摘要的对话) 为生成新摘要的协程，失败时抛出异常即可（稍后重试）
+    """
+
+    def __init__(self, summarize: Callable[[str, List[Turn]], Awaitable[str]], max_turns: int = MAX_TURNS,
+                 max_message_chars: int = MAX_MESSAGE_CHARS, max_summary_chars: int = MAX_SUMMARY_CHARS,
+                 idle_timeout: float = IDLE_TIMEOUT):
+        self.summarize = summarize
+        self.max_turns = max_turns
+        self.max_message_chars = max_message_chars
+        self.max_summary_chars = max_summary_chars
+        self.idle_timeout = idle_timeout
+
+        self.summary = ""
+        self._turns: List[Turn] = []
+        # 已移出最近K轮、等待并入摘要的对话
+        self._pending: List[Turn] = []
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._turns) + len(self._pending)
+
+    def _expire(self):
+        last = self._turns[-1].timestamp if self._turns else None
+        if last is not None and time.time() - last > self.idle_timeout:
+            print("会话空闲时间较长，已清空对话记忆")
+            self.clear()
+
+    def clear(self):
+        self.summary = ""
+        self._turns.clear()
+        self._pending.clear()
+        # 进行中的摘要刷新结果作废
+        self._generation += 1
+
+    def messages(self) -> List[Dict[str, str]]:
+        """放在本轮问题之前的历史消息：摘要（system消息）+ 最近K轮对话"""
+        self._expire()
+        history: List[Dict[str, str]] = []
+        summary = self.summary
+        if self._pending:
+            # 摘要尚未刷新完成的对话先以截断后的原文附上
+            summary = "\n".join(
+                [summary] + [f"用户：{_clip(t.user, 100)} 助手：{_clip(t.assistant, 100)}" for t in self._pending]
+            ).strip()
+        if summary:
+            history.append({"role": "system", "content": "之前对话的摘要：\n" + summary})
+        for turn in self._turns:
+            history.append({"role": "user", "content": turn.user})
+            history.append({"role": "assistant", "content": turn.assistant})
+        return history
+
+    def add(self, user: str, assistant: str):
+        """记录一轮对话；超出K轮的旧对话在后台并入摘要"""
+        self._expire()
+        self._turns.append(Turn(_clip(user, self.max_message_chars), _clip(assistant or "", self.max_message_chars)))
+        if len(self._turns) > self.max_turns:
+            overflow = len(self._turns) - self.max_turns
+            self._pending.extend(self._turns[:overflow])
+            del self._turns[:overflow]
+        if self._pending and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh())
+
+    async def _refresh(self):
+        """把等待中的对话并入摘要；刷新期间有新的对话移出时继续刷新"""
+        while self._pending:
+            generation = self._generation
+            turns = list(self._pending)
+            try:
+                summary = await self.summarize(self.summary, turns)
+            except Exception as e:
+                print(f"刷新对话摘要失败，稍后重试: {e}")
+                # 摘要一直失败时只保留最近的等待对话，提示长度仍然有上限
+                del self._pending[:max(0, len(self._pending) - self.max_turns)]
+                return
+            if generation != self._generation:
+                return
+            self.summary = _clip((summary or "").strip(), self.max_summary_chars)
+            del self._pending[:len(turns)]
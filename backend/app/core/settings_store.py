@@ -0,0 +1,129 @@
+"""
+AI Agent Floating Ball - Settings Store
+设置文件（ai_setting.txt、sound_on.txt、tts_sound.txt等）的内存缓存：首次读取后常驻内存，
+后台线程按修改时间检测变化并重新加载，修改文件后无需重启即可生效
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 检测文件变化的间隔（秒）
+POLL_INTERVAL = 1.0
+
+
+@dataclass
+class _Entry:
+    value: Optional[str] = None  # 文件不存在或读取失败时为None
+    signature: Optional[Tuple[int, int]] = None  # (mtime_ns, size)
+    callbacks: List[Callable[[Optional[str]], None]] = field(default_factory=list)
+
+
+def _signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"读取设置文件{path}失败: {e}")
+        return None
+
+
+class SettingsStore:
+    """
+    设置文件缓存
+
+        store = get_settings_store()
+        store.get("ai_setting.txt")                       # 内存中的当前内容
+        store.on_change("sound_on.txt", callback)         # 内容变化时回调（在监视线程中执行）
+    """
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def _entry(self, path: str) -> _Entry:
+        """获取（必要时首次加载并开始监视）文件对应的缓存项"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                entry = _Entry(value=_read(path), signature=_signature(path))
+                self._entries[path] = entry
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._watch, daemon=True)
+                    self._thread.start()
+            return entry
+
+    def get(self, path: str, default: str = "") -> str:
+        """返回文件的当前内容，文件不存在时返回default"""
+        value = self._entry(path).value
+        return default if value is None else value
+
+    def on_change(self, path: str, callback: Callable[[Optional[str]], None]):
+        """文件内容变化时回调callback(新内容)，文件被删除时传入None"""
+        entry = self._entry(path)
+        with self._lock:
+            entry.callbacks.append(callback)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                paths = list(self._entries)
+            for path in paths:
+                self._check(path)
+
+    def _check(self, path: str):
+        signature = _signature(path)
+        with self._lock:
+            entry = self._entries[path]
+            if signature == entry.signature:
+                return
+        value = _read(path) if signature is not None else None
+        with self._lock:
+            entry.signature = signature
+            changed = value != entry.value
+            entry.value = value
+            callbacks = list(entry.callbacks)
+        if not changed:
+            return
+        print(f"设置文件{path}已更新")
+        for callback in callbacks:
+            try:
+                callback(value)
+            except Exception as e:
+                print(f"设置变更回调失败: {e}")
+
+
+# 全局设置缓存
+_settings_store: Optional[SettingsStore] = None
+_settings_store_lock = threading.Lock()
+
+
+def get_settings_store() -> SettingsStore:
+    """获取全局设置缓存"""
+    global _settings_store
+    with _settings_store_lock:
+        if _settings_store is None:
+            _settings_store = SettingsStore()
+        return _settings_store
+
+
+def read_setting(path: str, default: str = "") -> str:
+    """读取设置文件的当前内容（来自内存缓存）"""
+    return get_settings_store().get(path, default)
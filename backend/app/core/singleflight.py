@@ -0,0 +1,51 @@
+"""
+AI Agent Floating Ball - Singleflight
+合并相同的并发上游请求：同一键的并发调用者共享一次上游调用的结果
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """按请求键合并并发调用"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], namespace: str = "default") -> Any:
+        """
+        执行fn；如果同一键已有调用在进行中，则等待其结果而不是再次调用
+
+        上游调用以独立任务运行，单个调用者被取消不会影响其它等待者。
+        结果对象在所有调用者之间共享，调用方不应原地修改。
+        """
+        stats = self._stats.setdefault(namespace, {"calls": 0, "upstream": 0, "collapsed": 0})
+        stats["calls"] += 1
+
+        flight_key = f"{namespace}:{key}"
+        task = self._inflight.get(flight_key)
+        if task is not None:
+            stats["collapsed"] += 1
+        else:
+            stats["upstream"] += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda t: self._on_done(flight_key, t))
+
+        return await asyncio.shield(task)
+
+    def _on_done(self, flight_key: str, task: asyncio.Task):
+        if self._inflight.get(flight_key) is task:
+            del self._inflight[flight_key]
+        # 所有调用者都已取消时，避免出现"exception was never retrieved"警告
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        return {
+            "in_flight": len(self._inflight),
+            "namespaces": {name: dict(values) for name, values in self._stats.items()}
+        }
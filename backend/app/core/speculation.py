@@ -0,0 +1,111 @@
+"""
+AI Agent Floating Ball - Speculative Planning
+语音模式的预先规划：部分识别结果稳定后立即用它发起第一次模型调用（只规划，不执行工具），
+最终识别结果与之一致时直接复用模型的回复，不一致时丢弃并按最终结果重新请求，
+用户说完话之后的等待时间少一次模型往返
+
+复用按请求参数（模型、消息、工具定义）的哈希匹配，只有与正式请求完全相同的回复才会被使用
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# 比较识别结果时忽略的空白和标点（最终结果常比部分结果多出句末标点）
+_IGNORED = re.compile(r"[\s,.!?;:，。！？；：、…~～\"'“”‘’]+")
+
+
+def transcripts_match(a: str, b: str) -> bool:
+    """两次识别结果去掉空白和标点后是否相同"""
+    return _IGNORED.sub("", a or "") == _IGNORED.sub("", b or "")
+
+
+def completion_key(params: Dict[str, Any]) -> str:
+    """模型请求参数的哈希"""
+    data = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class Speculation:
+    """一次预先规划：基于的部分识别结果及执行规划的任务"""
+    transcript: str
+    task: asyncio.Task
+
+
+class SpeculativePlanner:
+    """
+    预先规划
+
+        planner = SpeculativePlanner()
+        planner.propose(partial, plan)          # 部分识别结果稳定时（在事件循环线程中调用）
+        ...
+        value = await planner.resolve(final)    # 最终结果一致时返回plan的返回值，否则为None
+        response = planner.take(params)         # 正式请求时取出预先得到的模型回复
+        planner.discard()                       # 本轮结束
+
+    plan(transcript)为执行预先规划的协程，其中的模型回复通过remember(params, response)记录
+    """
+
+    def __init__(self):
+        self.current: Optional[Speculation] = None
+        self._responses: Dict[str, Any] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def propose(self, transcript: str, plan: Callable[[str], Awaitable[Any]]):
+        """部分识别结果稳定：与进行中的预先规划不同时取消旧的，按新结果重新发起"""
+        transcript = (transcript or "").strip()
+        if not transcript:
+            return
+        if self.current is not None and transcripts_match(self.current.transcript, transcript):
+            return
+        self.discard()
+        print(f"预先规划: {transcript}")
+        self.current = Speculation(transcript, asyncio.create_task(plan(transcript)))
+
+    async def resolve(self, transcript: str) -> Optional[Any]:
+        """
+        最终识别结果：与预先规划一致时等待其完成并返回plan的返回值，否则取消预先规划并返回None
+
+        等待的只是与正式请求相同的工作（且开始得更早），不会比重新请求更慢
+        """
+        speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+        if not transcripts_match(speculation.transcript, transcript):
+            speculation.task.cancel()
+            self._responses.clear()
+            self.misses += 1
+            print("最终识别结果与预先规划不一致，重新请求")
+            return None
+        try:
+            value = await speculation.task
+        except Exception as e:
+            print(f"预先规划失败，重新请求: {e}")
+            self._responses.clear()
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def remember(self, params: Dict[str, Any], response: Any):
+        self._responses[completion_key(params)] = response
+
+    def take(self, params: Dict[str, Any]) -> Optional[Any]:
+        """取出与params完全相同的预先请求的回复（只能使用一次）"""
+        if not self._responses:
+            return None
+        return self._responses.pop(completion_key(params), None)
+
+    def discard(self):
+        """取消进行中的预先规划，丢弃未使用的回复"""
+        if self.current is not None:
+            self.current.task.cancel()
+            self.current = None
+        self._responses.clear()
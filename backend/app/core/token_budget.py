@@ -0,0 +1,238 @@
+"""
+AI Agent Floating Ball - Token Budget
+模型能力登记表（上下文窗口、价格、是否支持图片/工具/流式）；
+按模型统计token，裁剪历史消息以适配上下文窗口并为回复预留空间，选择能容纳请求的最便宜模型
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import json
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """
+    模型规格与能力
+
+    上下文窗口（token）、输入/输出价格（元/千token，用于比较和估算花费），
+    以及是否支持图片输入（vision）、工具调用（tools）和流式输出（streaming）
+    """
+    name: str
+    context_window: int
+    input_price: float
+    output_price: float = 0.0
+    vision: bool = False
+    tools: bool = True
+    streaming: bool = True
+
+
+MODEL_SPECS: Dict[str, ModelSpec] = {spec.name: spec for spec in [
+    ModelSpec("qwen-flash", 1000000, 0.00015, 0.0015),
+    ModelSpec("qwen-turbo", 1000000, 0.0003, 0.0006),
+    ModelSpec("qwen-long", 10000000, 0.0005, 0.002, tools=False),
+    ModelSpec("qwen-plus", 131072, 0.0008, 0.002),
+    ModelSpec("qwen-max", 32768, 0.0024, 0.0096),
+    ModelSpec("qwen3-coder-flash", 1000000, 0.001, 0.004),
+    ModelSpec("qwen-vl-plus", 131072, 0.0015, 0.0045, vision=True, tools=False),
+    ModelSpec("qwen3-vl-flash", 262144, 0.00015, 0.0015, vision=True),
+    ModelSpec("qwen3-vl-plus", 262144, 0.001, 0.01, vision=True),
+    ModelSpec("kimi-k2-0905-preview", 262144, 0.004, 0.016),
+    ModelSpec("moonshot-v1-8k", 8192, 0.002, 0.01),
+    ModelSpec("moonshot-v1-32k", 32768, 0.005, 0.02),
+    ModelSpec("moonshot-v1-128k", 131072, 0.01, 0.03),
+    ModelSpec("moonshot-v1-8k-vision-preview", 8192, 0.002, 0.01, vision=True),
+]}
+
+# 未登记模型使用的上下文窗口
+DEFAULT_CONTEXT_WINDOW = 32768
+# tiktoken编码与各模型实际分词器存在差异，窗口预留一定比例作为余量
+TOKENIZER_MARGIN = 0.05
+# 每条消息的格式开销和回复起始开销（参考OpenAI的计数方式）
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+# 图片输入按固定token数估算
+IMAGE_TOKENS = 1280
+# 用于计数的tiktoken编码
+ENCODING_NAME = "o200k_base"
+# 截断过长消息时插入的标记
+TRUNCATION_MARK = "\n……（内容过长，已省略部分内容）……\n"
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    """懒加载tiktoken编码，未安装或加载失败时返回None（改用字符估算）"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception as e:
+        print(f"tiktoken不可用，按字符数估算token: {e}")
+        return None
+
+
+def preload_encoding() -> bool:
+    """预先加载分词器（首次加载需要读取编码文件），返回tiktoken是否可用"""
+    return _get_encoding() is not None
+
+
+def _estimate_tokens(text: str) -> int:
+    """估算token数：中日韩字符约1个token，其他字符约4个1个token"""
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uac00" <= ch <= "\ud7af")
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """统计文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def get_model_spec(model: str) -> ModelSpec:
+    """获取模型规格，未登记的模型使用默认窗口，价格视为最高，视为不支持图片"""
+    return MODEL_SPECS.get(model) or ModelSpec(model, DEFAULT_CONTEXT_WINDOW, float("inf"))
+
+
+def supports(model: str, *capabilities: str) -> bool:
+    """模型是否同时具备给定能力：supports("qwen3-vl-flash", "vision", "tools")"""
+    spec = get_model_spec(model)
+    return all(getattr(spec, capability) for capability in capabilities)
+
+
+def _as_dict(message: Any) -> Dict[str, Any]:
+    """兼容SDK返回的消息对象"""
+    if isinstance(message, dict):
+        return message
+    if hasattr(message, "model_dump"):
+        return message.model_dump(exclude_none=True)
+    return {"content": str(message)}
+
+
+def _content_tokens(content: Any) -> int:
+    if content is None:
+        return 0
+    if isinstance(content, str):
+        return count_tokens(content)
+
+    total = 0
+    for part in content:
+        if isinstance(part, dict) and part.get("type") == "text":
+            total += count_tokens(part.get("text", ""))
+        elif isinstance(part, dict) and part.get("type") in ("image_url", "image"):
+            total += IMAGE_TOKENS
+        else:
+            total += count_tokens(str(part))
+    return total
+
+
+def _message_tokens(message: Any) -> int:
+    """统计单条消息的token数（含格式开销和工具调用参数）"""
+    message = _as_dict(message)
+    total = MESSAGE_OVERHEAD + _content_tokens(message.get("content"))
+    if message.get("tool_calls"):
+        total += count_tokens(json.dumps(message["tool_calls"], ensure_ascii=False, default=str))
+    return total
+
+
+def count_message_tokens(messages: Iterable[Any], tools: Optional[List[Dict]] = None) -> int:
+    """统计一次请求的提示token数（消息 + 工具定义）"""
+    total = REPLY_OVERHEAD + sum(_message_tokens(m) for m in messages)
+    if tools:
+        total += count_tokens(json.dumps(tools, ensure_ascii=False, default=str))
+    return total
+
+
+def prompt_budget(model: str, max_tokens: int) -> int:
+    """为回复预留max_tokens后，提示可用的token数"""
+    window = get_model_spec(model).context_window
+    return int(window * (1 - TOKENIZER_MARGIN)) - max_tokens
+
+
+def select_model(messages: List[Any], candidates: List[str], max_tokens: int = 1024,
+                 tools: Optional[List[Dict]] = None) -> Optional[str]:
+    """在候选模型中选择能完整容纳请求的最便宜模型，都放不下时返回None"""
+    tokens = count_message_tokens(messages, tools)
+    fitting = [model for model in candidates if tokens <= prompt_budget(model, max_tokens)]
+    if not fitting:
+        return None
+    return min(fitting, key=lambda model: get_model_spec(model).input_price)
+
+
+def _group_turns(messages: List[Any]) -> List[List[Any]]:
+    """按轮次分组：带tool_calls的assistant消息与其后的tool消息必须一起保留或丢弃"""
+    groups: List[List[Any]] = []
+    for message in messages:
+        if _as_dict(message).get("role") == "tool" and groups:
+            groups[-1].append(message)
+        else:
+            groups.append([message])
+    return groups
+
+
+def truncate_text(text: str, max_tokens: int) -> str:
+    """保留开头和结尾，截掉中间部分，使文本不超过max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens - count_tokens(TRUNCATION_MARK))
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        head, tail = keep - keep // 2, keep // 2
+        return encoding.decode(tokens[:head]) + TRUNCATION_MARK + (encoding.decode(tokens[-tail:]) if tail else "")
+
+    # 没有编码器时按比例截取字符
+    chars = int(len(text) * keep / max(1, _estimate_tokens(text)))
+    head, tail = chars - chars // 2, chars // 2
+    return text[:head] + TRUNCATION_MARK + (text[-tail:] if tail else "")
+
+
+def _truncate_longest(messages: List[Any], budget: int, tools: Optional[List[Dict]]) -> List[Any]:
+    """只剩必须保留的消息仍放不下时，截断其中最长的文本消息"""
+    messages = [dict(_as_dict(m)) for m in messages]
+    for _ in range(3):
+        excess = count_message_tokens(messages, tools) - budget
+        if excess <= 0:
+            break
+        text_messages = [m for m in messages if isinstance(m.get("content"), str)]
+        if not text_messages:
+            break
+        longest = max(text_messages, key=lambda m: len(m["content"]))
+        longest["content"] = truncate_text(longest["content"], count_tokens(longest["content"]) - excess)
+    return messages
+
+
+def fit_messages(messages: List[Any], model: str, max_tokens: int = 1024,
+                 tools: Optional[List[Dict]] = None) -> Tuple[List[Any], int]:
+    """
+    裁剪消息使其适配模型的上下文窗口，并为回复预留max_tokens
+
+    开头的system消息和最后一轮对话始终保留，从最早的对话开始丢弃；
+    仍放不下时截断最长的消息。返回 (裁剪后的消息, 丢弃的消息条数)。
+    """
+    budget = prompt_budget(model, max_tokens)
+    if count_message_tokens(messages, tools) <= budget:
+        return list(messages), 0
+
+    split = 0
+    while split < len(messages) and _as_dict(messages[split]).get("role") == "system":
+        split += 1
+    head, groups = list(messages[:split]), _group_turns(messages[split:])
+
+    group_tokens = [sum(_message_tokens(m) for m in group) for group in groups]
+    total = count_message_tokens(head, tools) + sum(group_tokens)
+
+    dropped = 0
+    while len(groups) > 1 and total > budget:
+        dropped += len(groups.pop(0))
+        total -= group_tokens.pop(0)
+
+    fitted = head + [message for group in groups for message in group]
+    if total > budget:
+        fitted = _truncate_longest(fitted, budget, tools)
+    return fitted, dropped
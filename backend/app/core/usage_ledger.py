@@ -0,0 +1,244 @@
+"""
+AI Agent Floating Ball - Usage Ledger
+上游调用用量账本：记录每次LLM/VL/TTS/ASR调用的token、音频时长、延迟、缓存命中和调用方路由，
+按天追加写入本地JSONL文件，查询时按小时和模型汇总
+"""
+
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    from .config import get_config
+    from .token_budget import MODEL_SPECS
+except ImportError:
+    # 作为独立脚本（tts等）导入时
+    from config import get_config
+    from token_budget import MODEL_SPECS
+
+
+# 调用方路由（由HTTP中间件设置），账本记录时自动带上
+_caller_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("caller_route", default=None)
+
+
+@contextmanager
+def caller_route(route: str) -> Iterator[None]:
+    """在该上下文内发生的上游调用都记在route名下"""
+    token = _caller_route.set(route)
+    try:
+        yield
+    finally:
+        _caller_route.reset(token)
+
+
+@dataclass
+class UsageRecord:
+    """一次上游调用的用量"""
+    ts: float
+    kind: str  # llm / vl / tts / asr / search
+    provider: str
+    model: str
+    route: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    audio_seconds: float = 0.0
+    ttfb: Optional[float] = None  # 首字节延迟（秒）
+    latency: float = 0.0  # 总延迟（秒）
+    cached: bool = False
+    success: bool = True
+
+
+class UsageTracker:
+    """为一次调用计时并收集用量，结束时写入账本"""
+
+    def __init__(self, ledger: "UsageLedger", kind: str, provider: str, model: str, cached: bool = False):
+        self._ledger = ledger
+        self._start = time.monotonic()
+        self.record = UsageRecord(
+            ts=time.time(),
+            kind=kind,
+            provider=provider,
+            model=model,
+            route=_caller_route.get(),
+            cached=cached
+        )
+
+    def first_byte(self):
+        """标记收到首个数据（流式调用的首个token/音频块）"""
+        if self.record.ttfb is None:
+            self.record.ttfb = time.monotonic() - self._start
+
+    def add_usage(self, usage: Any):
+        """读取OpenAI兼容（prompt/completion_tokens）或DashScope（input/output_tokens）的usage"""
+        if not usage:
+            return
+        if hasattr(usage, "model_dump"):
+            usage = usage.model_dump()
+        elif not isinstance(usage, dict):
+            usage = dict(usage)
+        self.record.prompt_tokens += int(usage.get("prompt_tokens") or usage.get("input_tokens") or 0)
+        self.record.completion_tokens += int(usage.get("completion_tokens") or usage.get("output_tokens") or 0)
+
+    def add_audio(self, seconds: Optional[float]):
+        if seconds:
+            self.record.audio_seconds += seconds
+
+    def finish(self, success: bool = True):
+        self.record.latency = time.monotonic() - self._start
+        if self.record.ttfb is None:
+            self.record.ttfb = self.record.latency
+        self.record.success = success
+        self._ledger.append(self.record)
+
+
+def _percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p))], 4)
+
+
+def _estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """按token_budget中登记的价格估算花费（元），未登记的模型返回None"""
+    spec = MODEL_SPECS.get(model)
+    if spec is None:
+        return None
+    return (prompt_tokens * spec.input_price + completion_tokens * spec.output_price) / 1000
+
+
+class UsageLedger:
+    """按天分文件的追加写入账本"""
+
+    def __init__(self, directory: str, enabled: bool = True):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+
+    def _file_for(self, day: datetime) -> Path:
+        return self.directory / f"usage-{day:%Y%m%d}.jsonl"
+
+    def append(self, record: UsageRecord):
+        """追加一条记录（只追加，不修改已有记录）"""
+        if not self.enabled:
+            return
+        line = json.dumps(asdict(record), ensure_ascii=False)
+        try:
+            with self._lock:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                with open(self._file_for(datetime.fromtimestamp(record.ts)), "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except OSError as e:
+            print(f"写入用量账本失败: {e}")
+
+    @contextmanager
+    def track(self, kind: str, provider: str, model: str, cached: bool = False) -> Iterator[UsageTracker]:
+        """with ledger.track("llm", provider, model) as usage: ...（同步和异步代码中均可使用）"""
+        tracker = UsageTracker(self, kind, provider, model, cached)
+        try:
+            yield tracker
+        except BaseException:
+            tracker.finish(success=False)
+            raise
+        tracker.finish()
+
+    def records(self, since: float) -> Iterator[Dict[str, Any]]:
+        """读取since（时间戳）之后的记录"""
+        day = datetime.fromtimestamp(since).replace(hour=0, minute=0, second=0, microsecond=0)
+        while day <= datetime.now():
+            path = self._file_for(day)
+            day += timedelta(days=1)
+            if not path.exists():
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if record.get("ts", 0) >= since:
+                        yield record
+
+    def summary(self, hours: int = 24) -> Dict[str, Any]:
+        """汇总最近hours小时的用量：总计、按调用类型、按模型（含延迟分位数）、按小时、按调用方路由"""
+        def bucket() -> Dict[str, Any]:
+            return {
+                "calls": 0, "errors": 0, "cached": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "audio_seconds": 0.0, "cost": 0.0
+            }
+
+        def add(target: Dict[str, Any], record: Dict[str, Any], cost: Optional[float]):
+            target["calls"] += 1
+            target["errors"] += 0 if record.get("success", True) else 1
+            target["cached"] += 1 if record.get("cached") else 0
+            # 缓存命中没有消耗上游配额，不计入token花费
+            if not record.get("cached"):
+                target["prompt_tokens"] += record.get("prompt_tokens", 0)
+                target["completion_tokens"] += record.get("completion_tokens", 0)
+                target["audio_seconds"] += record.get("audio_seconds", 0.0)
+                target["cost"] += cost or 0.0
+
+        totals = bucket()
+        by_kind: Dict[str, Dict[str, Any]] = defaultdict(bucket)
+        by_model: Dict[str, Dict[str, Any]] = defaultdict(bucket)
+        by_hour: Dict[str, Dict[str, Any]] = defaultdict(bucket)
+        by_route: Dict[str, Dict[str, Any]] = defaultdict(bucket)
+        latencies: Dict[str, List[float]] = defaultdict(list)
+        ttfbs: Dict[str, List[float]] = defaultdict(list)
+
+        for record in self.records(time.time() - hours * 3600):
+            model_key = f"{record.get('kind')}:{record.get('provider')}:{record.get('model')}"
+            hour_key = datetime.fromtimestamp(record["ts"]).strftime("%Y-%m-%d %H:00")
+            cost = _estimate_cost(record.get("model", ""), record.get("prompt_tokens", 0),
+                                  record.get("completion_tokens", 0))
+
+            targets = (totals, by_kind[record.get("kind")], by_model[model_key], by_hour[hour_key],
+                       by_route[record.get("route") or "-"])
+            for target in targets:
+                add(target, record, cost)
+
+            if record.get("success", True) and not record.get("cached"):
+                latencies[model_key].append(record.get("latency", 0.0))
+                if record.get("ttfb") is not None:
+                    ttfbs[model_key].append(record["ttfb"])
+
+        for model_key, stats in by_model.items():
+            stats["latency"] = {f"p{int(p * 100)}": _percentile(latencies[model_key], p) for p in (0.5, 0.95, 0.99)}
+            stats["ttfb"] = {f"p{int(p * 100)}": _percentile(ttfbs[model_key], p) for p in (0.5, 0.95, 0.99)}
+
+        for stats in [totals, *by_kind.values(), *by_model.values(), *by_hour.values(), *by_route.values()]:
+            stats["cost"] = round(stats["cost"], 4)
+            stats["audio_seconds"] = round(stats["audio_seconds"], 2)
+
+        return {
+            "hours": hours,
+            "totals": totals,
+            "by_kind": dict(by_kind),
+            "by_model": dict(by_model),
+            "by_hour": dict(sorted(by_hour.items())),
+            "by_route": dict(by_route)
+        }
+
+
+# 全局用量账本
+_usage_ledger: Optional[UsageLedger] = None
+
+
+def get_usage_ledger() -> UsageLedger:
+    """获取全局用量账本"""
+    global _usage_ledger
+    if _usage_ledger is None:
+        usage_config = get_config().usage
+        _usage_ledger = UsageLedger(usage_config.directory, enabled=usage_config.enabled)
+    return _usage_ledger
+
+
+def track_usage(kind: str, provider: str, model: str, cached: bool = False):
+    """记录一次上游调用：with track_usage("llm", "moonshot", model) as usage: ..."""
+    return get_usage_ledger().track(kind, provider, model, cached)
@@ -0,0 +1,113 @@
+"""
+AI Agent Floating Ball - Vision Pre-pass
+智能体的图片预处理：截图缩放到max_image_size以内并按screenshot_quality重新编码为JPEG，
+视觉模型给出的图片描述按图片内容哈希缓存，屏幕未变化时后续轮次不再调用视觉模型
+
+本模块不依赖应用内其他模块，agent_client 等独立脚本也可以直接导入
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+# 与config.json中vision配置的默认值一致
+DEFAULT_MAX_IMAGE_SIZE = 2048
+DEFAULT_QUALITY = 80
+# 缓存的图片描述条数
+MAX_CACHE_ENTRIES = 32
+
+
+def encode_image(image_bytes: bytes, max_image_size: int = DEFAULT_MAX_IMAGE_SIZE,
+                 quality: int = DEFAULT_QUALITY) -> Optional[bytes]:
+    """
+    缩放并重新编码图片，返回JPEG数据
+
+    长边超过max_image_size时等比缩小；Pillow不可用或图片无法解析时返回None
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            image = image.convert("RGB")
+            image.thumbnail((max_image_size, max_image_size), Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+            return output.getvalue()
+    except Exception as e:
+        print(f"图片预处理失败，使用原图: {e}")
+        return None
+
+
+class VisionPrepass:
+    """
+    图片描述（视觉预处理）缓存
+
+        prepass = VisionPrepass(max_image_size=2048, quality=80)
+        digest, description, data_url = await prepass.prepare("imgs/test2.png")
+        if description is None and data_url is not None:
+            description = await analyze(data_url)   # 缓存未命中时才调用视觉模型
+            prepass.remember(digest, description)
+    """
+
+    def __init__(self, max_image_size: int = DEFAULT_MAX_IMAGE_SIZE, quality: int = DEFAULT_QUALITY,
+                 max_entries: int = MAX_CACHE_ENTRIES):
+        self.max_image_size = max_image_size
+        self.quality = quality
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _read(image_path: str) -> Tuple[str, bytes]:
+        """读取图片，返回 (内容哈希, 原始数据)"""
+        with open(image_path, "rb") as f:
+            raw = f.read()
+        return hashlib.sha256(raw).hexdigest(), raw
+
+    def _to_data_url(self, raw: bytes) -> str:
+        data = encode_image(raw, self.max_image_size, self.quality)
+        if data is not None:
+            print(f"图片已预处理: {len(raw) // 1024}KB -> {len(data) // 1024}KB")
+            mime = "image/jpeg"
+        else:
+            # 未经处理的原图按文件头标注类型（截图通常为PNG）
+            data = raw
+            mime = "image/jpeg" if raw.startswith(b"\xff\xd8") else "image/png"
+        return f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+
+    async def prepare(self, image_path: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """
+        读取图片，返回 (内容哈希, 缓存的描述, data URL)
+
+        缓存命中时不做缩放编码（data URL为None）；图片无法读取时三者均为None
+        """
+        try:
+            digest, raw = await asyncio.to_thread(self._read, image_path)
+        except OSError as e:
+            print(f"读取图片失败: {e}")
+            return None, None, None
+
+        cached = self._cache.get(digest)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(digest)
+            print("图片内容未变化，复用缓存的图片描述")
+            return digest, cached, None
+
+        self.misses += 1
+        return digest, None, await asyncio.to_thread(self._to_data_url, raw)
+
+    def remember(self, digest: str, description: Optional[str]):
+        """缓存图片描述"""
+        if not description:
+            return
+        self._cache[digest] = description
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
@@ -2,11 +2,17 @@
 AI Agent Floating Ball - FastAPI Application
 """
 
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
 
 from .core.config import get_config
+from .core.ai_clients import get_ai_client, close_ai_client
+from .core.resilience import deadline
+from .core.token_budget import preload_encoding
+from .core.usage_ledger import caller_route
 from .api.chat import router as chat_router
 from .api.speech import router as speech_router
 from .api.vision import router as vision_router
@@ -14,6 +20,16 @@ from .api.automation import router as automation_router
 from .api.system import router as system_router
 
 
+async def warm_up():
+    """后台预热：创建AI客户端和连接池、加载分词器，不阻塞应用启动"""
+    try:
+        get_ai_client().warm_up()
+        await asyncio.to_thread(preload_encoding)
+        print("🔥 AI clients warmed up")
+    except Exception as e:
+        print(f"预热失败: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
@@ -21,9 +37,15 @@ async def lifespan(app: FastAPI):
     config = get_config()
     print(f"🚀 Starting {config.app.name} v{config.app.version}")
 
+    # 各提供商客户端默认在首次使用时创建，开启warm_up时在后台提前创建
+    warm_up_task = asyncio.create_task(warm_up()) if config.server.warm_up else None
+
     yield
 
     # 关闭时
+    if warm_up_task is not None and not warm_up_task.done():
+        warm_up_task.cancel()
+    await close_ai_client()
     print("👋 Shutting down AI Agent")
 
 
@@ -41,6 +63,12 @@ def create_application() -> FastAPI:
         lifespan=lifespan
     )
 
+    # 为每个请求设置时间预算（出站调用的超时从剩余预算中推导），并标记调用方路由（记入用量账本）
+    @app.middleware("http")
+    async def request_context(request: Request, call_next):
+        with deadline(config.resilience.request_budget), caller_route(request.url.path):
+            return await call_next(request)
+
     # 注册路由
     app.include_router(chat_router, prefix="/api/chat", tags=["chat"])
     app.include_router(speech_router, prefix="/api/speech", tags=["speech"])
@@ -0,0 +1,142 @@
+"""
+AI Agent Floating Ball - Automation Action Tables
+自动化动作表：预定义应用、音乐播放器/浏览器动作和系统快捷键
+
+app_launcher、KeyboardShortcutService 执行时使用这些表，agent_client 的本地意图路由也按这些表建立短语；
+本模块不依赖第三方库，没有桌面自动化依赖的进程也可以导入
+"""
+
+from typing import Dict, List, Tuple
+
+# 预定义的应用映射（launch_application_smart）: 应用名 -> 启动命令
+APP_COMMANDS: Dict[str, List[str]] = {
+    "notepad": ["notepad.exe"],
+    "calculator": ["calc.exe"],
+    "explorer": ["explorer.exe"],
+    "cmd": ["cmd.exe"],
+    "powershell": ["powershell.exe"],
+    "chrome": ["start", "chrome"],
+    "edge": ["start", "msedge"],
+    "vscode": ["code"],
+    "word": ["start", "winword"],
+    "excel": ["start", "excel"],
+    "powerpoint": ["start", "powerpnt"],
+    "netease": ["start", "cloudmusic"],  # 网易云音乐
+    "wechat": ["start", "WeChat"],  # 微信
+    "qq": ["start", "QQ"],  # QQ
+    "dingtalk": ["start", "DingTalk"]  # 钉钉
+}
+
+# 音乐播放器动作（control_music_app）: 动作名 -> 全局快捷键组合（网易云音乐）
+MUSIC_ACTIONS: Dict[str, Tuple[str, ...]] = {
+    'play_pause': ('ctrl', 'alt', 'p'),          # 播放/暂停 (网易云音乐)
+    'next_song': ('ctrl', 'alt', 'right'),       # 下一首
+    'previous_song': ('ctrl', 'alt', 'left'),    # 上一首
+    'volume_up': ('ctrl', 'alt', 'up'),          # 音量增加
+    'volume_down': ('ctrl', 'alt', 'down'),      # 音量减少
+    'mini_mode': ('ctrl', 'alt', 'o'),           # 迷你模式（网易云默认）
+    'like_song': ('ctrl', 'alt', 'l'),           # 喜欢当前歌曲
+    'lyrics_toggle': ('ctrl', 'alt', 'd'),       # 歌词开关
+    'mute': ('ctrl', 'alt', 'm'),                # 静音
+    'shuffle': ('ctrl', 'alt', 's'),             # 随机播放
+    'repeat': ('ctrl', 'alt', 'r'),              # 重复播放
+}
+
+# 浏览器动作（control_browser_app）: 动作名 -> 快捷键组合
+BROWSER_ACTIONS: Dict[str, Tuple[str, ...]] = {
+    'new_tab': ('ctrl', 't'),                    # 新建标签页
+    'close_tab': ('ctrl', 'w'),                  # 关闭标签页
+    'next_tab': ('ctrl', 'tab'),                 # 下一个标签页
+    'previous_tab': ('ctrl', 'shift', 'tab'),    # 上一个标签页
+    'reopen_closed_tab': ('ctrl', 'shift', 't'), # 重新打开关闭的标签页
+    'refresh': ('f5',),                          # 刷新
+    'hard_refresh': ('ctrl', 'f5'),              # 强制刷新
+    'back': ('alt', 'left'),                     # 后退
+    'forward': ('alt', 'right'),                 # 前进
+    'home': ('alt', 'home'),                     # 主页
+    'bookmarks': ('ctrl', 'shift', 'o'),         # 书签
+    'history': ('ctrl', 'h'),                    # 历史记录
+    'downloads': ('ctrl', 'j'),                  # 下载
+    'fullscreen': ('f11',),                      # 全屏
+    'zoom_in': ('ctrl', '+'),                    # 放大
+    'zoom_out': ('ctrl', '-'),                   # 缩小
+    'reset_zoom': ('ctrl', '0'),                 # 重置缩放
+}
+
+# 系统快捷键（KeyboardShortcutService）: 动作名 -> 快捷键组合
+SHORTCUTS: Dict[str, Tuple[str, ...]] = {
+    # 系统相关
+    'lock_screen': ('win', 'l'),
+    'task_manager': ('ctrl', 'shift', 'esc'),
+    'switch_user': ('ctrl', 'alt', 'del'),  # 通常会打开安全选项菜单
+    'log_off': ('win', 'x'),
+    'search_apps': ('win', 'q'),
+    'run_dialog': ('win', 'r'),
+    'file_explorer': ('win', 'e'),
+    'settings': ('win', 'i'),
+    'notifications': ('win', 'a'),
+    'quick_link_menu': ('win', 'x'),  # Win+X 菜单
+    'delete': ('delete',),
+    'enter': ('enter',),
+
+    # 窗口和任务管理
+    'task_view': ('win', 'tab'),
+    'timeline': ('win', 'tab'),  # 在某些版本中与任务视图相同
+    'new_virtual_desktop': ('win', 'ctrl', 'd'),
+    'close_virtual_desktop': ('win', 'ctrl', 'f4'),
+    'switch_desktop_left': ('win', 'ctrl', 'left'),
+    'switch_desktop_right': ('win', 'ctrl', 'right'),
+    'minimize_all': ('win', 'm'),
+    'show_desktop': ('win', 'd'),
+    'maximize_window': ('win', 'up'),
+    'minimize_window': ('win', 'down'),
+    'dock_left': ('win', 'left'),
+    'dock_right': ('win', 'right'),
+
+    # 通用编辑和导航
+    'copy': ('ctrl', 'c'),
+    'cut': ('ctrl', 'x'),
+    'paste': ('ctrl', 'v'),
+    'paste_special': ('ctrl', 'shift', 'v'),  # 某些应用支持
+    'undo': ('ctrl', 'z'),
+    'redo': ('ctrl', 'y'),
+    'select_all': ('ctrl', 'a'),
+    'find': ('ctrl', 'f'),
+    'find_next': ('f3',),
+    'find_previous': ('shift', 'f3'),
+    'replace': ('ctrl', 'h'),
+    'refresh': ('f5',),
+    'hard_refresh': ('ctrl', 'f5'),
+
+    # 截图和录屏 (部分功能可能需要配合 Snipping Tool/截图工具)
+    'screenshot': ('printscreen',),
+    'screenshot_active_window': ('alt', 'printscreen'),
+    'screenshot_rectangular': ('win', 'shift', 's'),  # Windows 10/11 录屏快捷
+    'screen_recording': ('win', 'alt', 'r'),  # Windows 10/11 录屏快捷
+    'game_bar': ('win', 'g'),  # Xbox Game Bar
+
+    # 浏览器/应用常用 (通常在应用内有效)
+    'new_window': ('ctrl', 'n'),
+    'new_tab': ('ctrl', 't'),
+    'close_tab': ('ctrl', 'w'),
+    'reopen_closed_tab': ('ctrl', 'shift', 't'),
+    'next_tab': ('ctrl', 'tab'),
+    'previous_tab': ('ctrl', 'shift', 'tab'),
+    'open_address_bar': ('ctrl', 'l'),
+    'fullscreen': ('f11',),
+    'zoom_in': ('ctrl', '+'),
+    'zoom_out': ('ctrl', '-'),
+    'reset_zoom': ('ctrl', '0'),
+    'save': ('ctrl', 's'),
+
+    # 辅助功能
+    'narrator': ('win', 'ctrl', 'enter'),
+    'magnifier': ('win', '+'),  # 启动并放大
+    'magnifier_zoom_in': ('win', '+'),
+    'magnifier_zoom_out': ('win', '-'),
+    'high_contrast': ('left alt', 'left shift', 'printscreen'),  # 或 Alt+Shift+PrtScn
+
+    # 其他
+    'rename': ('f2',),  # 在文件资源管理器中重命名
+    'properties': ('alt', 'enter'),  # 或 Ctrl+Shift+Esc 打开任务管理器后选中进程按此
+}
@@ -6,6 +6,12 @@ import time
 import pyautogui
 import pyperclip
 
+try:
+    from .action_tables import APP_COMMANDS, MUSIC_ACTIONS, BROWSER_ACTIONS
+except ImportError:
+    # 作为独立脚本运行时
+    from action_tables import APP_COMMANDS, MUSIC_ACTIONS, BROWSER_ACTIONS
+
 def create_and_open_word_doc(file_name=None):
     """
     创建一个新的空白Word文档并尝试打开它。
@@ -157,31 +163,13 @@ def launch_application_smart(app_name: str) -> dict:
                 "app_name": str
             }
     """
-    # 预定义的应用映射
-    app_commands = {
-        "notepad": ["notepad.exe"],
-        "calculator": ["calc.exe"],
-        "explorer": ["explorer.exe"],
-        "cmd": ["cmd.exe"],
-        "powershell": ["powershell.exe"],
-        "chrome": ["start", "chrome"],
-        "edge": ["start", "msedge"],
-        "vscode": ["code"],
-        "word": ["start", "winword"],
-        "excel": ["start", "excel"],
-        "powerpoint": ["start", "powerpnt"],
-        "netease": ["start", "cloudmusic"],  # 网易云音乐
-        "wechat": ["start", "WeChat"],  # 微信
-        "qq": ["start", "QQ"],  # QQ
-        "dingtalk": ["start", "DingTalk"]  # 钉钉
-    }
 
     app_name_lower = app_name.lower()
 
     # 方法1：尝试预定义启动
-    if app_name_lower in app_commands:
+    if app_name_lower in APP_COMMANDS:
         try:
-            cmd = app_commands[app_name_lower]
+            cmd = APP_COMMANDS[app_name_lower]
             subprocess.Popen(cmd, shell=True)
             return {
                 "success": True,
@@ -257,20 +245,6 @@ def control_music_app(actions: list) -> str:
         >>> control_music_app(['volume_up', 'volume_up'])
         '已成功执行以下操作: volume_up, volume_up。'
     """
-    # 根据动作名称，映射到对应的全局快捷键组合
-    action_map = {
-        'play_pause': ('ctrl', 'alt', 'p'),          # 播放/暂停 (网易云音乐)
-        'next_song': ('ctrl', 'alt', 'right'),       # 下一首
-        'previous_song': ('ctrl', 'alt', 'left'),    # 上一首
-        'volume_up': ('ctrl', 'alt', 'up'),          # 音量增加
-        'volume_down': ('ctrl', 'alt', 'down'),      # 音量减少
-        'mini_mode': ('ctrl', 'alt', 'o'),           # 迷你模式（网易云默认）
-        'like_song': ('ctrl', 'alt', 'l'),           # 喜欢当前歌曲
-        'lyrics_toggle': ('ctrl', 'alt', 'd'),       # 歌词开关
-        'mute': ('ctrl', 'alt', 'm'),                # 静音
-        'shuffle': ('ctrl', 'alt', 's'),             # 随机播放
-        'repeat': ('ctrl', 'alt', 'r'),              # 重复播放
-    }
 
     # 分别存储成功和失败的操作
     successful_actions = []
@@ -279,13 +253,13 @@ def control_music_app(actions: list) -> str:
     # 遍历所有请求的操作
     for action in actions:
         # 检查动作是否支持
-        if action not in action_map:
+        if action not in MUSIC_ACTIONS:
             failed_actions.append(f"{action}(不支持的操作)")
             continue
 
         try:
             # 获取对应快捷键
-            keys = action_map[action]
+            keys = MUSIC_ACTIONS[action]
             # 模拟按下快捷键
             pyautogui.hotkey(*keys)
 
@@ -355,26 +329,6 @@ def control_browser_app(actions: list) -> str:
         >>> control_browser_app(['refresh', 'fullscreen'])
         '已成功执行以下浏览器操作: refresh, fullscreen。'
     """
-    # 浏览器快捷键映射
-    action_map = {
-        'new_tab': ('ctrl', 't'),                    # 新建标签页
-        'close_tab': ('ctrl', 'w'),                  # 关闭标签页
-        'next_tab': ('ctrl', 'tab'),                 # 下一个标签页
-        'previous_tab': ('ctrl', 'shift', 'tab'),    # 上一个标签页
-        'reopen_closed_tab': ('ctrl', 'shift', 't'), # 重新打开关闭的标签页
-        'refresh': ('f5',),                          # 刷新
-        'hard_refresh': ('ctrl', 'f5'),              # 强制刷新
-        'back': ('alt', 'left'),                     # 后退
-        'forward': ('alt', 'right'),                 # 前进
-        'home': ('alt', 'home'),                     # 主页
-        'bookmarks': ('ctrl', 'shift', 'o'),         # 书签
-        'history': ('ctrl', 'h'),                    # 历史记录
-        'downloads': ('ctrl', 'j'),                  # 下载
-        'fullscreen': ('f11',),                      # 全屏
-        'zoom_in': ('ctrl', '+'),                    # 放大
-        'zoom_out': ('ctrl', '-'),                   # 缩小
-        'reset_zoom': ('ctrl', '0'),                 # 重置缩放
-    }
 
     # 分别存储成功和失败的操作
     successful_actions = []
@@ -383,13 +337,13 @@ def control_browser_app(actions: list) -> str:
     # 遍历所有请求的操作
     for action in actions:
         # 检查动作是否支持
-        if action not in action_map:
+        if action not in BROWSER_ACTIONS:
             failed_actions.append(f"{action}(不支持的操作)")
             continue
 
         try:
             # 获取对应快捷键
-            keys = action_map[action]
+            keys = BROWSER_ACTIONS[action]
             # 模拟按下快捷键
             pyautogui.hotkey(*keys)
             successful_actions.append(action)
@@ -7,6 +7,8 @@ import time
 import pyautogui
 from typing import List, Dict, Any, Tuple, Optional
 
+from .action_tables import SHORTCUTS
+
 
 class KeyboardShortcutService:
     """
@@ -57,82 +59,7 @@ class KeyboardShortcutService:
 
     def _load_shortcuts(self) -> Dict[str, Tuple]:
         """加载所有预定义快捷键"""
-        return {
-            # 系统相关
-            'lock_screen': ('win', 'l'),
-            'task_manager': ('ctrl', 'shift', 'esc'),
-            'switch_user': ('ctrl', 'alt', 'del'),  # 通常会打开安全选项菜单
-            'log_off': ('win', 'x'),
-            'search_apps': ('win', 'q'),
-            'run_dialog': ('win', 'r'),
-            'file_explorer': ('win', 'e'),
-            'settings': ('win', 'i'),
-            'notifications': ('win', 'a'),
-            'quick_link_menu': ('win', 'x'),  # Win+X 菜单
-            'delete': ('delete',),
-            'enter': ('enter',),
-
-            # 窗口和任务管理
-            'task_view': ('win', 'tab'),
-            'timeline': ('win', 'tab'),  # 在某些版本中与任务视图相同
-            'new_virtual_desktop': ('win', 'ctrl', 'd'),
-            'close_virtual_desktop': ('win', 'ctrl', 'f4'),
-            'switch_desktop_left': ('win', 'ctrl', 'left'),
-            'switch_desktop_right': ('win', 'ctrl', 'right'),
-            'minimize_all': ('win', 'm'),
-            'show_desktop': ('win', 'd'),
-            'maximize_window': ('win', 'up'),
-            'minimize_window': ('win', 'down'),
-            'dock_left': ('win', 'left'),
-            'dock_right': ('win', 'right'),
-
-            # 通用编辑和导航
-            'copy': ('ctrl', 'c'),
-            'cut': ('ctrl', 'x'),
-            'paste': ('ctrl', 'v'),
-            'paste_special': ('ctrl', 'shift', 'v'),  # 某些应用支持
-            'undo': ('ctrl', 'z'),
-            'redo': ('ctrl', 'y'),
-            'select_all': ('ctrl', 'a'),
-            'find': ('ctrl', 'f'),
-            'find_next': ('f3',),
-            'find_previous': ('shift', 'f3'),
-            'replace': ('ctrl', 'h'),
-            'refresh': ('f5',),
-            'hard_refresh': ('ctrl', 'f5'),
-
-            # 截图和录屏 (部分功能可能需要配合 Snipping Tool/截图工具)
-            'screenshot': ('printscreen',),
-            'screenshot_active_window': ('alt', 'printscreen'),
-            'screenshot_rectangular': ('win', 'shift', 's'),  # Windows 10/11 录屏快捷
-            'screen_recording': ('win', 'alt', 'r'),  # Windows 10/11 录屏快捷
-            'game_bar': ('win', 'g'),  # Xbox Game Bar
-
-            # 浏览器/应用常用 (通常在应用内有效)
-            'new_window': ('ctrl', 'n'),
-            'new_tab': ('ctrl', 't'),
-            'close_tab': ('ctrl', 'w'),
-            'reopen_closed_tab': ('ctrl', 'shift', 't'),
-            'next_tab': ('ctrl', 'tab'),
-            'previous_tab': ('ctrl', 'shift', 'tab'),
-            'open_address_bar': ('ctrl', 'l'),
-            'fullscreen': ('f11',),
-            'zoom_in': ('ctrl', '+'),
-            'zoom_out': ('ctrl', '-'),
-            'reset_zoom': ('ctrl', '0'),
-            'save': ('ctrl', 's'),
-
-            # 辅助功能
-            'narrator': ('win', 'ctrl', 'enter'),
-            'magnifier': ('win', '+'),  # 启动并放大
-            'magnifier_zoom_in': ('win', '+'),
-            'magnifier_zoom_out': ('win', '-'),
-            'high_contrast': ('left alt', 'left shift', 'printscreen'),  # 或 Alt+Shift+PrtScn
-
-            # 其他
-            'rename': ('f2',),  # 在文件资源管理器中重命名
-            'properties': ('alt', 'enter'),  # 或 Ctrl+Shift+Esc 打开任务管理器后选中进程按此
-        }
+        return dict(SHORTCUTS)
 
     def execute_shortcut_by_name(self, action: str) -> Dict[str, Any]:
         """
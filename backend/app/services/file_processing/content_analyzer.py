@@ -1,35 +1,48 @@
 import os
 from openai import OpenAI
 import re
-from dotenv import load_dotenv
 
-load_dotenv()  # 默认会加载根目录下的.env文件
+from ...core.rate_limit import get_rate_limiter, estimate_tokens
+from ...core.resilience import protect
+from ...core.token_budget import select_model
+from ...core.usage_ledger import track_usage
+from ...core.config import load_env
+
+# 总结模型候选（按上下文窗口和价格由token_budget选择最便宜且放得下的）
+SUMMARY_MODELS = ["qwen-flash", "qwen-long"]
+# 为总结回复预留的token数
+SUMMARY_RESERVED_TOKENS = 4096
+SUMMARY_SYSTEM_PROMPT = "你是一个处理长文本的模型，你会将接收的文本进行要点与重点的总结整理与分析，并满足用户的要求。内容总结清晰完整。"
 
 def get_file_summary(file_content):
     #realtime_tts_speak("正在总结内容", rate=29000)
-    if len(file_content) > 80000:
+    messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": file_content},
+    ]
+    model = select_model(messages, SUMMARY_MODELS, max_tokens=SUMMARY_RESERVED_TOKENS)
+    if model is None:
         return "文档长度过长。模型无法总结。"
-    elif len(file_content)<6000:
-        model='qwen-flash'
-    else:
-        model='qwen-long'
     try:
+        load_env()  # 读取API Key前加载.env（只加载一次）
         client = OpenAI(
             # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
             api_key=os.getenv("DASHSCOPE_API_KEY"),
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
         )
-        completion = client.chat.completions.create(
-            # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-            model=model,
-            messages=[
-                {"role": "system", "content": "你是一个处理长文本的模型，你会将接收的文本进行要点与重点的总结整理与分析，并满足用户的要求。内容总结清晰完整。"},
-                {"role": "user", "content": file_content},
-            ],
-            # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
-            # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
-            # extra_body={"enable_thinking": False},
-        )
+        # 所有DashScope调用经过统一限流器
+        with protect("dashscope") as timeout, get_rate_limiter("dashscope").slot(estimate_tokens(file_content)):
+            with track_usage("llm", "dashscope", model) as usage:
+                completion = client.chat.completions.create(
+                    # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+                    model=model,
+                    timeout=timeout,
+                    messages=messages,
+                    # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
+                    # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
+                    # extra_body={"enable_thinking": False},
+                )
+                usage.add_usage(completion.usage)
         content = completion.choices[0].message.content
         return content
     except Exception as e:
@@ -39,22 +52,27 @@ def get_file_summary(file_content):
 
 def write_ai_model(user_content):
     try:
+        load_env()
         client = OpenAI(
             # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
             api_key=os.getenv("DASHSCOPE_API_KEY"),
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
         )
-        completion = client.chat.completions.create(
-            # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-            model="qwen-long",
-            messages=[
-                {"role": "system", "content": "你是一个写作模型，为用户生成文稿，要满足用户要求，文稿长度和结构要结合用户的要求和上下文。"},
-                {"role": "user", "content": user_content},
-            ],
-            # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
-            # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
-            # extra_body={"enable_thinking": False},
-        )
+        with protect("dashscope") as timeout, get_rate_limiter("dashscope").slot(estimate_tokens(user_content)):
+            with track_usage("llm", "dashscope", "qwen-long") as usage:
+                completion = client.chat.completions.create(
+                    # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+                    model="qwen-long",
+                    timeout=timeout,
+                    messages=[
+                        {"role": "system", "content": "你是一个写作模型，为用户生成文稿，要满足用户要求，文稿长度和结构要结合用户的要求和上下文。"},
+                        {"role": "user", "content": user_content},
+                    ],
+                    # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
+                    # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
+                    # extra_body={"enable_thinking": False},
+                )
+                usage.add_usage(completion.usage)
         content = completion.choices[0].message.content
         return content
     except Exception as e:
@@ -79,22 +97,27 @@ def extract_code_blocks(text):
 
 def code_ai_model(user_content):
     try:
+        load_env()
         client = OpenAI(
             # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
             api_key=os.getenv("DASHSCOPE_API_KEY"),
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
         )
-        completion = client.chat.completions.create(
-            # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-            model="qwen3-coder-flash",
-            messages=[
-                {"role": "system", "content": "你是代码生成模型，只生成代码，不写除代码外的任何东西，对代码的所有解释都写在代码注释中。"},
-                {"role": "user", "content": user_content},
-            ],
-            # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
-            # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
-            # extra_body={"enable_thinking": False},
-        )
+        with protect("dashscope") as timeout, get_rate_limiter("dashscope").slot(estimate_tokens(user_content)):
+            with track_usage("llm", "dashscope", "qwen3-coder-flash") as usage:
+                completion = client.chat.completions.create(
+                    # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+                    model="qwen3-coder-flash",
+                    timeout=timeout,
+                    messages=[
+                        {"role": "system", "content": "你是代码生成模型，只生成代码，不写除代码外的任何东西，对代码的所有解释都写在代码注释中。"},
+                        {"role": "user", "content": user_content},
+                    ],
+                    # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
+                    # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
+                    # extra_body={"enable_thinking": False},
+                )
+                usage.add_usage(completion.usage)
         content = completion.choices[0].message.content
         content = extract_code_blocks(content)
         return content[0]
@@ -104,22 +127,27 @@ def code_ai_model(user_content):
 
 def code_ai_explain_model(user_content):
     try:
+        load_env()
         client = OpenAI(
             # 若没有配置环境变量，请用百炼API Key将下行替换为：api_key="sk-xxx",
             api_key=os.getenv("DASHSCOPE_API_KEY"),
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
         )
-        completion = client.chat.completions.create(
-            # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
-            model="qwen3-coder-flash",
-            messages=[
-                {"role": "system", "content": "你是一个讲解代码的模型，对接收到的代码内容进行讲解，讲解细致清晰，清晰条理。用户要求简短时，你的回答要简洁简短，500字左右。用户要求详细时，详细讲解代码。"},
-                {"role": "user", "content": user_content},
-            ],
-            # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
-            # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
-            # extra_body={"enable_thinking": False},
-        )
+        with protect("dashscope") as timeout, get_rate_limiter("dashscope").slot(estimate_tokens(user_content)):
+            with track_usage("llm", "dashscope", "qwen3-coder-flash") as usage:
+                completion = client.chat.completions.create(
+                    # 模型列表：https://help.aliyun.com/zh/model-studio/getting-started/models
+                    model="qwen3-coder-flash",
+                    timeout=timeout,
+                    messages=[
+                        {"role": "system", "content": "你是一个讲解代码的模型，对接收到的代码内容进行讲解，讲解细致清晰，清晰条理。用户要求简短时，你的回答要简洁简短，500字左右。用户要求详细时，详细讲解代码。"},
+                        {"role": "user", "content": user_content},
+                    ],
+                    # Qwen3模型通过enable_thinking参数控制思考过程（开源版默认True，商业版默认False）
+                    # 使用Qwen3开源版模型时，若未启用流式输出，请将下行取消注释，否则会报错
+                    # extra_body={"enable_thinking": False},
+                )
+                usage.add_usage(completion.usage)
         content = completion.choices[0].message.content
         # content = extract_code_blocks(content)
         return content
@@ -6,23 +6,16 @@ import math
 import random
 import os
 
-# 初始化DashScope API Key
-try:
-    from ..core.config import get_config
-    config = get_config()
-    dashscope.api_key = config.ai.dashscope.api_key
-except Exception as e:
-    print(f"加载配置失败: {e}")
-    dashscope.api_key = None
-
 mic = None
 stream = None
 last_transcription_time = 0
 transcription_timeout = 1  # 2秒超时
+partial_stable_timeout = 0.3  # 部分识别结果保持不变超过该时间（秒）视为稳定，回调on_partial
 sentences = {}  # 存储不同sentence id的句子
 start_time = 0  # 记录函数开始执行的时间
 # stop_mark = 0
 translator_started = False  # 跟踪语音识别器的状态
+translator = None  # 实时识别器，首次使用时创建
 
 class Callback(TranslationRecognizerCallback):
     def on_open(self) -> None:
@@ -80,15 +73,34 @@ class Callback(TranslationRecognizerCallback):
 
 callback = Callback()
 
-translator = TranslationRecognizerRealtime(
-    model="gummy-realtime-v1",
-    format="pcm",
-    sample_rate=16000,
-    transcription_enabled=True,
-    translation_enabled=True,
-    translation_target_languages=["en"],
-    callback=callback,
-)
+
+def _init_api_key():
+    """初始化DashScope API Key"""
+    try:
+        from ...core.config import get_config
+        config = get_config()
+        dashscope.api_key = config.ai.dashscope.api_key
+    except Exception as e:
+        print(f"加载配置失败: {e}")
+        dashscope.api_key = None
+
+
+def get_translator():
+    """获取实时识别器，首次调用时读取配置并创建（不在模块导入时创建）"""
+    global translator
+    if translator is None:
+        _init_api_key()
+        translator = TranslationRecognizerRealtime(
+            model="gummy-realtime-v1",
+            format="pcm",
+            sample_rate=16000,
+            transcription_enabled=True,
+            translation_enabled=True,
+            translation_target_languages=["en"],
+            callback=callback,
+        )
+    return translator
+
 
 def get_final_transcription():
     """将所有句子按sentence id顺序拼接"""
@@ -99,8 +111,16 @@ def get_final_transcription():
     sentences = {}
     return final_text
 
-def speech_to_text():
+def speech_to_text(on_partial=None):
+    """
+    录音并实时识别，静音超过transcription_timeout后返回最终结果
+
+    on_partial(text)：部分识别结果稳定（不变超过partial_stable_timeout）时回调，
+    可以在用户说完之前提前发起模型请求；每个不同的结果只回调一次
+    """
     global translator_started, stream, mic
+    translator = get_translator()
+    last_partial = None
     try:
         if not translator_started:
             translator.start()
@@ -122,6 +142,17 @@ def speech_to_text():
                 data = stream.read(3200, exception_on_overflow=False)
                 translator.send_audio_frame(data)
 
+                # 部分识别结果稳定时提前回调
+                if (on_partial and 0 in sentences
+                        and time.time() - last_transcription_time > partial_stable_timeout):
+                    partial = "".join(text for _, text in sorted(sentences.items()))
+                    if partial and partial != last_partial:
+                        last_partial = partial
+                        try:
+                            on_partial(partial)
+                        except Exception as e:
+                            print(f"部分识别结果回调失败: {e}")
+
                 # 检查是否超时
                 if sentences and (time.time() - last_transcription_time > transcription_timeout):
                     # 获取第一个键并检查是否为0
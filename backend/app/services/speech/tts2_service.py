@@ -8,7 +8,11 @@ import threading
 import queue
 from dotenv import load_dotenv
 
-load_dotenv()  # 默认会加载根目录下的.env文件
+try:
+    from ...core.settings_store import read_setting
+except ImportError:
+    # 作为独立脚本（tts2）导入时
+    from settings_store import read_setting
 
 
 # 全局控制变量
@@ -18,27 +22,21 @@ playback_finished = threading.Event()
 
 def read_tts_sound_file(file_path="tts_sound.txt"):
     """
-    读取tts_sound.txt文件内容
+    读取tts_sound.txt文件内容（来自设置缓存，修改文件后自动生效）
     文件只有一行文本内容
     """
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            content = file.readline().strip()  # 读取第一行并去除首尾空白字符
-            return content
-    except FileNotFoundError:
-        return "文件未找到"
-    except Exception as e:
-        return f"读取文件时出错: {str(e)}"
+    lines = read_setting(file_path, default="文件未找到").splitlines()
+    return lines[0].strip() if lines else ""  # 读取第一行并去除首尾空白字符
 
-def realtime_tts_speak2(text, voice=read_tts_sound_file(), api_key=os.getenv("ALIBABA_CLOUD_ACCESS_KEY_ID"),
+def realtime_tts_speak2(text, voice=None, api_key=None,
                       rate=27000, volume_threshold=0.14, chunk_size=1024):
     """
     实时语音播报功能函数（支持声音打断）
 
     参数:
     text (str): 要播报的文本内容
-    voice (str): 语音角色，默认为"Ethan"
-    api_key (str): DashScope API密钥
+    voice (str): 语音角色，默认读取tts_sound.txt（female为"Cherry"，否则为"Ethan"）
+    api_key (str): DashScope API密钥，默认读取环境变量ALIBABA_CLOUD_ACCESS_KEY_ID
     rate (int): 音频采样率
     volume_threshold (float): 音量阈值，高于此值则打断播报（范围0-1）
     chunk_size (int): 音频块大小
@@ -47,6 +45,13 @@ def realtime_tts_speak2(text, voice=read_tts_sound_file(), api_key=os.getenv("AL
     int: 1表示被打断，0表示正常播放完成
     """
 
+    # 默认值在调用时读取，而不是在模块导入时固定下来
+    if voice is None:
+        voice = read_tts_sound_file()
+    if api_key is None:
+        load_dotenv()  # 默认会加载根目录下的.env文件
+        api_key = os.getenv("ALIBABA_CLOUD_ACCESS_KEY_ID")
+
     if voice == "female":
         voice = "Cherry"
     else:
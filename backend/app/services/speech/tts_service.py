@@ -5,11 +5,23 @@ import time
 import base64
 import numpy as np
 import json
+import queue
+import threading
 from typing import Optional, Dict, Any
 
+try:
+    from ...core.rate_limit import get_rate_limiter, estimate_tokens
+    from ...core.usage_ledger import track_usage
+except ImportError:
+    # 作为独立脚本（tts）导入时
+    from rate_limit import get_rate_limiter, estimate_tokens
+    from usage_ledger import track_usage
+
 # 用于控制悬浮球输入框禁用状态的标志文件路径
 INPUT_DISABLE_FLAG = "data/input_disabled.flag"
 OUTPUT_FILE = "data/output_message.json"
+# qwen-tts输出24kHz、16位单声道PCM，用于根据音频字节数计算时长
+TTS_BYTES_PER_SECOND = 24000 * 2
 
 def get_voice_from_config() -> str:
     """
@@ -58,21 +70,26 @@ def generate_tts_audio(text: str, voice: Optional[str] = None, api_key: Optional
             raise Exception(f"API密钥配置错误: {e}")
 
     try:
-        # 调用语音合成API
-        responses = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
-            model="qwen-tts",
-            api_key=api_key,
-            text=text,
-            voice=voice,
-            stream=False  # 非流式，返回完整音频
-        )
-
-        # 收集所有音频数据
+        # 调用语音合成API（经过DashScope限流器）
         audio_chunks = []
-        for chunk in responses:
-            if "output" in chunk and "audio" in chunk["output"] and "data" in chunk["output"]["audio"]:
-                audio_string = chunk["output"]["audio"]["data"]
-                audio_chunks.append(audio_string)
+        with get_rate_limiter("dashscope").slot(estimate_tokens(text)), \
+                track_usage("tts", "dashscope", "qwen-tts") as usage:
+            responses = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                model="qwen-tts",
+                api_key=api_key,
+                text=text,
+                voice=voice,
+                stream=False  # 非流式，返回完整音频
+            )
+
+            # 收集所有音频数据
+            for chunk in responses:
+                usage.first_byte()
+                if "output" in chunk and "audio" in chunk["output"] and "data" in chunk["output"]["audio"]:
+                    audio_string = chunk["output"]["audio"]["data"]
+                    audio_chunks.append(audio_string)
+                    # base64每4个字符对应3个字节
+                    usage.add_audio(len(audio_string) * 3 / 4 / TTS_BYTES_PER_SECOND)
 
         if audio_chunks:
             # 合并所有音频块
@@ -123,24 +140,43 @@ def realtime_tts_speak(text: str, voice: Optional[str] = None, api_key: Optional
                         rate=rate,
                         output=True)
 
+        # 接收线程把解码后的音频放入队列，当前线程边收边播；None表示接收结束
+        audio_chunks: queue.Queue = queue.Queue()
+
+        def receive():
+            try:
+                # 只在接收期间占用DashScope限流器的并发槽位并计入用量（延迟不含本地播放时间）
+                with get_rate_limiter("dashscope").slot(estimate_tokens(text)), \
+                        track_usage("tts", "dashscope", "qwen-tts") as usage:
+                    responses = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
+                        model="qwen-tts",
+                        api_key=api_key,
+                        text=text,
+                        voice=voice,
+                        stream=True
+                    )
+                    for chunk in responses:
+                        usage.first_byte()
+                        if "output" in chunk and "audio" in chunk["output"] and "data" in chunk["output"]["audio"]:
+                            wav_bytes = base64.b64decode(chunk["output"]["audio"]["data"])
+                            usage.add_audio(len(wav_bytes) / TTS_BYTES_PER_SECOND)
+                            audio_chunks.put(wav_bytes)
+            except Exception as e:
+                print(f"语音合成出错: {e}")
+            finally:
+                audio_chunks.put(None)
+
         try:
-            # 调用语音合成API
-            responses = dashscope.audio.qwen_tts.SpeechSynthesizer.call(
-                model="qwen-tts",
-                api_key=api_key,
-                text=text,
-                voice=voice,
-                stream=True
-            )
+            threading.Thread(target=receive, daemon=True).start()
 
             # 实时播放音频数据
-            for chunk in responses:
-                if "output" in chunk and "audio" in chunk["output"] and "data" in chunk["output"]["audio"]:
-                    audio_string = chunk["output"]["audio"]["data"]
-                    wav_bytes = base64.b64decode(audio_string)
-                    audio_np = np.frombuffer(wav_bytes, dtype=np.int16)
-                    # 直接播放音频数据
-                    stream.write(audio_np.tobytes())
+            while True:
+                wav_bytes = audio_chunks.get()
+                if wav_bytes is None:
+                    break
+                audio_np = np.frombuffer(wav_bytes, dtype=np.int16)
+                # 直接播放音频数据
+                stream.write(audio_np.tobytes())
 
             # 等待播放完成
             time.sleep(0.8)
@@ -3,6 +3,13 @@ import os
 import base64
 import random
 
+from ...core.rate_limit import get_rate_limiter, estimate_tokens
+from ...core.resilience import protect
+from ...core.usage_ledger import track_usage
+
+# 单张图片按约1280个token估算，用于TPM限流
+IMAGE_TOKEN_ESTIMATE = 1280
+
 #  base 64 编码格式
 def encode_image(image_path):
     with open(image_path, "rb") as image_file:
@@ -110,28 +117,32 @@ def get_image_response(user_content, path="imgs/test.png"):
         print("✅ [DEBUG] OpenAI客户端初始化成功")
 
         print("🔍 [DEBUG] 正在调用DashScope API...")
-        completion = client.chat.completions.create(
-            model="qwen-vl-plus",
-            messages=[
-                {
-                  "role": "user",
-                  "content": [
-                    {
-                      "type": "text",
-                      "text": user_content
-                    },
-                    {
-                      "type": "image_url",
-                      "image_url": {
-                        "url": f"data:image/jpeg;base64,{base64_image}"
-                      }
-                    }
-                  ]
-                }
-              ],
-              # stream=True,
-              # stream_options={"include_usage":True}
-            )
+        with protect("dashscope") as timeout, get_rate_limiter("dashscope").slot(estimate_tokens(user_content) + IMAGE_TOKEN_ESTIMATE):
+            with track_usage("vl", "dashscope", "qwen-vl-plus") as usage:
+                completion = client.chat.completions.create(
+                    model="qwen-vl-plus",
+                    timeout=timeout,
+                    messages=[
+                        {
+                          "role": "user",
+                          "content": [
+                            {
+                              "type": "text",
+                              "text": user_content
+                            },
+                            {
+                              "type": "image_url",
+                              "image_url": {
+                                "url": f"data:image/jpeg;base64,{base64_image}"
+                              }
+                            }
+                          ]
+                        }
+                      ],
+                      # stream=True,
+                      # stream_options={"include_usage":True}
+                    )
+                usage.add_usage(completion.usage)
 
         print("✅ [DEBUG] API调用成功")
         print(f"🔍 [DEBUG] API响应类型: {type(completion)}")
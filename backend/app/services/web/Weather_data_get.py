@@ -3,11 +3,15 @@ from urllib.parse import quote
 import time
 import webbrowser
 
+from ...core.resilience import protect
+
 def get_city_by_ip():
     try:
         # 添加lang=zh-CN参数指定返回中文结果
-        response = requests.get('http://ip-api.com/json/?lang=zh-CN')
-        data = response.json()
+        with protect("ip_api") as timeout:
+            response = requests.get('http://ip-api.com/json/?lang=zh-CN', timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
         #print(data)  # 打印完整返回数据，方便调试
 
         # 提取城市信息
@@ -49,9 +53,10 @@ def get_weather_use_url(city_name):
         'timestamp': str(int(time.time() * 1000)),
     }
 
-    response = requests.get('https://weather.cma.cn/api/autocomplete', params=params, headers=headers)
-
-    data = response.json()
+    with protect("cma_weather") as timeout:
+        response = requests.get('https://weather.cma.cn/api/autocomplete', params=params, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
     city_code = data["data"][0].split("|")[0]
 
     open_url = "https://weather.cma.cn/web/weather/"+city_code+".html"
@@ -61,7 +66,9 @@ def get_weather_use_url(city_name):
     print(city_code, data["data"][0])
 
     url = "https://weather.cma.cn/api/now/"
-    response = requests.get(url + city_code, headers=headers)
+    with protect("cma_weather") as timeout:
+        response = requests.get(url + city_code, headers=headers, timeout=timeout)
+        response.raise_for_status()
     print(response.json())
     return response.json()
 
@@ -5,9 +5,15 @@ import os
 import time
 import pyperclip
 import pyautogui
-from dotenv import load_dotenv
 
-load_dotenv()  # 默认会加载根目录下的.env文件
+from ...core.config import load_env
+from ...core.resilience import protect
+
+
+def _check_status(res):
+    """秘塔服务端错误（5xx）和限流（429）计入熔断"""
+    if res.status == 429 or res.status >= 500:
+        raise ConnectionError(f"秘塔服务返回{res.status} {res.reason}")
 
 def search_chat2(content: str):
     """
@@ -60,7 +66,6 @@ def search_chat2(content: str):
                 config = SimpleConfig(api_key)
                 print(f"DEBUG: 使用fallback配置，API密钥: {config.ai.metas.api_key}")
 
-        conn = http.client.HTTPSConnection("metaso.cn")
         payload = json.dumps(
             {"q": content, "scope": "webpage", "includeSummary": False, "size": "10", "includeRawContent": True,
              "conciseSnippet": False})
@@ -74,13 +79,16 @@ def search_chat2(content: str):
         print(f"DEBUG: Headers: {headers}")
         print(f"DEBUG: Payload: {payload}")
 
-        conn.request("POST", "/api/v1/search", payload, headers)
-        res = conn.getresponse()
+        with protect("metaso") as timeout:
+            conn = http.client.HTTPSConnection("metaso.cn", timeout=timeout)
+            conn.request("POST", "/api/v1/search", payload, headers)
+            res = conn.getresponse()
 
-        print(f"DEBUG: 响应状态码: {res.status}")
-        print(f"DEBUG: 响应原因: {res.reason}")
+            print(f"DEBUG: 响应状态码: {res.status}")
+            print(f"DEBUG: 响应原因: {res.reason}")
 
-        data = res.read()
+            data = res.read()
+            _check_status(res)
         response_text = data.decode("utf-8")
         print(f"DEBUG: 响应内容: {response_text}")
 
@@ -97,16 +105,19 @@ def search_chat(content: str) -> str:
     """
     try:
         # 移除TTS调用，在API服务中不需要
-        conn = http.client.HTTPSConnection("metaso.cn")
         payload = json.dumps({"q": content, "model": "fast", "format": "simple"})
+        load_env()  # 读取API Key前加载.env（只加载一次）
         headers = {
           'Authorization': 'Bearer '+os.getenv("METASO_API_KEY"),
           'Accept': 'application/json',
           'Content-Type': 'application/json'
         }
-        conn.request("POST", "/api/v1/chat/completions", payload, headers)
-        res = conn.getresponse()
-        data = res.read()
+        with protect("metaso") as timeout:
+            conn = http.client.HTTPSConnection("metaso.cn", timeout=timeout)
+            conn.request("POST", "/api/v1/chat/completions", payload, headers)
+            res = conn.getresponse()
+            data = res.read()
+            _check_status(res)
 
         # 解析JSON响应
         json_data = json.loads(data.decode("utf-8"))
@@ -137,16 +148,19 @@ def open_webpage(content: str) -> (list, str):
     :return: 包含网页标题和链接的列表
     """
     #realtime_tts_speak("好的，马上打开", rate=25000)
-    conn = http.client.HTTPSConnection("metaso.cn")
     payload = json.dumps({"q": content, "scope": "webpage", "includeSummary": True, "size": "5", "includeRawContent": False, "conciseSnippet": False})
+    load_env()
     headers = {
       'Authorization': 'Bearer '+os.getenv("METASO_API_KEY"),
       'Accept': 'application/json',
       'Content-Type': 'application/json'
     }
-    conn.request("POST", "/api/v1/search", payload, headers)
-    res = conn.getresponse()
-    data = res.read()
+    with protect("metaso") as timeout:
+        conn = http.client.HTTPSConnection("metaso.cn", timeout=timeout)
+        conn.request("POST", "/api/v1/search", payload, headers)
+        res = conn.getresponse()
+        data = res.read()
+        _check_status(res)
     # 解析JSON响应
     json_data = json.loads(data.decode("utf-8"))
     # 提取webpages中的title和link
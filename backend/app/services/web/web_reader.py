@@ -5,9 +5,10 @@ import time
 import http.client
 import json
 import os
-from dotenv import load_dotenv
 
-load_dotenv()  # 默认会加载根目录下的.env文件
+from ...core.config import load_env
+from ...core.resilience import protect
+from .search import _check_status
 
 def extract_current_webpage_url():
     """
@@ -70,16 +71,19 @@ def read_webpage():
         return "无法获取当前浏览器URL，请确保浏览器窗口处于活动状态"
 
     try:
-        conn = http.client.HTTPSConnection("metaso.cn")
         payload = json.dumps({"url": url})
+        load_env()  # 读取API Key前加载.env（只加载一次）
         headers = {
             'Authorization': 'Bearer '+os.getenv("METASO_API_KEY"),
             'Accept': 'text/plain',
             'Content-Type': 'application/json'
         }
-        conn.request("POST", "/api/v1/reader", payload, headers)
-        res = conn.getresponse()
-        data = res.read()
+        with protect("metaso") as timeout:
+            conn = http.client.HTTPSConnection("metaso.cn", timeout=timeout)
+            conn.request("POST", "/api/v1/reader", payload, headers)
+            res = conn.getresponse()
+            data = res.read()
+            _check_status(res)
         return data.decode("utf-8")
     except Exception as e:
         return f"网页读取失败: {str(e)}"
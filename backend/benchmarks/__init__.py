@@ -0,0 +1,4 @@
+"""
+AI Agent Floating Ball - Benchmarks
+离线性能基准脚本（使用本地模拟服务，不访问真实上游）
+"""
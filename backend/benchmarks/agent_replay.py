@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+"""
+智能体录制/回放基准
+
+record: 在真实环境（DashScope/Moonshot + 本地MCP服务器）中执行一条指令，把模型请求与响应、
+        工具目录、工具调用与结果以及各阶段耗时写入fixture（JSON）
+replay: 离线回放fixture。模型由本地OpenAI兼容模拟服务按录制顺序返回，MCP工具由进程内的
+        FastMCP模拟服务返回录制结果。输出各阶段（上下文、视觉预处理、模型、工具、语音播报）的耗时，
+        这样在没有网络的Linux机器上也能衡量智能体循环的改动
+
+支持两种客户端：agent（app/core/agent_client.py 的 MCPClient）和 smart（smart_mcp_client.py 的 SmartMCPClient）
+
+用法（在 backend 目录下）:
+    python -m benchmarks.agent_replay record "打开网易云并播放" --name netease_play
+    python -m benchmarks.agent_replay record "把这个表格转成Excel" --image imgs/test.png --tts
+    python -m benchmarks.agent_replay record "今天天气怎么样" --client smart
+    python -m benchmarks.agent_replay replay benchmarks/fixtures/netease_play.json --repeat 5 --speed 0
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+FIXTURES_DIR = BACKEND_DIR / "benchmarks" / "fixtures"
+
+# agent_client 按独立脚本的方式导入同目录模块（tts2、get_active_window等），smart_mcp_client 位于仓库根目录
+sys.path.insert(0, str(BACKEND_DIR / "app" / "core"))
+sys.path.insert(0, str(BACKEND_DIR.parent))
+
+# 报告中的阶段及名称
+STAGES = {
+    "context": "上下文",
+    "vision": "视觉预处理",
+    "llm": "模型",
+    "tools": "工具",
+    "tts": "语音播报",
+}
+# 请求日志中data URL只保留的前缀长度
+DATA_URL_PREVIEW = 64
+
+
+class StageTimer:
+    """按阶段记录时间区间；同一阶段并发的区间（如并发的工具调用）按墙钟覆盖时间合并"""
+
+    def __init__(self):
+        self.intervals: Dict[str, List[tuple]] = defaultdict(list)
+
+    def add(self, stage: str, start: float, end: float):
+        self.intervals[stage].append((start, end))
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, start, time.perf_counter())
+
+    def totals(self) -> Dict[str, float]:
+        totals = {}
+        for stage, intervals in self.intervals.items():
+            covered, current_start, current_end = 0.0, None, None
+            for start, end in sorted(intervals):
+                if current_end is None or start > current_end:
+                    if current_end is not None:
+                        covered += current_end - current_start
+                    current_start, current_end = start, end
+                else:
+                    current_end = max(current_end, end)
+            if current_end is not None:
+                covered += current_end - current_start
+            totals[stage] = covered
+        return totals
+
+
+def _redact(value: Any) -> Any:
+    """请求日志中截断图片的data URL"""
+    if isinstance(value, str) and value.startswith("data:") and len(value) > DATA_URL_PREVIEW:
+        return f"{value[:DATA_URL_PREVIEW]}...({len(value)}字符)"
+    if isinstance(value, list):
+        return [_redact(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _redact(item) for key, item in value.items()}
+    return value
+
+
+def _is_vision_request(params: Dict[str, Any]) -> bool:
+    """不带工具、消息中包含图片的请求视为视觉预处理"""
+    if params.get("tools"):
+        return False
+    for message in params.get("messages", []):
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+class TimedLLM:
+    """包装OpenAI客户端的 chat.completions.create，记录每次请求的阶段、耗时，录制时同时记录请求和响应"""
+
+    def __init__(self, client, timer: StageTimer, log: Optional[List[Dict]] = None):
+        self._client = client
+        self.timer = timer
+        self.log = log
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **params):
+        stage = "vision" if _is_vision_request(params) else "llm"
+        start = time.perf_counter()
+        response = self._client.chat.completions.create(**params)
+        end = time.perf_counter()
+        self.timer.add(stage, start, end)
+        if self.log is not None:
+            self.log.append({
+                "stage": stage,
+                "model": params.get("model"),
+                "messages": _redact(params.get("messages", [])),
+                "tools": [tool["function"]["name"] for tool in params.get("tools") or []],
+                "seconds": end - start,
+                "response": response.model_dump(exclude_none=True),
+            })
+        return response
+
+
+class TimedSession:
+    """包装MCPSession，记录工具调用的耗时；录制时同时记录工具目录和每次调用的参数与结果"""
+
+    def __init__(self, session, timer: StageTimer, log: Optional[List[Dict]] = None,
+                 catalog: Optional[List[Dict]] = None):
+        self._session = session
+        self.timer = timer
+        self.log = log
+        self.catalog = catalog
+
+    def __getattr__(self, name):
+        return getattr(self._session, name)
+
+    async def list_tools(self):
+        tools = await self._session.list_tools()
+        if self.catalog is not None:
+            self.catalog[:] = [tool["function"] for tool in tools]
+        return tools
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], timeout: Optional[float] = None):
+        start = time.perf_counter()
+        try:
+            result = await self._session.call_tool(name, arguments, timeout=timeout)
+        except Exception as e:
+            self._record(name, arguments, str(e), True, start)
+            raise
+        text = result.content[0].text if result.content else ""
+        self._record(name, arguments, text, bool(getattr(result, "is_error", False)), start)
+        return result
+
+    def _record(self, name: str, arguments: Dict[str, Any], result: str, is_error: bool, start: float):
+        end = time.perf_counter()
+        self.timer.add("tools", start, end)
+        if self.log is not None:
+            self.log.append({
+                "name": name,
+                "arguments": arguments,
+                "result": result,
+                "is_error": is_error,
+                "seconds": end - start,
+            })
+
+
+def _call_key(name: str, arguments: Dict[str, Any]) -> str:
+    return name + json.dumps(arguments, ensure_ascii=False, sort_keys=True)
+
+
+def create_replay_mcp(catalog: List[Dict[str, Any]], calls: List[Dict[str, Any]], speed: float = 1.0):
+    """
+    创建进程内的FastMCP模拟服务：工具目录与录制时一致，调用时按录制顺序返回录制的结果
+
+    参数与录制时完全相同的调用优先匹配，其次按工具名匹配；都没有时返回错误
+    """
+    from fastmcp import FastMCP
+    from fastmcp.exceptions import ToolError
+    from fastmcp.tools.tool import Tool, ToolResult
+    from pydantic import PrivateAttr
+
+    exact = defaultdict(deque)
+    by_name = defaultdict(deque)
+    for call in calls:
+        exact[_call_key(call["name"], call["arguments"])].append(call)
+        by_name[call["name"]].append(call)
+
+    class ReplayTool(Tool):
+        _speed: float = PrivateAttr(default=1.0)
+
+        async def run(self, arguments: Dict[str, Any]) -> ToolResult:
+            queue = exact.get(_call_key(self.name, arguments))
+            if not queue:
+                queue = by_name.get(self.name)
+            if not queue:
+                raise ToolError(f"fixture中没有工具 {self.name} 的调用记录")
+            call = queue.popleft()
+            # 同一条记录不再被另一种方式匹配到
+            for other in (exact[_call_key(call["name"], call["arguments"])], by_name[call["name"]]):
+                if call in other:
+                    other.remove(call)
+            await asyncio.sleep(call.get("seconds", 0.0) * self._speed)
+            if call.get("is_error"):
+                raise ToolError(call["result"])
+            return ToolResult(content=call["result"])
+
+    mcp = FastMCP("Agent Replay")
+    for spec in catalog:
+        tool = ReplayTool(
+            name=spec["name"],
+            description=spec.get("description") or "",
+            parameters=spec.get("parameters") or {"type": "object", "properties": {}},
+        )
+        tool._speed = speed
+        mcp.add_tool(tool)
+    return mcp
+
+
+async def _speak(text: str):
+    """语音播报（录制时使用真实TTS）"""
+    try:
+        from tts2 import realtime_tts_speak2
+    except ImportError:
+        from app.services.speech.tts2_service import realtime_tts_speak2
+    await asyncio.to_thread(realtime_tts_speak2, text)
+
+
+async def run_turn(kind: str, client, instruction: str, image_path: Optional[str], timer: StageTimer,
+                   speak: Optional[Callable] = None) -> Dict[str, Any]:
+    """按悬浮球文字请求的处理流程执行一条指令，返回 {"answer", "context", "total"}"""
+    started = time.perf_counter()
+    context = None
+
+    if kind == "agent":
+        with timer.measure("context"):
+            context = await client.context.collect()
+        response = await client.fast_path(instruction)
+        if response is None:
+            question = client.build_question(instruction, context)
+            response = await client.answer(instruction, context["window"], [{"role": "user", "content": question}],
+                                           image_path=image_path, context=context)
+        answer = response.content
+    else:
+        with timer.measure("context"):
+            client.build_context()
+        answer = await client.process_instruction(instruction)
+
+    if speak is not None and answer:
+        with timer.measure("tts"):
+            await speak(answer)
+
+    return {"answer": answer, "context": context, "total": time.perf_counter() - started}
+
+
+def _format_stages(totals: Dict[str, float], total: float) -> Dict[str, float]:
+    stages = {stage: round(totals.get(stage, 0.0), 4) for stage in STAGES}
+    stages["other"] = round(max(0.0, total - sum(stages.values())), 4)
+    stages["total"] = round(total, 4)
+    return stages
+
+
+# =============================================================================
+# 录制
+# =============================================================================
+
+async def record(args) -> Path:
+    from app.core.plan_cache import PlanCache
+
+    timer = StageTimer()
+    llm_log: List[Dict] = []
+    tool_log: List[Dict] = []
+    catalog: List[Dict] = []
+
+    if args.client == "agent":
+        from app.core.agent_client import MCPClient
+
+        client = MCPClient(args.mcp_url)
+        client.client = TimedLLM(client.client, timer, llm_log)
+        client.session = TimedSession(client.session, timer, tool_log, catalog)
+        # 不使用也不写入计划缓存，录制的是完整的规划过程
+        client.plans = PlanCache(path=None)
+        await client.session.connect(retries=3)
+        client.context.start()
+    else:
+        from smart_mcp_client import SmartMCPClient
+
+        client = SmartMCPClient(args.mcp_url.rsplit("/mcp", 1)[0], config_path=str(BACKEND_DIR / "config.json"))
+        client.openai_client = TimedLLM(client.openai_client, timer, llm_log)
+        client.mcp_session = TimedSession(client.mcp_session, timer, tool_log, catalog)
+        if not await client.initialize():
+            raise SystemExit("MCP服务器连接失败")
+
+    try:
+        turn = await run_turn(args.client, client, args.instruction, args.image, timer,
+                              _speak if args.tts else None)
+        # 目录在对话中可能未被拉取（如走本地意图路由），确保fixture中有工具目录
+        if not catalog:
+            await (client.session if args.client == "agent" else client.mcp_session).list_tools()
+    finally:
+        if args.client == "agent":
+            client.context.stop()
+            await client.session.close()
+        else:
+            await client.mcp_session.close()
+
+    name = args.name or datetime.now().strftime("turn_%Y%m%d_%H%M%S")
+    FIXTURES_DIR.mkdir(parents=True, exist_ok=True)
+    image = None
+    if args.image:
+        image = name + Path(args.image).suffix
+        shutil.copyfile(args.image, FIXTURES_DIR / image)
+
+    context = turn["context"] or {}
+    fixture = {
+        "name": name,
+        "client": args.client,
+        "instruction": args.instruction,
+        "window": context.get("window", ""),
+        "file_path": context.get("file_path", ""),
+        "image": image,
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "catalog": catalog,
+        "llm": llm_log,
+        "tools": tool_log,
+        "answer": turn["answer"],
+        "stages": _format_stages(timer.totals(), turn["total"]),
+    }
+    path = FIXTURES_DIR / f"{name}.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, indent=2)
+
+    print(f"已录制: {path}（模型请求{len(llm_log)}次，工具调用{len(tool_log)}次）")
+    print_report(fixture["stages"], None)
+    return path
+
+
+# =============================================================================
+# 回放
+# =============================================================================
+
+async def replay_once(fixture: Dict[str, Any], base_url: str, speed: float, fixture_dir: Path) -> Dict[str, Any]:
+    from openai import OpenAI
+    from app.core.context_provider import ContextProvider
+    from app.core.mcp_session import MCPSession
+    from app.core.plan_cache import PlanCache
+
+    timer = StageTimer()
+    llm_client = TimedLLM(OpenAI(api_key="replay", base_url=base_url, max_retries=0), timer)
+    # MCPSession（fastmcp.Client）可以直接连接进程内的FastMCP实例
+    server = create_replay_mcp(fixture["catalog"], fixture["tools"], speed)
+    tool_log: List[Dict] = []
+    session = TimedSession(MCPSession(server), timer, tool_log)
+    image_path = str(fixture_dir / fixture["image"]) if fixture.get("image") else None
+
+    if fixture["client"] == "agent":
+        from app.core.agent_client import MCPClient
+
+        window, file_path = fixture.get("window", ""), fixture.get("file_path", "")
+        client = MCPClient(server, llm_client=llm_client,
+                           context=ContextProvider(lambda: window, lambda: file_path))
+        client.session = session
+        client.plans = PlanCache(path=None)
+        await session.connect(retries=0)
+        client.context.start()
+    else:
+        from smart_mcp_client import SmartMCPClient
+
+        # 回放不访问上游，只需要满足构造函数对API key的检查
+        os.environ.setdefault("MOONSHOT_API_KEY", "replay")
+        client = SmartMCPClient(config_path=str(BACKEND_DIR / "config.json"))
+        client.openai_client = llm_client
+        client.mcp_session = session
+        await client.initialize()
+
+    async def speak(_text):
+        await asyncio.sleep(fixture["stages"].get("tts", 0.0) * speed)
+
+    try:
+        turn = await run_turn(fixture["client"], client, fixture["instruction"], image_path, timer,
+                              speak if fixture["stages"].get("tts") else None)
+    finally:
+        if fixture["client"] == "agent":
+            client.context.stop()
+        await session.close()
+
+    return {
+        "answer": turn["answer"],
+        "tool_calls": len(tool_log),
+        "stages": _format_stages(timer.totals(), turn["total"]),
+    }
+
+
+def replay(args):
+    from benchmarks.mock_openai_server import create_scripted_app, serve_in_thread
+
+    fixture_path = Path(args.fixture)
+    with open(fixture_path, "r", encoding="utf-8") as f:
+        fixture = json.load(f)
+
+    app = create_scripted_app(fixture["llm"], speed=args.speed)
+    runs = []
+    with serve_in_thread(app) as base_url:
+        for i in range(args.repeat):
+            app.state.cursor = 0
+            app.state.requests = []
+            run = asyncio.run(replay_once(fixture, base_url, args.speed, fixture_path.parent))
+            run["llm_calls"] = len(app.state.requests)
+            runs.append(run)
+
+            # 请求数或工具调用数与录制时不同，说明智能体循环的行为已经改变（回放结果不再可比）
+            if run["llm_calls"] != len(fixture["llm"]) or run["tool_calls"] != len(fixture["tools"]):
+                print(f"⚠️ 第{i + 1}次回放与录制不一致: 模型请求 {run['llm_calls']}/{len(fixture['llm'])}，"
+                      f"工具调用 {run['tool_calls']}/{len(fixture['tools'])}")
+
+    replayed = {key: statistics.median(run["stages"][key] for run in runs) for key in runs[0]["stages"]}
+    print(f"回放: {fixture['name']}（{fixture['client']}，{args.repeat}次，延迟倍率{args.speed}）")
+    print(f"指令: {fixture['instruction']}")
+    print(f"回答: {runs[-1]['answer']}")
+    print_report(fixture["stages"], replayed)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"fixture": str(fixture_path), "speed": args.speed, "runs": runs, "median": replayed},
+                      f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.save}")
+
+
+def print_report(recorded: Dict[str, float], replayed: Optional[Dict[str, float]]):
+    labels = dict(STAGES, other="其他", total="总计")
+    header = f"{'阶段':<10}{'录制(s)':>10}" + (f"{'回放中位数(s)':>16}" if replayed else "")
+    print(header)
+    for key, label in labels.items():
+        line = f"{label:<10}{recorded.get(key, 0.0):>10.3f}"
+        if replayed:
+            line += f"{replayed.get(key, 0.0):>16.3f}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智能体录制/回放基准")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = subparsers.add_parser("record", help="在真实环境中执行一条指令并录制为fixture")
+    record_parser.add_argument("instruction", help="用户指令")
+    record_parser.add_argument("--name", help="fixture名称（默认按时间生成）")
+    record_parser.add_argument("--client", choices=("agent", "smart"), default="agent", help="要录制的客户端")
+    record_parser.add_argument("--image", help="随指令附带的截图")
+    record_parser.add_argument("--tts", action="store_true", help="同时录制语音播报耗时")
+    record_parser.add_argument("--mcp-url", default="http://localhost:9000/mcp", help="MCP服务器地址")
+
+    replay_parser = subparsers.add_parser("replay", help="离线回放fixture并输出各阶段耗时")
+    replay_parser.add_argument("fixture", help="fixture文件路径")
+    replay_parser.add_argument("--repeat", type=int, default=3, help="回放次数（取中位数）")
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="录制延迟的倍率：1按录制耗时等待，0只测量本地开销")
+    replay_parser.add_argument("--save", help="把每次回放的结果保存为JSON")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        asyncio.run(record(args))
+    else:
+        replay(args)
+
+
+if __name__ == "__main__":
+    main()
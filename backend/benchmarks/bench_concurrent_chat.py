@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+并发聊天基准测试
+
+对本地模拟服务并发发起 N 个 chat_completion 请求，验证总耗时接近
+ceil(N / 提供商并发上限) 轮的延迟（而不是延迟之和），并统计事件循环在此期间的最大卡顿。
+
+每个请求的内容各不相同并绕过响应缓存，不会被请求合并（SingleFlight）或缓存命中掩盖。
+提供商的并发上限来自config.json中的rate_limits，可用 --max-concurrency 覆盖（0表示不限制）。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_concurrent_chat --concurrency 20 --delay 0.5
+    python -m benchmarks.bench_concurrent_chat --concurrency 20 --delay 0.5 --max-concurrency 0
+"""
+
+import argparse
+import asyncio
+import math
+import time
+from typing import Optional
+
+from app.core.config import get_config
+from app.core.ai_clients import AIClientManager
+from app.core.rate_limit import get_rate_limiter
+from app.core.routing import get_route_policy
+from benchmarks.mock_openai_server import create_mock_app, serve_in_thread
+
+
+async def _heartbeat(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """记录事件循环的最大调度延迟"""
+    max_lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def run_benchmark(concurrency: int) -> dict:
+    manager = AIClientManager()
+    provider = get_route_policy(None).providers[0]
+
+    async def one_call(index: int) -> float:
+        # 每个请求内容不同且绕过缓存，保证都实际发往上游
+        messages = [{"role": "user", "content": f"你好 #{index}"}]
+        start = time.perf_counter()
+        await manager.chat_completion(messages, cache=False)
+        return time.perf_counter() - start
+
+    try:
+        # 预热连接池
+        await one_call(-1)
+
+        stop = asyncio.Event()
+        heartbeat = asyncio.create_task(_heartbeat(stop))
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(one_call(index) for index in range(concurrency)))
+        wall = time.perf_counter() - start
+
+        stop.set()
+        max_lag = await heartbeat
+    finally:
+        collapsed = manager.singleflight.stats()["namespaces"].get("chat", {}).get("collapsed", 0)
+        await manager.aclose()
+
+    return {
+        "concurrency": concurrency,
+        "provider": provider,
+        "max_concurrency": get_rate_limiter(provider).max_concurrency,
+        "collapsed": collapsed,
+        "wall": wall,
+        "max_latency": max(latencies),
+        "sum_latency": sum(latencies),
+        "max_loop_lag": max_lag
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发聊天基准测试")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发请求数")
+    parser.add_argument("--delay", type=float, default=0.5, help="模拟服务的响应延迟（秒）")
+    parser.add_argument("--max-concurrency", type=int, default=None,
+                        help="覆盖提供商限流器的并发上限（0表示不限制，默认使用config.json）")
+    args = parser.parse_args()
+
+    with serve_in_thread(create_mock_app(delay=args.delay)) as base_url:
+        # 将所有提供商指向本地模拟服务
+        config = get_config()
+        # 基准测试的调用不写入用量账本（data/usage），避免混入真实用量
+        config.usage.enabled = False
+        config.ai.moonshot.base_url = base_url
+        config.ai.dashscope.base_url = base_url
+        if args.max_concurrency is not None:
+            for limits in config.rate_limits.values():
+                limits.max_concurrency = args.max_concurrency
+
+
+        result = asyncio.run(run_benchmark(args.concurrency))
+
+    cap = result["max_concurrency"]
+    rounds = math.ceil(result["concurrency"] / cap) if cap > 0 else 1
+    print(f"并发数:           {result['concurrency']}")
+    print(f"并发上限:         {cap or '不限制'}（{result['provider']}），至少需要{rounds}轮")
+    print(f"合并的请求数:     {result['collapsed']}")
+    print(f"总耗时:           {result['wall']:.3f}s")
+    print(f"单次最大延迟:     {result['max_latency']:.3f}s")
+    print(f"延迟之和:         {result['sum_latency']:.3f}s")
+    print(f"事件循环最大卡顿: {result['max_loop_lag'] * 1000:.1f}ms")
+    print(f"总耗时/最大延迟:  {result['wall'] / result['max_latency']:.2f}x")
+    print(f"总耗时/理论下限:  {result['wall'] / (rounds * args.delay):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
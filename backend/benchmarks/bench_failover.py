@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+提供商故障转移与对冲请求基准测试
+
+启动两个本地模拟服务分别充当 moonshot 和 dashscope，注入延迟和5xx故障，
+检查路由策略的行为（不符合预期时抛出AssertionError，进程以非0退出）：
+1. 主提供商返回503 -> 自动切换到备用提供商
+2. 主提供商变慢 -> 对冲请求在p95阈值后发出，取先返回者
+3. 主提供商超时 -> 切换到备用提供商
+4. 主提供商持续503 -> 熔断打开，之后的请求不再发往主提供商
+
+每个场景检查由哪个提供商返回、主/备提供商各收到的请求数以及熔断器状态。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_failover
+"""
+
+import asyncio
+import time
+
+from app.core.config import get_config, RouteConfig
+from app.core.ai_clients import AIClientManager
+from app.core.resilience import get_breaker
+from benchmarks.mock_openai_server import create_mock_app, serve_in_thread
+
+
+def check(condition: bool, message: str):
+    """检查场景结果（不依赖assert语句，python -O下同样生效）"""
+    if not condition:
+        raise AssertionError(message)
+
+
+async def timed_chat(manager: AIClientManager, route: str) -> tuple:
+    start = time.perf_counter()
+    response = await manager.chat_completion(
+        [{"role": "user", "content": f"ping {time.time()}"}],
+        route=route,
+        cache=False
+    )
+    return response, time.perf_counter() - start
+
+
+async def scenario(name: str, manager: AIClientManager, route: str, primary_app, secondary_app,
+                   provider: str, primary_requests: int, secondary_requests: int,
+                   max_latency: float, breaker: str = "closed") -> dict:
+    """
+    执行一次请求并检查结果
+
+    - provider: 应返回响应的提供商
+    - primary_requests / secondary_requests: 主/备提供商应收到的请求数
+    - max_latency: 耗时上限（秒）
+    - breaker: 请求后主提供商熔断器应处于的状态
+    """
+    primary_before = primary_app.state.request_count
+    secondary_before = secondary_app.state.request_count
+    response, latency = await timed_chat(manager, route)
+    primary = primary_app.state.request_count - primary_before
+    secondary = secondary_app.state.request_count - secondary_before
+    state = get_breaker("moonshot").state
+    print(f"[{name}] 提供商: {response['provider']}  耗时: {latency:.3f}s  "
+          f"请求数 主/备: {primary}/{secondary}  主提供商熔断: {state}")
+
+    check(response["provider"] == provider, f"{name}: 应由{provider}返回，实际为{response['provider']}")
+    check(f"[{provider}]" in response["content"], f"{name}: 响应内容不是来自{provider}: {response['content']}")
+    check(primary == primary_requests, f"{name}: 主提供商应收到{primary_requests}个请求，实际{primary}")
+    check(secondary == secondary_requests, f"{name}: 备用提供商应收到{secondary_requests}个请求，实际{secondary}")
+    check(latency <= max_latency, f"{name}: 耗时{latency:.3f}s超过上限{max_latency}s")
+    check(state == breaker, f"{name}: 主提供商熔断器应为{breaker}，实际为{state}")
+    return {"provider": response["provider"], "latency": latency, "primary": primary, "secondary": secondary}
+
+
+async def run_scenarios(primary_app, secondary_app):
+    manager = AIClientManager()
+    try:
+        # 预热：建立健康度基线（主提供商约100ms），全部由主提供商返回
+        primary_app.state.delay = 0.1
+        for _ in range(10):
+            await scenario("预热", manager, "bench-failover", primary_app, secondary_app,
+                           "moonshot", 1, 0, max_latency=1.0)
+
+        # 503：主提供商失败一次，切换到备用提供商；单次失败不会打开熔断
+        primary_app.state.status_code = 503
+        await scenario("503故障转移", manager, "bench-failover", primary_app, secondary_app,
+                       "dashscope", 1, 1, max_latency=5.0)
+        primary_app.state.status_code = 200
+
+        # 主提供商延迟3s：对冲请求在p95阈值（约0.2s）后发出，备用提供商先返回
+        primary_app.state.delay = 3.0
+        await scenario("对冲请求", manager, "bench-hedge", primary_app, secondary_app,
+                       "dashscope", 1, 1, max_latency=1.5)
+
+        # 单次超时1s：主提供商超时后切换，总耗时约 1s + 备用提供商延迟
+        await scenario("超时转移", manager, "bench-timeout", primary_app, secondary_app,
+                       "dashscope", 1, 1, max_latency=2.0)
+
+        # 主提供商持续503：连续失败达到阈值后熔断打开，之后的请求直接发往备用提供商
+        primary_app.state.delay = 0.0
+        primary_app.state.status_code = 503
+        breaker = get_breaker("moonshot")
+        while breaker.state == "closed":
+            await timed_chat(manager, "bench-failover")
+        await scenario("熔断打开", manager, "bench-failover", primary_app, secondary_app,
+                       "dashscope", 0, 1, max_latency=1.0, breaker="open")
+
+        health = manager.router.stats()
+        print(f"提供商健康度: {health}")
+        check(health["dashscope"]["error_rate"] == 0, "备用提供商不应有失败记录")
+        print("全部场景通过")
+    finally:
+        await manager.aclose()
+
+
+def main():
+    primary_app = create_mock_app(delay=0.1, name="moonshot")
+    secondary_app = create_mock_app(delay=0.2, name="dashscope")
+
+    with serve_in_thread(primary_app) as primary_url, serve_in_thread(secondary_app) as secondary_url:
+        config = get_config()
+        # 基准测试的调用不写入用量账本（data/usage），避免混入真实用量
+        config.usage.enabled = False
+        config.ai.moonshot.base_url = primary_url
+        config.ai.dashscope.base_url = secondary_url
+        config.routing["bench-failover"] = RouteConfig(providers=["moonshot", "dashscope"], timeout=10)
+        config.routing["bench-hedge"] = RouteConfig(
+            providers=["moonshot", "dashscope"], timeout=10, hedge=True, hedge_min_delay=0.2, hedge_max_delay=2.0
+        )
+        config.routing["bench-timeout"] = RouteConfig(providers=["moonshot", "dashscope"], timeout=1.0)
+
+        asyncio.run(run_scenarios(primary_app, secondary_app))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+
+1. 导入耗时：用 python -X importtime 导入 main 模块，按累计耗时列出最慢的模块
+2. 首次可用耗时：启动 uvicorn 子进程，统计从进程启动到 /health 首次返回200的墙钟时间
+
+结果可以保存为JSON，并与之前保存的基线比较，便于发现启动耗时回退。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.bench_startup --runs 3 --save startup.json
+    python -m benchmarks.bench_startup --compare startup.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import_time(module: str = "main") -> Dict[str, float]:
+    """导入指定模块，解析 -X importtime 输出，返回 {模块名: 累计耗时(秒)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"导入 {module} 失败:\n{result.stderr[-2000:]}")
+
+    cumulative: Dict[str, float] = {}
+    for line in result.stderr.splitlines():
+        # 格式: import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, _, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+        cumulative[name.strip()] = int(cumulative_us) / 1e6
+    return cumulative
+
+
+def measure_time_to_health(timeout: float = 60.0) -> float:
+    """启动uvicorn子进程，返回到 /health 首次返回200的耗时（秒）"""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/health"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env={**os.environ, "PYTHONUNBUFFERED": "1"}
+    )
+
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"服务启动失败:\n{process.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            time.sleep(0.02)
+        raise TimeoutError(f"{timeout}秒内 /health 未返回200")
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def run_benchmark(runs: int, top: int) -> dict:
+    import_runs: List[Dict[str, float]] = [measure_import_time() for _ in range(runs)]
+    health_runs = [measure_time_to_health() for _ in range(runs)]
+
+    # 各模块取多次运行的中位数
+    names = set().union(*import_runs)
+    modules = {
+        name: statistics.median(run.get(name, 0.0) for run in import_runs)
+        for name in names
+    }
+    slowest = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:top]
+
+    return {
+        "python": sys.version.split()[0],
+        "runs": runs,
+        "import_main": modules.get("main", 0.0),
+        "time_to_health": statistics.median(health_runs),
+        "time_to_health_runs": health_runs,
+        "slowest_imports": dict(slowest)
+    }
+
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    def delta(key: str) -> str:
+        if not baseline or key not in baseline:
+            return ""
+        diff = report[key] - baseline[key]
+        return f"  ({'+' if diff >= 0 else ''}{diff * 1000:.0f}ms 相对基线)"
+
+    print(f"Python {report['python']}，运行 {report['runs']} 次取中位数")
+    print(f"导入 main 耗时:       {report['import_main'] * 1000:.0f}ms{delta('import_main')}")
+    print(f"首次 /health 200 耗时: {report['time_to_health'] * 1000:.0f}ms{delta('time_to_health')}")
+    print("最慢的导入（累计耗时）:")
+    baseline_imports = (baseline or {}).get("slowest_imports", {})
+    for name, seconds in report["slowest_imports"].items():
+        previous = baseline_imports.get(name)
+        suffix = f"  (基线 {previous * 1000:.0f}ms)" if previous is not None else ""
+        print(f"  {seconds * 1000:8.1f}ms  {name}{suffix}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=3, help="重复次数，结果取中位数")
+    parser.add_argument("--top", type=int, default=20, help="列出最慢的导入模块数")
+    parser.add_argument("--save", help="将结果保存为JSON文件")
+    parser.add_argument("--compare", help="与之前保存的JSON结果比较")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.runs, args.top)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到 {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+AI Agent Floating Ball - Mock OpenAI-compatible Server
+本地模拟的OpenAI兼容服务，可注入延迟，用于离线基准测试
+"""
+
+import asyncio
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+def create_mock_app(delay: float = 0.5, name: str = "mock", status_code: int = 200) -> FastAPI:
+    """
+    创建模拟服务
+
+    - **delay**: 每个请求的固定延迟（秒），可通过 app.state.delay 在运行时修改
+    - **name**: 服务名称，会出现在返回内容中，便于区分多个模拟服务
+    - **status_code**: 非200时直接返回该错误码（模拟5xx故障），可通过 app.state.status_code 修改
+    """
+    app = FastAPI(title=f"Mock OpenAI ({name})")
+    app.state.delay = delay
+    app.state.status_code = status_code
+    app.state.request_count = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.request_count += 1
+        await asyncio.sleep(app.state.delay)
+
+        if app.state.status_code != 200:
+            return JSONResponse(
+                status_code=app.state.status_code,
+                content={"error": {"message": f"[{name}] injected failure", "type": "server_error"}}
+            )
+
+        return {
+            "id": f"chatcmpl-{name}-{app.state.request_count}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock-model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"[{name}] ok"},
+                    "finish_reason": "stop"
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12}
+        }
+
+    return app
+
+
+def create_scripted_app(script: List[Dict[str, Any]], speed: float = 1.0, name: str = "replay") -> FastAPI:
+    """
+    创建按脚本依次返回录制响应的模拟服务，用于回放录制的智能体对话
+
+    - **script**: [{"response": chat.completion响应, "seconds": 录制时的耗时}, ...]，按请求顺序依次返回
+    - **speed**: 延迟倍率，1.0按录制时的耗时等待，0不等待；可通过 app.state.speed 修改
+    - **name**: 服务名称
+
+    请求数超过脚本长度时返回500；收到的请求体保存在 app.state.requests，
+    重新回放前把 app.state.cursor 置0并清空 app.state.requests
+    """
+    app = FastAPI(title=f"Mock OpenAI ({name})")
+    app.state.speed = speed
+    app.state.cursor = 0
+    app.state.requests = []
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests.append(body)
+        index = app.state.cursor
+        app.state.cursor += 1
+
+        if index >= len(script):
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": f"[{name}] 脚本已用完（共{len(script)}个响应）", "type": "server_error"}}
+            )
+
+        turn = script[index]
+        await asyncio.sleep(turn.get("seconds", 0.0) * app.state.speed)
+        return turn["response"]
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_in_thread(app: FastAPI, port: Optional[int] = None):
+    """在后台线程中运行模拟服务，返回其 base_url"""
+    port = port or _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
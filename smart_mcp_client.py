@@ -23,13 +23,17 @@ sys.path.insert(0, str(backend_path))
 
 try:
     from openai import OpenAI
-    from fastmcp import Client
+    from app.core.mcp_session import MCPSession
 except ImportError as e:
     print(f"❌ 缺少必要的依赖包: {e}")
     print("请安装: pip install openai fastmcp")
     sys.exit(1)
 
 
+# 单个工具调用的超时（秒）
+TOOL_CALL_TIMEOUT = 60.0
+
+
 def load_config(config_path: str = "backend/config.json") -> dict:
     """从配置文件加载配置"""
     try:
@@ -74,7 +78,7 @@ class SmartMCPClient:
         # 初始化MCP客户端 - 尝试添加/mcp路径前缀
         mcp_url = f"{mcp_server_url}/mcp" if not mcp_server_url.endswith("/mcp") else mcp_server_url
         print(f"🔗 连接到MCP服务器: {mcp_url}")
-        self.mcp_client = Client(mcp_url)
+        self.mcp_session = MCPSession(mcp_url)
         self.tools = []
         self.model = model  # 使用配置文件中的模型
 
@@ -82,19 +86,9 @@ class SmartMCPClient:
         """初始化MCP客户端，获取可用工具列表"""
         try:
             print("🔗 连接到MCP服务器...")
-            async with self.mcp_client:
-                tools = await self.mcp_client.list_tools()
-                self.tools = [
-                    {
-                        "type": "function",
-                        "function": {
-                            "name": tool.name,
-                            "description": tool.description,
-                            "parameters": tool.inputSchema
-                        }
-                    }
-                    for tool in tools
-                ]
+            # 建立长连接，后续指令复用同一个会话
+            await self.mcp_session.connect(retries=3)
+            self.tools = await self.mcp_session.list_tools()
             print(f"✅ 成功连接，获取到 {len(self.tools)} 个工具")
             return True
         except Exception as e:
@@ -145,6 +139,9 @@ class SmartMCPClient:
 
 请用简洁的语言回答用户的问题。"""
 
+            # 工具目录已缓存，只有服务端通知变化或重连后才会重新拉取
+            self.tools = await self.mcp_session.list_tools()
+
             # 构建消息
             messages = [
                 {"role": "system", "content": system_prompt},
@@ -178,42 +175,46 @@ class SmartMCPClient:
             print(error_msg)
             return error_msg
 
-    async def execute_tool_calls(self, tool_calls) -> str:
-        """执行工具调用"""
-        results = []
-
-        async with self.mcp_client:
-            for tool_call in tool_calls:
-                tool_name = tool_call.function.name
-                tool_args = json.loads(tool_call.function.arguments)
+    async def execute_tool_call(self, tool_call) -> str:
+        """执行单个工具调用，返回结果文本"""
+        tool_name = tool_call.function.name
 
-                print(f"🔧 执行工具: {tool_name}")
-                print(f"📝 参数: {tool_args}")
+        try:
+            tool_args = json.loads(tool_call.function.arguments or "{}")
+            print(f"🔧 执行工具: {tool_name}")
+            print(f"📝 参数: {tool_args}")
 
-                try:
-                    start_time = time.time()
+            start_time = time.time()
 
-                    # 调用工具
-                    result = await self.mcp_client.call_tool(tool_name, tool_args)
+            # 调用工具
+            result = await asyncio.wait_for(
+                self.mcp_session.call_tool(tool_name, tool_args, timeout=TOOL_CALL_TIMEOUT),
+                timeout=TOOL_CALL_TIMEOUT
+            )
 
-                    end_time = time.time()
-                    duration = end_time - start_time
+            end_time = time.time()
+            duration = end_time - start_time
 
-                    print(f"⏱️ 工具执行耗时: {duration:.2f}秒")
+            print(f"⏱️ 工具 {tool_name} 执行耗时: {duration:.2f}秒")
 
-                    # 提取工具结果
-                    if result.content and len(result.content) > 0:
-                        tool_result = result.content[0].text if hasattr(result.content[0], 'text') else str(result.content[0])
-                    else:
-                        tool_result = "工具执行完成"
+            # 提取工具结果
+            if result.content and len(result.content) > 0:
+                tool_result = result.content[0].text if hasattr(result.content[0], 'text') else str(result.content[0])
+            else:
+                tool_result = "工具执行完成"
 
-                    results.append(f"工具 {tool_name} 执行结果:\n{tool_result}")
+            return f"工具 {tool_name} 执行结果:\n{tool_result}"
 
-                except Exception as e:
-                    error_msg = f"工具 {tool_name} 执行失败: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    results.append(error_msg)
+        except asyncio.TimeoutError:
+            error_msg = f"工具 {tool_name} 执行超时（{TOOL_CALL_TIMEOUT:.0f}秒）"
+        except Exception as e:
+            error_msg = f"工具 {tool_name} 执行失败: {str(e)}"
+        print(f"❌ {error_msg}")
+        return error_msg
 
+    async def execute_tool_calls(self, tool_calls) -> str:
+        """并发执行同一次回复中的全部工具调用，结果按调用顺序返回"""
+        results = await asyncio.gather(*(self.execute_tool_call(tool_call) for tool_call in tool_calls))
         return "\n\n".join(results)
 
     def show_help(self):
@@ -250,7 +251,8 @@ class SmartMCPClient:
         while True:
             try:
                 # 获取用户输入
-                user_input = input("\n🎯 请输入指令 > ").strip()
+                # 在线程中等待输入，等待期间MCP会话的心跳照常进行
+                user_input = (await asyncio.to_thread(input, "\n🎯 请输入指令 > ")).strip()
 
                 if not user_input:
                     continue
@@ -279,6 +281,8 @@ class SmartMCPClient:
                 print(f"❌ 发生错误: {str(e)}")
                 print("💡 请检查网络连接和API密钥配置")
 
+        await self.mcp_session.close()
+
 
 async def main():
     """主函数"""